@@ -0,0 +1,106 @@
+import json
+import math
+import os
+import threading
+from collections import deque
+
+# Per-category timeout rules. A probe's deadline is `multiplier` x the p95
+# RTT seen so far (in this run for the category's pool, and in stored history
+# for the same target, whichever is larger), clamped to [floor, cap]. The cap
+# is the fixed timeout the probe used before, so adapting never waits longer.
+# The DNS floor covers a cold recursive lookup behind a warm LAN resolver: a
+# DNS failure skips every probe of that host. The NTP timeout bounds each
+# reply only; the sampling window that paces requests stays fixed.
+DEFAULT_RULES = {
+    "dns": {"pool": "dns", "multiplier": 5, "floor": 2, "cap": 3},
+    "tcp": {"pool": "connect", "multiplier": 5, "floor": 0.4, "cap": 8},
+    "quic": {"pool": "quic", "multiplier": 4, "floor": 0.5, "cap": 5},
+    "https": {"pool": "https", "multiplier": 3, "floor": 1.5, "cap": 5},
+    "ntp": {"pool": "ntp", "multiplier": 5, "floor": 0.5, "cap": 3},
+}
+
+MIN_SAMPLES = 3
+RUN_WINDOW = 200
+HISTORY_WINDOW = 20
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+class AdaptiveTimeoutPolicy:
+    """Derives probe timeouts from RTTs observed during the run and in stored history.
+
+    Call observe() with the latency of every passing probe and timeout_for()
+    just before starting a probe. With fewer than MIN_SAMPLES samples to go
+    on, the category's cap (the old fixed timeout) is used. Per-target RTT
+    samples are kept across runs in `path` (JSON) when given.
+    """
+
+    def __init__(self, rules=None, path=None):
+        self.rules = {k: dict(v) for k, v in DEFAULT_RULES.items()}
+        for k, v in (rules or {}).items():
+            if isinstance(v, dict):
+                self.rules.setdefault(k, {}).update(v)
+        self.path = path
+        self._run = {}
+        self._history = {}
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def _rule(self, category):
+        return self.rules.get(category) or {"pool": category, "multiplier": 5, "floor": 0.5, "cap": 5}
+
+    def observe(self, category, target, latency_ms):
+        if latency_ms is None:
+            return
+        try:
+            rtt = float(latency_ms) / 1000.0
+        except (TypeError, ValueError):
+            return
+        pool = self._rule(category)["pool"]
+        with self._lock:
+            self._run.setdefault(pool, deque(maxlen=RUN_WINDOW)).append(rtt)
+            self._history.setdefault(f"{category}:{target}", deque(maxlen=HISTORY_WINDOW)).append(rtt)
+
+    def timeout_for(self, category, target=None):
+        """Timeout in seconds for the next probe of `category` to `target`."""
+        rule = self._rule(category)
+        with self._lock:
+            run = list(self._run.get(rule["pool"], ()))
+            hist = list(self._history.get(f"{category}:{target}", ())) if target else []
+        bases = [percentile(s, 95) for s in (run, hist) if len(s) >= MIN_SAMPLES]
+        if not bases:
+            return float(rule["cap"])
+        t = rule["multiplier"] * max(bases)
+        return round(min(max(t, rule["floor"]), rule["cap"]), 3)
+
+    def load(self):
+        try:
+            if self.path and os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                with self._lock:
+                    for k, samples in (data or {}).items():
+                        self._history[k] = deque([float(x) for x in samples][-HISTORY_WINDOW:], maxlen=HISTORY_WINDOW)
+        except Exception as e:
+            print(f"Failed to load RTT history: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with self._lock:
+                data = {k: [round(x, 4) for x in v] for k, v in self._history.items()}
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Failed to save RTT history: {e}")
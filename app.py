@@ -1,14 +1,25 @@
 import os, time, json, threading, queue, socket
+import glob
+import re
 import sys
 import uuid
 from functools import wraps
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, render_template, jsonify, request, send_file, Response, stream_with_context
 import socket
 import copy
+from concurrent.futures import ThreadPoolExecutor
 from network_tests import StepRunner
+from job_manager import JobManager
 from report_export import export_csv, export_json, export_pdf
 from excel_config_parser import get_enhanced_targets
-from databricks_integration import create_databricks_client
+from databricks_integration import create_databricks_client, get_poller
+import dns_cache
+from adaptive_timeouts import AdaptiveTimeoutPolicy
+from dns_client import PUBLIC_RESOLVERS
+from outbox import Outbox
+from history_store import HistoryStore
+from run_archive import RunArchive
+from history_retention import HistoryRetention
 import psutil
 import subprocess
 import requests
@@ -18,10 +29,24 @@ TEMPLATES = os.path.join(APP_ROOT, "templates")
 STATIC = os.path.join(APP_ROOT, "static")
 EXPORTS = os.path.join(APP_ROOT, "exports")
 HISTORY_DIR = os.path.join(APP_ROOT, "test_history")
+DNS_CACHE_FILE = os.path.join(APP_ROOT, "dns_cache.json")
+RTT_HISTORY_FILE = os.path.join(APP_ROOT, "rtt_history.json")
+OUTBOX_FILE = os.path.join(APP_ROOT, "outbox.jsonl")
+HISTORY_DB = os.path.join(HISTORY_DIR, "history.db")
+HISTORY_ARCHIVE_DIR = os.path.join(HISTORY_DIR, "archive")
 
 app = Flask(__name__, template_folder=TEMPLATES, static_folder=STATIC)
-_jobs = {}
+_jobs = JobManager(lambda jid: _run_job(jid))
 _lock = threading.Lock()
+# History, exports and pushes after each run (see _post_run_sinks); one worker per sink kind
+POST_RUN_SINKS = ('history', 'export', 'databricks', 'databricks_probes', 'cloud', 'webhook')
+# Sinks that consume another sink's output, started once that output exists
+POST_RUN_AFTER = {'cloud': 'export'}
+_post_run_pool = ThreadPoolExecutor(max_workers=len(POST_RUN_SINKS), thread_name_prefix="post-run")
+# Durable queue for cloud/webhook/Databricks deliveries (config read at send time)
+_outbox = Outbox(OUTBOX_FILE, config_loader=lambda: load_config())
+# Manual Databricks pushes in flight or recently finished, by push id
+_databricks_pushes = {}
 
 _DEVICE_ID = None
 _DEVICE_MAC = None
@@ -316,6 +341,8 @@ def api_access():
 # Ensure history directory exists
 if not os.path.exists(HISTORY_DIR):
     os.makedirs(HISTORY_DIR)
+_history = HistoryStore(HISTORY_DB, archive=RunArchive(HISTORY_ARCHIVE_DIR))
+_retention = HistoryRetention(_history, HISTORY_DIR, config_loader=lambda: load_config())
 
 DEFAULT_TARGETS = {
   "dns": [
@@ -393,6 +420,11 @@ DEFAULT_TARGETS = {
     {"host":"35.164.30.49","port":443,"label":"Livestream QUIC IP 5"},
     {"host":"52.32.44.190","port":443,"label":"Livestream QUIC IP 6"}
   ],
+  "udp_ranges": [
+    # Rule 9: Dock to livestreaming WebRTC, Rule 4: client to livestreaming WebRTC
+    {"host":"34.208.18.168","port_start":40000,"port_end":41000,"label":"Dock WebRTC UDP Range"},
+    {"host":"34.208.18.168","port_start":50000,"port_end":60000,"label":"Client WebRTC UDP Range"}
+  ],
   "https": [
     # Full HTTPS validation (TLS + HTTP) - matches Dock's connection pattern
     {"url":"https://cloud.skydio.com","label":"Skydio Cloud HTTPS"},
@@ -713,12 +745,55 @@ def _tls_probe(host='cloud.skydio.com', port=443, timeout=5):
         return {'suspected': True, 'details': [{'label': 'TLS probe error', 'value': str(e)}]}
 
 
+def _dhcp_ntp_servers(iface=None):
+    """NTP servers handed out by DHCP, as recorded by whichever client manages the interface."""
+    servers = []
+    if not sys.platform.startswith('linux'):
+        return servers
+
+    def _read(path):
+        try:
+            with open(path, 'r') as f:
+                return f.read()
+        except Exception:
+            return ''
+
+    # systemd-networkd
+    for path in sorted(glob.glob('/run/systemd/netif/leases/*')):
+        for line in _read(path).splitlines():
+            if line.startswith('NTP='):
+                servers += line[4:].split()
+    # ISC dhclient: the last lease in the file is the current one
+    for path in sorted(glob.glob('/var/lib/dhcp/dhclient*.lease*') + glob.glob('/var/lib/dhclient/*.lease*')):
+        found = re.findall(r'option ntp-servers ([^;]+);', _read(path))
+        if found:
+            servers += [s.strip() for s in found[-1].split(',')]
+    # chrony / ntpd DHCP hooks (dhcpcd, NetworkManager dispatcher)
+    for path in sorted(glob.glob('/run/chrony-dhcp/*.sources')) + ['/run/ntp.conf.dhcp', '/var/lib/ntp/ntp.conf.dhcp']:
+        for line in _read(path).splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] in ('server', 'pool'):
+                servers.append(parts[1])
+    # NetworkManager
+    if iface:
+        try:
+            r = subprocess.run(['nmcli', '-t', '-f', 'DHCP4', 'device', 'show', iface],
+                               capture_output=True, text=True, timeout=3)
+            for line in r.stdout.splitlines():
+                if 'ntp_servers' in line and '=' in line:
+                    servers += line.split('=', 1)[1].split()
+        except Exception:
+            pass
+    return list(dict.fromkeys(s for s in servers if s))
+
+
 def _network_snapshot():
     snap = {
         'gateway': None,
         'dns_servers': [],
         'active_interface': None,
         'connection_type': None,
+        'ntp_servers': [],
     }
 
     try:
@@ -748,6 +823,8 @@ def _network_snapshot():
     except Exception:
         snap['dns_servers'] = []
 
+    snap['ntp_servers'] = _dhcp_ntp_servers(snap.get('active_interface'))
+
     iface = snap.get('active_interface')
     if iface:
         if iface.startswith('wl') or iface == 'wlan0':
@@ -775,7 +852,7 @@ def _collect_outbound_targets():
                             if item not in existing:
                                 targets[k].append(item)
                                 existing.add(item)
-                    elif k in ('tcp', 'quic', 'https') and isinstance(v, list):
+                    elif k in ('tcp', 'quic', 'udp_ranges', 'https') and isinstance(v, list):
                         targets[k].extend([x for x in v if isinstance(x, dict)])
                     elif k == 'ntp' and isinstance(v, str) and v.strip():
                         targets[k] = v.strip()
@@ -798,6 +875,10 @@ def _collect_outbound_targets():
             host = q.get('host'); port = q.get('port', 443)
             if host:
                 out.add(f"udp://{host}:{port}")
+        for u in targets.get('udp_ranges', []):
+            host = u.get('host')
+            if host:
+                out.add(f"udp://{host}:{u.get('port_start')}-{u.get('port_end')}")
         for h in targets.get('https', []):
             url = h.get('url')
             if url:
@@ -858,7 +939,7 @@ def _run_job(jid):
                         if item not in existing:
                             targets[k].append(item)
                             existing.add(item)
-                elif k in ("tcp", "quic", "https") and isinstance(v, list):
+                elif k in ("tcp", "quic", "udp_ranges", "https") and isinstance(v, list):
                     def _sig(item):
                         if not isinstance(item, dict):
                             return ("_invalid", str(item))
@@ -875,18 +956,45 @@ def _run_job(jid):
     except Exception:
         pass
     
-    runner = StepRunner(targets)
-    total = runner.steps
+    config = load_config()
+    if config.get('dns_cache_persist', False) and dns_cache.get_cache().path != DNS_CACHE_FILE:
+        dns_cache.configure(path=DNS_CACHE_FILE)
 
     proxy = _proxy_info()
     tls = _tls_probe()
     snapshot = _network_snapshot()
 
+    # Compare the DHCP/system resolvers against well-known public ones
+    if config.get('dns_resolver_compare', True):
+        targets["dns_system_resolvers"] = list(snapshot.get('dns_servers') or [])
+        targets["dns_resolvers"] = list(dict.fromkeys(targets["dns_system_resolvers"] + PUBLIC_RESOLVERS))
+
+    # Sample the configured and DHCP-provided NTP servers alongside the main one
+    targets["ntp_servers"] = list(dict.fromkeys((config.get('ntp_servers') or []) + (snapshot.get('ntp_servers') or [])))
+
+    targets["gateway"] = snapshot.get('gateway')
+    timeout_policy = False
+    if config.get('adaptive_timeouts', True):
+        timeout_policy = AdaptiveTimeoutPolicy(rules=config.get('adaptive_timeout_rules'), path=RTT_HISTORY_FILE)
+    cancel = _jobs.get(jid)["cancel"]
+    runner = StepRunner(
+        targets,
+        concurrency=config.get('probe_concurrency'),
+        max_concurrency=config.get('probe_max_concurrency'),
+        timeout_policy=timeout_policy,
+        cancel=cancel,
+        ping_options=config.get('ping_options'),
+    )
+    total = runner.steps
+
     results = {
+        "gateway": None,
         "dns": [],
+        "dns_resolvers": None,
         "tcp": [],
         "https": [],
         "quic": [],
+        "udp_range": [],
         "ping": [],
         "ntp": None,
         "speedtest": None,
@@ -904,71 +1012,197 @@ def _run_job(jid):
     }
     done = 0
     for t, r in runner.run():
-        if t=="dns": results["dns"].append(r)
+        if t=="gateway": results["gateway"]=r
+        elif t=="dns": results["dns"].append(r)
+        elif t=="dns_resolvers": results["dns_resolvers"]=r
         elif t=="tcp": results["tcp"].append(r)
         elif t=="https": results["https"].append(r)
         elif t=="quic": results["quic"].append(r)
+        elif t=="udp_range": results["udp_range"].append(r)
         elif t=="ping": results["ping"].append(r)
         elif t=="ntp": results["ntp"]=r
         elif t=="speedtest": results["speedtest"]=r
         done += 1
-        with _lock:
-            _jobs[jid]["progress"] = int(done*100/max(total,1))
-            _jobs[jid]["results"] = results
+        progress = int(done*100/max(total,1))
+        _jobs.update(jid, progress=progress, results=results)
+        _jobs.publish(jid, "result", {"category": t, "result": r})
+        _jobs.publish(jid, "progress", {"progress": progress, "completed": done, "total": total})
+    dns_cache.get_cache().save()
+    if timeout_policy:
+        timeout_policy.save()
+    if cancel.cancelled:
+        # Keep whatever finished, flagged so history/exports don't read it as a full run
+        results["_meta"]["partial"] = True
+        results["_meta"]["cancelled"] = cancel.reason
+    _jobs.update(jid, done=True, cancelled=cancel.reason if cancel.cancelled else None)
+    # Store results globally for export/databricks push
+    global test_results
     with _lock:
-        _jobs[jid]["done"] = True
-        # Store results globally for export/databricks push
-        global test_results
         test_results = results
-        
-        # Save to test history
-        try:
-            save_test_history(results)
-        except Exception as e:
-            print(f"Failed to save test history: {e}")
-        
-        # Auto-push to Databricks if configured
-        try:
-            config = load_config()
-            if config.get('databricks', {}).get('enabled', False) and config.get('databricks', {}).get('auto_push', False):
-                push_to_databricks(results, config['databricks'])
-        except Exception as e:
-            print(f"Auto Databricks push failed: {e}")
+    _post_run(jid, results)
+
+
+def _auto_export(results):
+    config = load_config()
+    fmt = (config.get('auto_export_format') or 'pdf').lower()
+    ts = int(time.time())
+    if fmt == 'csv':
+        path = export_csv(results, EXPORTS, ts)
+    elif fmt == 'json':
+        path = export_json(results, EXPORTS, ts)
+    else:
+        path = export_pdf(results, EXPORTS, ts)
+    return {'success': True, 'file': os.path.basename(path)}
+
+
+def _post_run_sinks(config):
+    """Post-run steps enabled by config, as name -> callable(results, outputs)."""
+    sinks = {'history': lambda results, outputs: save_test_history(results)}
+    if config.get('auto_export_enabled', False):
+        sinks['export'] = lambda results, outputs: _auto_export(results)
+    if config.get('databricks', {}).get('enabled', False) and config.get('databricks', {}).get('auto_push', False):
+        sinks['databricks'] = lambda results, outputs: push_to_databricks(results, config['databricks'])
+        if config['databricks'].get('probe_table') and config['databricks'].get('volume_path'):
+            sinks['databricks_probes'] = lambda results, outputs: _queue_probe_rows(results)
+    if config.get('cloud_push', {}).get('enabled', False) and 'export' in sinks:
+        # Cloud pushes accompany an export file, as they do for manual exports
+        def _cloud(results, outputs):
+            exported = outputs['export'].result() or {}
+            if not exported.get('success'):
+                return {'success': False, 'error': 'export failed'}
+            return push_to_cloud(results, exported['file'], config['cloud_push'])
+        sinks['cloud'] = _cloud
+    if config.get('webhook_enabled', False) and (config.get('webhook_url') or '').strip():
+        sinks['webhook'] = lambda results, outputs: send_webhook(results, config)
+    return sinks
+
+
+def _queue_probe_rows(results):
+    """Queue a run for the long-format per-probe Databricks table"""
+    meta = results.get('_meta') or {}
+    if not meta.get('timestamp'):
+        # Pin the run time so batched/retried loads keep it
+        results = dict(results, _meta=dict(meta, timestamp=time.time()))
+    return {'success': True, 'queued': _outbox.enqueue('databricks_probes', results)}
+
+
+def _post_run(jid, results):
+    """Run history, exports and pushes in parallel, outside any lock.
+
+    Each sink reports its own status on the job under "sinks"
+    (pending/running/ok/queued/failed with the error and duration);
+    network sinks only enqueue into the outbox, which delivers them.
+    """
+    global test_results
+    sinks = _post_run_sinks(load_config())
+    status = {name: {'status': 'pending'} for name in sinks}
+    _jobs.update(jid, sinks=status)
 
-        # Auto-export if configured
+    def _set(name, **fields):
+        status[name] = dict(status[name], **fields)
+        _jobs.update(jid, sinks=dict(status))
+
+    def _run_sink(name, fn):
+        _set(name, status='running')
+        t0 = time.time()
         try:
-            config = load_config()
-            if config.get('auto_export_enabled', False):
-                fmt = (config.get('auto_export_format') or 'pdf').lower()
-                ts = int(time.time())
-                outdir = EXPORTS
-                if fmt == 'csv':
-                    path = export_csv(results, outdir, ts)
-                elif fmt == 'json':
-                    path = export_json(results, outdir, ts)
-                else:
-                    path = export_pdf(results, outdir, ts)
-                results.setdefault('_meta', {})
-                results['_meta']['auto_export_file'] = os.path.basename(path)
+            out = fn(results, outputs)
+            ok = not isinstance(out, dict) or out.get('success', True)
+            queued = out.get('queued') if isinstance(out, dict) else None
+            _set(name, status=('queued' if queued else 'ok') if ok else 'failed',
+                 error=None if ok else out.get('error'), outbox_id=queued,
+                 duration_ms=int((time.time() - t0) * 1000))
+            return out
         except Exception as e:
-            print(f"Auto export failed: {e}")
+            print(f"Post-run {name} failed: {e}")
+            _set(name, status='failed', error=str(e), duration_ms=int((time.time() - t0) * 1000))
+            return None
 
-        # Write back meta update
-        _jobs[jid]["results"] = results
+    def _start(name, fn):
+        outputs[name] = _post_run_pool.submit(_run_sink, name, fn)
+
+    outputs = {}
+    for name, fn in sinks.items():
+        needs = POST_RUN_AFTER.get(name)
+        if needs in outputs:
+            # From a done-callback, so the sink never holds a worker while waiting for its input
+            outputs[needs].add_done_callback(lambda _, name=name, fn=fn: _start(name, fn))
+        else:
+            _start(name, fn)
+
+    exported = outputs['export'].result() if 'export' in outputs else None
+    if exported and exported.get('file'):
+        # Publish a new dict rather than mutating one other threads may be serializing
+        updated = dict(results, _meta=dict(results.get('_meta') or {}, auto_export_file=exported['file']))
+        with _lock:
+            if test_results is results:
+                test_results = updated
+        _jobs.update(jid, results=updated)
 
 @app.post("/api/start")
 def start():
-    jid = f"job-{int(time.time())}"
-    with _lock:
-        _jobs[jid] = {"progress":0,"done":False,"results":None,"started": time.time()}
-    threading.Thread(target=_run_job, args=(jid,), daemon=True).start()
-    return jsonify({"job_id": jid})
+    data = request.get_json(silent=True) or {}
+    deadline = data.get('deadline_seconds', request.args.get('deadline_seconds'))
+    if deadline in (None, ''):
+        deadline = load_config().get('job_deadline_seconds')
+    try:
+        deadline = float(deadline) if deadline not in (None, '') else None
+        if deadline is not None and deadline <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'error': 'deadline_seconds must be a positive number'}), 400
+
+    # A start while a suite is already queued/running attaches to that job
+    # instead of launching a second suite (and speedtest) alongside it.
+    jid, attached = _jobs.start(deadline_seconds=deadline)
+    j = _jobs.get(jid) or {}
+    return jsonify({"job_id": jid, "attached": attached, "deadline_seconds": j.get("deadline_seconds")})
+
+@app.post("/api/jobs/<jid>/cancel")
+def cancel_job(jid):
+    outcome = _jobs.cancel(jid)
+    if outcome == "not_found":
+        return jsonify({'error': 'Job not found'}), 404
+    if outcome == "finished":
+        return jsonify({'error': 'Job already finished', 'job_id': jid}), 409
+    return jsonify({'success': True, 'job_id': jid})
+
+@app.get("/api/jobs/<jid>/events")
+def job_events(jid):
+    """Server-Sent Events: each probe result, progress tick and the final
+    summary, once each. Reconnecting clients resume after Last-Event-ID."""
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        cursor = int(cursor)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+    if _jobs.get(jid) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def _stream(cursor):
+        yield "retry: 2000\n\n"
+        while True:
+            events, finished = _jobs.events_since(jid, cursor, timeout=15)
+            if events is None:
+                return
+            for eid, payload in events:
+                cursor = eid
+                yield payload
+            if finished:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(_stream(cursor)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.get("/api/status/<jid>")
 def status(jid):
-    with _lock:
-        j=_jobs.get(jid,{})
-    return jsonify({"progress": j.get("progress",0), "done": j.get("done", False), "results": j.get("results")})
+    j = _jobs.get(jid)
+    if j is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({"progress": j.get("progress",0), "done": j.get("done", False), "results": j.get("results"),
+                    "cancelled": j.get("cancelled"), "state": j.get("state"), "sinks": j.get("sinks")})
 
 @app.route('/api/export/<format>', methods=['GET','POST'])
 def export_results(format):
@@ -1483,16 +1717,10 @@ def dl(name):
     return send_file(os.path.join(EXPORTS, name), as_attachment=True)
 
 def push_to_cloud(results, filename, cloud_config):
-    """Push test results to cloud API endpoint"""
+    """Queue test results for the cloud API endpoint"""
     try:
-        import requests
-        import json
-        
-        url = cloud_config.get('api_url')
-        api_key = cloud_config.get('api_key')
-        
-        if not url:
-            return
+        if not cloud_config.get('api_url'):
+            return {'success': False, 'error': 'No API URL configured'}
             
         # Prepare payload
         payload = {
@@ -1502,19 +1730,32 @@ def push_to_cloud(results, filename, cloud_config):
             'filename': filename,
             'site_label': cloud_config.get('site_label', '')
         }
+        return {'success': True, 'queued': _outbox.enqueue('cloud', payload)}
         
-        headers = {'Content-Type': 'application/json'}
-        if api_key:
-            headers['Authorization'] = f'Bearer {api_key}'
-            
-        # Send to cloud
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        print(f"Successfully pushed results to cloud: {response.status_code}")
-        
     except Exception as e:
-        print(f"Failed to push to cloud: {e}")
+        print(f"Failed to queue cloud push: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+def send_webhook(results, config):
+    """Queue a finished run for the configured webhook URL"""
+    try:
+        meta = results.get('_meta', {})
+        payload = {
+            'device_name': meta.get('device_name'),
+            'public_ip': meta.get('public_ip'),
+            'timestamp': int(time.time()),
+            'results': results
+        }
+        return {'success': True, 'queued': _outbox.enqueue('webhook', payload)}
+    except Exception as e:
+        print(f"Failed to queue webhook: {e}")
+        return {'success': False, 'error': str(e)}
+
+@app.get("/api/outbox")
+def outbox_status():
+    """Queue depth, oldest-item age and per-sink delivery state"""
+    return jsonify(_outbox.stats())
 
 @app.post("/api/cloud/test")
 @local_only
@@ -1571,31 +1812,12 @@ def load_config():
     return {}
 
 def push_to_databricks(results, databricks_config):
-    """Push test results to Databricks"""
+    """Queue test results for Databricks"""
     try:
-        client = create_databricks_client({'databricks': databricks_config})
-        if not client:
-            print("Failed to create Databricks client")
-            return
-        
-        database = databricks_config.get('database', 'network_tests')
-        table = databricks_config.get('table', 'test_results')
-        
-        # Create table if it doesn't exist
-        table_result = client.create_table_if_not_exists(database, table)
-        if not table_result.get('success'):
-            print(f"Failed to create table: {table_result.get('error')}")
-            return
-        
-        # Insert results
-        insert_result = client.insert_test_results(database, table, results)
-        if insert_result.get('success'):
-            print(f"Successfully pushed results to Databricks: {insert_result.get('test_id')}")
-        else:
-            print(f"Failed to push to Databricks: {insert_result.get('error')}")
-            
+        return {'success': True, 'queued': _outbox.enqueue('databricks', results)}
     except Exception as e:
-        print(f"Databricks push failed: {e}")
+        print(f"Failed to queue Databricks push: {e}")
+        return {'success': False, 'error': str(e)}
 
 @app.route('/api/databricks/test', methods=['POST'])
 def test_databricks_connection():
@@ -1628,7 +1850,11 @@ def test_databricks_connection():
 
 @app.route('/api/databricks/push', methods=['POST'])
 def manual_databricks_push():
-    """Manually push latest test results to Databricks"""
+    """Manually push latest test results to Databricks.
+
+    The statements are submitted without waiting; the response is 202 with
+    a status_url to poll for the outcome.
+    """
     try:
         global test_results
         if not test_results:
@@ -1647,26 +1873,70 @@ def manual_databricks_push():
         database = databricks_config.get('database', 'network_tests')
         table = databricks_config.get('table', 'test_results')
         
-        # Create table if needed
-        table_result = client.create_table_if_not_exists(database, table)
-        if not table_result.get('success'):
-            return jsonify({'error': f'Failed to create table: {table_result.get("error")}'}), 500
-        
-        # Insert results
-        insert_result = client.insert_test_results(database, table, test_results)
+        # Creates the table first if this workspace hasn't seen it yet
+        future = client.insert_test_results_async(database, table, test_results)
+        push_id = uuid.uuid4().hex[:12]
+        with _lock:
+            _databricks_pushes[push_id] = {'future': future, 'test_id': future.test_id, 'created': time.time()}
+            while len(_databricks_pushes) > 50:
+                _databricks_pushes.pop(next(iter(_databricks_pushes)))
         
-        if insert_result.get('success'):
-            return jsonify({
-                'success': True,
-                'test_id': insert_result.get('test_id'),
-                'message': 'Results successfully pushed to Databricks'
-            })
-        else:
-            return jsonify({'error': insert_result.get('error')}), 500
+        return jsonify({
+            'success': True,
+            'pending': True,
+            'push_id': push_id,
+            'test_id': future.test_id,
+            'status_url': f'/api/databricks/push/{push_id}',
+            'message': 'Push submitted to Databricks'
+        }), 202
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.get('/api/databricks/push/<push_id>')
+def databricks_push_status(push_id):
+    """Outcome of a manual push: PENDING/RUNNING until the statements finish"""
+    with _lock:
+        push = _databricks_pushes.get(push_id)
+    if push is None:
+        return jsonify({'error': 'Push not found'}), 404
+    future = push['future']
+    body = {'push_id': push_id, 'test_id': push['test_id'], 'statement_id': future.statement_id}
+    if not future.done():
+        status = get_poller().status(future.statement_id) if future.statement_id else None
+        body.update(done=False, state=(status or {}).get('state', 'PENDING'))
+        return jsonify(body)
+    result = future.result()
+    body.update(done=True, success=bool(result.get('success')), state='SUCCEEDED' if result.get('success') else 'FAILED',
+                error=result.get('error'))
+    return jsonify(body)
+
+@app.route('/api/databricks/backfill', methods=['POST'])
+@local_only
+def databricks_backfill():
+    """Queue saved history runs for Databricks; the outbox writes them as multi-row batches"""
+    try:
+        config = load_config()
+        if not config.get('databricks', {}).get('enabled', False):
+            return jsonify({'error': 'Databricks integration not enabled'}), 400
+
+        data = request.get_json(silent=True) or {}
+        limit = int(data.get('limit', 100))
+
+        queued = 0
+        for entry in reversed(_history.list_runs(limit=limit)):
+            saved = _history.get_run(entry['timestamp'])
+            if saved is None:
+                continue
+            results = saved.get('results') or {}
+            results['_meta'] = dict(results.get('_meta') or {}, timestamp=saved.get('timestamp'))
+            if push_to_databricks(results, config['databricks']).get('success'):
+                queued += 1
+
+        return jsonify({'success': True, 'queued': queued, 'outbox': _outbox.stats()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/settings/databricks', methods=['POST'])
 def save_databricks_settings():
     """Save Databricks configuration settings"""
@@ -1680,8 +1950,9 @@ def save_databricks_settings():
             with open(config_file, 'r') as f:
                 existing_config = json.load(f)
         
-        # Update Databricks settings
-        existing_config['databricks'] = {
+        # Update Databricks settings; keys the form does not post (e.g. staging_format) are kept
+        databricks = existing_config.setdefault('databricks', {})
+        databricks.update({
             'enabled': config.get('enabled', False),
             'workspace_url': config.get('workspace_url', ''),
             'access_token': config.get('access_token', ''),
@@ -1689,7 +1960,13 @@ def save_databricks_settings():
             'database': config.get('database', 'network_tests'),
             'table': config.get('table', 'test_results'),
             'auto_push': config.get('auto_push', False)
-        }
+        })
+        for key in ('probe_table', 'volume_path'):
+            if key in config:
+                databricks[key] = (config.get(key) or '').strip()
+        for key in ('batch_size', 'probe_batch_size'):
+            if config.get(key) not in (None, ''):
+                databricks[key] = max(1, int(config[key]))
         
         # Save config
         with open(config_file, 'w') as f:
@@ -1703,50 +1980,14 @@ def save_databricks_settings():
 test_results = None
 
 def save_test_history(results):
-    """Save test results to history file"""
-    try:
-        timestamp = int(time.time())
-        history_entry = {
-            'timestamp': timestamp,
-            'datetime': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)),
-            'device_name': results.get('_meta', {}).get('device_name', 'unknown'),
-            'private_ip': results.get('_meta', {}).get('private_ip', 'unknown'),
-            'public_ip': results.get('_meta', {}).get('public_ip', 'unknown'),
-            'results': results
-        }
-        
-        # Save individual test file
-        filename = f"test_{timestamp}.json"
-        filepath = os.path.join(HISTORY_DIR, filename)
-        with open(filepath, 'w') as f:
-            json.dump(history_entry, f, indent=2)
-        
-        # Update history index
-        index_file = os.path.join(HISTORY_DIR, 'index.json')
-        history_index = []
-        if os.path.exists(index_file):
-            with open(index_file, 'r') as f:
-                history_index = json.load(f)
-        
-        # Add new entry to index
-        history_index.append({
-            'timestamp': timestamp,
-            'datetime': history_entry['datetime'],
-            'device_name': history_entry['device_name'],
-            'private_ip': history_entry['private_ip'],
-            'public_ip': history_entry['public_ip'],
-            'filename': filename,
-            'summary': get_test_summary(results)
-        })
-        
-        # Keep only last 100 tests
-        history_index = sorted(history_index, key=lambda x: x['timestamp'], reverse=True)[:100]
-        
-        with open(index_file, 'w') as f:
-            json.dump(history_index, f, indent=2)
+    """Save test results to the history store"""
+    try:
+        entry = _history.save_run(results, get_test_summary(results))
+        return {'success': True, 'timestamp': entry['timestamp']}
             
     except Exception as e:
         print(f"Error saving test history: {e}")
+        return {'success': False, 'error': str(e)}
 
 def get_test_summary(results):
     """Generate a summary of test results"""
@@ -1783,6 +2024,14 @@ def get_test_summary(results):
         elif test.get('status') == 'FAIL':
             summary['failed'] += 1
     
+    # Count UDP port range tests
+    for test in results.get('udp_range', []):
+        summary['total_tests'] += 1
+        if test.get('status') == 'PASS':
+            summary['passed'] += 1
+        elif test.get('status') == 'FAIL':
+            summary['failed'] += 1
+    
     # Count Ping tests
     for test in results.get('ping', []):
         summary['total_tests'] += 1
@@ -1811,59 +2060,114 @@ def get_test_summary(results):
     
     return summary
 
+def _history_time(value, end_of_day=False):
+    """Parse a history date filter: unix seconds or YYYY-MM-DD (local time)"""
+    if value in (None, ''):
+        return None
+    if value.isdigit():
+        return int(value)
+    day = time.mktime(time.strptime(value, '%Y-%m-%d'))
+    return int(day) + (86399 if end_of_day else 0)
+
+def _history_filters(args):
+    """History query-string filters as keyword arguments for the history store"""
+    return {
+        'status': args.get('status') or None,
+        'since': _history_time(args.get('from')),
+        'until': _history_time(args.get('to'), end_of_day=True),
+        'target': args.get('target') or None,
+        'site': args.get('site') or None,
+        'search': args.get('q') or None,
+    }
+
 @app.route('/api/history')
 def get_test_history():
-    """Get test history index"""
+    """Get one page of the test history index, newest first
+
+    Query parameters: limit, cursor (next_cursor from the previous page),
+    status (PASS/WARN/FAIL, comma-separated), from/to (YYYY-MM-DD or unix
+    seconds), target, site, q (device/IP/date search). The first page
+    (no cursor) also carries aggregate stats for the whole filtered set.
+    """
+    try:
+        filters = _history_filters(request.args)
+        cursor = request.args.get('cursor')
+        runs, next_cursor = _history.query_runs(
+            limit=request.args.get('limit', 50, type=int),
+            cursor=int(cursor) if cursor else None, **filters)
+        page = {'runs': runs, 'next_cursor': next_cursor}
+        if not cursor:
+            page['stats'] = _history.stats(**filters)
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/stats')
+def get_test_history_stats():
+    """Aggregate stats for the filtered history (same filters as /api/history)"""
     try:
-        index_file = os.path.join(HISTORY_DIR, 'index.json')
-        if os.path.exists(index_file):
-            with open(index_file, 'r') as f:
-                history = json.load(f)
-            return jsonify(history)
-        else:
-            return jsonify([])
+        stats = _history.stats(**_history_filters(request.args))
+        stats['sites'] = _history.sites()
+        return jsonify(stats)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/history/<timestamp>')
+@app.route('/api/history/trends')
+def get_test_history_trends():
+    """Per-target latency and pass-rate trends from the history rollups
+
+    Query parameters: target (host or label), category, bucket (hour/day),
+    from/to (YYYY-MM-DD or unix seconds; default the last 7 days of hourly
+    or 90 days of daily buckets), percentiles (comma-separated, default
+    50,90,99).
+    """
+    try:
+        bucket = request.args.get('bucket', 'hour')
+        since = _history_time(request.args.get('from'))
+        if since is None:
+            since = int(time.time()) - (7 if bucket == 'hour' else 90) * 86400
+        percentiles = [float(p) for p in request.args.get('percentiles', '50,90,99').split(',') if p.strip()]
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise ValueError('Percentiles must be between 0 and 100')
+        series = _history.trends(
+            target=request.args.get('target') or None,
+            category=request.args.get('category') or None,
+            bucket=bucket, since=since,
+            until=_history_time(request.args.get('to'), end_of_day=True),
+            quantiles=[p / 100 for p in percentiles])
+        return jsonify({'bucket': bucket, 'since': since, 'series': series})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/<int:timestamp>')
 def get_test_details(timestamp):
     """Get detailed test results for a specific timestamp"""
     try:
-        filename = f"test_{timestamp}.json"
-        filepath = os.path.join(HISTORY_DIR, filename)
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                test_data = json.load(f)
+        test_data = _history.get_run(timestamp)
+        if test_data is not None:
             return jsonify(test_data)
         else:
             return jsonify({'error': 'Test not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/history/<timestamp>', methods=['DELETE'])
+@app.route('/api/history/<int:timestamp>', methods=['DELETE'])
 @local_only
 def delete_test_history(timestamp):
     """Delete a test from history"""
     try:
-        filename = f"test_{timestamp}.json"
-        filepath = os.path.join(HISTORY_DIR, filename)
-        
-        # Delete the test file
+        _history.delete_run(timestamp)
+        # Old JSON copy, if the run predates the history store
+        filepath = os.path.join(HISTORY_DIR, f"test_{timestamp}.json")
         if os.path.exists(filepath):
             os.remove(filepath)
         
-        # Update index
-        index_file = os.path.join(HISTORY_DIR, 'index.json')
-        if os.path.exists(index_file):
-            with open(index_file, 'r') as f:
-                history_index = json.load(f)
-            
-            # Remove entry from index
-            history_index = [entry for entry in history_index if str(entry['timestamp']) != timestamp]
-            
-            with open(index_file, 'w') as f:
-                json.dump(history_index, f, indent=2)
-        
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1873,16 +2177,33 @@ def delete_test_history(timestamp):
 def clear_test_history():
     """Clear all test history"""
     try:
-        # Remove all test files
-        if os.path.exists(HISTORY_DIR):
-            import shutil
-            shutil.rmtree(HISTORY_DIR)
-            os.makedirs(HISTORY_DIR)
+        _history.clear()
+        # Remove migrated JSON files too
+        for name in os.listdir(HISTORY_DIR):
+            if name.endswith('.json'):
+                os.remove(os.path.join(HISTORY_DIR, name))
         
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/history/retention')
+def get_history_retention():
+    """Retention settings, disk usage and the last compaction report"""
+    try:
+        return jsonify(_retention.status())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/retention', methods=['POST'])
+@local_only
+def run_history_retention():
+    """Run a retention/compaction pass now"""
+    try:
+        return jsonify({'success': True, 'report': _retention.run_once()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/wifi/scan', methods=['GET'])
 @local_only
 def scan_wifi_networks():
@@ -2205,5 +2526,14 @@ def forget_wifi_network(network_name):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# One-time import of pre-SQLite JSON history (no-op once done)
+try:
+    _migrated = _history.migrate_json(HISTORY_DIR, get_test_summary)
+    if _migrated:
+        print(f"Migrated {_migrated} history runs into {HISTORY_DB}")
+except Exception as e:
+    print(f"History migration failed: {e}")
+_retention.start()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001, host="0.0.0.0")
@@ -15,6 +15,7 @@ from datetime import datetime
 import socket
 import netifaces
 from network_tests import StepRunner
+from outbox import Outbox
 import report_export as rex
 
 class AutoNetworkTester:
@@ -27,6 +28,9 @@ class AutoNetworkTester:
         self.max_tests = self.config.get("max_auto_tests", 3)
         self.test_interval = self.config.get("test_interval_seconds", 300)  # 5 minutes
         self.exports_dir = self.config.get("exports_dir", "./exports")
+        # Separate journal from the web app's so the two drainers never share items
+        self.outbox = Outbox(self.config.get("outbox_file", "outbox_auto_tester.jsonl"),
+                             config_loader=lambda: self.config)
         
     def load_config(self):
         """Load configuration from main config file"""
@@ -193,9 +197,8 @@ class AutoNetworkTester:
             return None
     
     def send_webhook(self, results):
-        """Send results to webhook URL"""
+        """Queue results for the webhook URL (delivered with retries by the outbox)"""
         try:
-            webhook_url = self.config['webhook_url']
             payload = {
                 'device_name': results['_meta']['device_name'],
                 'public_ip': results['_meta']['public_ip'],
@@ -204,14 +207,11 @@ class AutoNetworkTester:
                 'results': results
             }
             
-            response = requests.post(webhook_url, json=payload, timeout=10)
-            if response.status_code == 200:
-                print("Results sent to webhook successfully")
-            else:
-                print(f"Webhook failed with status: {response.status_code}")
+            self.outbox.enqueue('webhook', payload)
+            print("Results queued for webhook delivery")
                 
         except Exception as e:
-            print(f"Error sending webhook: {e}")
+            print(f"Error queueing webhook: {e}")
     
     def start(self):
         """Start the automatic network tester"""
@@ -306,6 +306,8 @@ def main():
         results = tester.run_network_test()
         if results:
             print("Test completed successfully")
+            if not tester.outbox.flush(timeout=30):
+                print(f"Outbox not fully delivered: {tester.outbox.stats()}")
         else:
             print("Test failed")
             sys.exit(1)
@@ -1,7 +1,178 @@
 import requests
 import json
 import time
-from typing import Dict, Any, Optional
+import threading
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, Any, Optional, List, Callable
+from requests.adapters import HTTPAdapter
+
+# Rows per INSERT statement for batched writes
+MAX_ROWS_PER_STATEMENT = 50
+
+# Shared across client instances (a client is created per push): one
+# keep-alive session per workspace, and the tables already known to exist.
+_sessions: Dict[str, requests.Session] = {}
+_known_tables = set()
+_state_lock = threading.Lock()
+
+
+def _session_for(workspace_url: str, headers: Dict[str, str]) -> requests.Session:
+    with _state_lock:
+        session = _sessions.get(workspace_url)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            _sessions[workspace_url] = session
+        session.headers.update(headers)
+        return session
+
+
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELED', 'CLOSED')
+
+
+def _statement_result(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a statement API response body to the integration's result dict"""
+    if body.get('status', {}).get('state') == 'SUCCEEDED':
+        return {
+            'success': True,
+            'statement_id': body.get('statement_id'),
+            'state': 'SUCCEEDED',
+            'result': body.get('result', {})
+        }
+    return {
+        'success': False,
+        'statement_id': body.get('statement_id'),
+        'state': body.get('status', {}).get('state'),
+        'error': f"Query failed: {body.get('status', {}).get('error', 'Unknown error')}"
+    }
+
+
+class StatementPoller:
+    """Background poller for statements submitted with wait_timeout=0s.
+
+    Each pending statement is polled with its own exponential backoff
+    (initial_delay growing by `factor` up to max_delay), so a warehouse
+    that takes a minute to start costs a dozen GETs rather than a blocked
+    thread. The last known state of recent statements is kept for status().
+    A statement still not finished after `max_age` seconds, or whose GET
+    failed `max_errors` times in a row, is given up on: its future resolves
+    to a failure carrying the statement_id and last known state.
+    """
+
+    def __init__(self, initial_delay: float = 0.5, max_delay: float = 10.0, factor: float = 1.6,
+                 keep_recent: int = 200, max_age: float = 3600.0, max_errors: int = 10):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.keep_recent = keep_recent
+        self.max_age = max_age
+        self.max_errors = max_errors
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def track(self, client: 'DatabricksIntegration', statement_id: str, future: Future,
+              state: Optional[str] = None) -> None:
+        with self._cond:
+            self._pending[statement_id] = {
+                'client': client,
+                'future': future,
+                'delay': self.initial_delay,
+                'next_poll': time.monotonic() + self.initial_delay,
+                'started': time.monotonic(),
+                'errors': 0,
+            }
+            self._set_state(statement_id, state or 'PENDING')
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def status(self, statement_id: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            state = self._states.get(statement_id)
+            return dict(state) if state else None
+
+    def _set_state(self, statement_id: str, state: str, error: Optional[str] = None) -> None:
+        self._states[statement_id] = {'statement_id': statement_id, 'state': state, 'error': error,
+                                      'updated': time.time()}
+        while len(self._states) > self.keep_recent:
+            self._states.pop(next(iter(self._states)))
+
+    def _give_up(self, statement_id: str, entry: Dict[str, Any], error: str) -> None:
+        with self._cond:
+            self._pending.pop(statement_id, None)
+            last = self._states.get(statement_id) or {}
+            self._set_state(statement_id, last.get('state') or 'PENDING', error)
+        if not entry['future'].done():
+            entry['future'].set_result({'success': False, 'statement_id': statement_id,
+                                        'state': last.get('state'), 'error': error})
+
+    def _poll(self, statement_id: str, entry: Dict[str, Any]) -> None:
+        try:
+            response = entry['client']._get_statement(statement_id)
+            if response.status_code != 200:
+                raise RuntimeError(f'HTTP {response.status_code}: {response.text}')
+            body = response.json()
+        except Exception as e:
+            # Transient: keep polling with backoff, but record what happened
+            entry['errors'] += 1
+            if entry['errors'] >= self.max_errors:
+                self._give_up(statement_id, entry, f'Statement status unavailable: {e}')
+                return
+            with self._cond:
+                last = self._states.get(statement_id) or {}
+                self._set_state(statement_id, last.get('state') or 'PENDING', str(e))
+            return
+        entry['errors'] = 0
+        state = body.get('status', {}).get('state') or 'PENDING'
+        with self._cond:
+            error = body.get('status', {}).get('error')
+            self._set_state(statement_id, state, str(error) if error else None)
+            if state in TERMINAL_STATES:
+                self._pending.pop(statement_id, None)
+        if state in TERMINAL_STATES:
+            entry['future'].set_result(_statement_result(body))
+        elif time.monotonic() - entry['started'] >= self.max_age:
+            self._give_up(statement_id, entry, f'Statement still {state} after {int(self.max_age)}s')
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [(sid, e) for sid, e in self._pending.items() if e['next_poll'] <= now]
+                if not due:
+                    self._cond.wait(min(e['next_poll'] for e in self._pending.values()) - now)
+                    continue
+                for _, e in due:
+                    e['delay'] = min(e['delay'] * self.factor, self.max_delay)
+                    e['next_poll'] = now + e['delay']
+            for sid, e in due:
+                # This thread serves every pending statement, so one bad poll must not end it
+                try:
+                    self._poll(sid, e)
+                except Exception as exc:
+                    print(f"Statement poll failed for {sid}: {exc}")
+                    try:
+                        self._give_up(sid, e, f'Statement poll failed: {exc}')
+                    except Exception:
+                        pass
+
+
+_poller: Optional[StatementPoller] = None
+
+
+def get_poller() -> StatementPoller:
+    global _poller
+    with _state_lock:
+        if _poller is None:
+            _poller = StatementPoller()
+        return _poller
+
 
 class DatabricksIntegration:
     """Databricks API integration for network test results"""
@@ -14,12 +185,13 @@ class DatabricksIntegration:
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json'
         }
+        self.session = _session_for(self.workspace_url, self.headers)
     
     def test_connection(self) -> Dict[str, Any]:
         """Test the connection to Databricks workspace"""
         try:
             url = f"{self.workspace_url}/api/2.0/clusters/list"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             
             if response.status_code == 200:
                 clusters = response.json().get('clusters', [])
@@ -45,9 +217,36 @@ class DatabricksIntegration:
                 'error': f'Unexpected error: {str(e)}'
             }
     
-    def create_table_if_not_exists(self, database: str, table: str) -> Dict[str, Any]:
-        """Create network test results table if it doesn't exist"""
-        sql_query = f"""
+    def _table_key(self, database: str, table: str):
+        return (self.workspace_url, database.lower(), table.lower())
+
+    def table_known(self, database: str, table: str) -> bool:
+        return self._table_key(database, table) in _known_tables
+
+    def remember_table(self, database: str, table: str) -> None:
+        with _state_lock:
+            _known_tables.add(self._table_key(database, table))
+
+    def forget_table(self, database: str, table: str) -> None:
+        """Drop a table from the known-to-exist cache (e.g. after it was dropped)"""
+        with _state_lock:
+            _known_tables.discard(self._table_key(database, table))
+
+    def create_table_if_not_exists(self, database: str, table: str, force: bool = False) -> Dict[str, Any]:
+        """Create network test results table if it doesn't exist.
+
+        Tables created (or found) once per workspace are remembered for the
+        life of the process, so later calls skip the DDL round trip.
+        """
+        if not force and self.table_known(database, table):
+            return {'success': True, 'cached': True}
+        result = self._execute_sql(self._create_table_sql(database, table))
+        if result.get('success'):
+            self.remember_table(database, table)
+        return result
+
+    def _create_table_sql(self, database: str, table: str) -> str:
+        return f"""
         CREATE TABLE IF NOT EXISTS {database}.{table} (
             test_id STRING,
             timestamp TIMESTAMP,
@@ -105,40 +304,81 @@ class DatabricksIntegration:
             'delta.autoOptimize.autoCompact' = 'true'
         )
         """
-        
-        return self._execute_sql(sql_query)
     
     def insert_test_results(self, database: str, table: str, results: Dict[str, Any]) -> Dict[str, Any]:
         """Insert network test results into Databricks table"""
+        result = self.insert_test_results_batch(database, table, [results])
+        if result.get('success'):
+            result['test_id'] = result['test_ids'][0]
+        return result
+
+    def insert_test_results_batch(self, database: str, table: str, results_list: List[Dict[str, Any]],
+                                  rows_per_statement: int = MAX_ROWS_PER_STATEMENT) -> Dict[str, Any]:
+        """Insert several runs as multi-row INSERT statements.
+
+        Runs are written `rows_per_statement` at a time, so a backfill of
+        100 runs is two statements instead of 100. Stops at the first failed
+        statement; `test_ids` lists the runs that were written.
+        """
         try:
-            # Generate test ID
-            test_id = f"test_{int(time.time())}_{results.get('_meta', {}).get('device_name', 'unknown')}"
-            
-            # Extract metadata
-            meta = results.get('_meta', {})
-            device_name = meta.get('device_name', 'unknown')
-            public_ip = meta.get('public_ip', 'unknown')
-            
-            # Process results for SQL insertion
-            dns_results = self._format_dns_results(results.get('dns', []))
-            tcp_results = self._format_tcp_results(results.get('tcp', []))
-            quic_results = self._format_quic_results(results.get('quic', []))
-            ping_results = self._format_ping_results(results.get('ping', []))
-            ntp_result = self._format_ntp_result(results.get('ntp', {}))
-            speedtest_result = self._format_speedtest_result(results.get('speedtest', {}))
-            
-            # Calculate overall status
-            overall_status = self._calculate_overall_status(results)
-            
-            # Create INSERT SQL
-            sql_query = f"""
+            rows = [self._format_row(results) for results in results_list]
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Failed to insert results: {str(e)}'
+            }
+
+        written = []
+        statements = 0
+        for i in range(0, len(rows), max(rows_per_statement, 1)):
+            chunk = rows[i:i + max(rows_per_statement, 1)]
+            result = self._execute_sql(self._insert_sql(database, table, [values for _, values in chunk]))
+            statements += 1
+            if not result.get('success'):
+                if 'TABLE_OR_VIEW_NOT_FOUND' in str(result.get('error', '')):
+                    self.forget_table(database, table)
+                return dict(result, test_ids=written, statements=statements)
+            written.extend(test_id for test_id, _ in chunk)
+
+        return {'success': True, 'test_ids': written, 'statements': statements}
+
+    def _insert_sql(self, database: str, table: str, rows: List[str]) -> str:
+        return f"""
             INSERT INTO {database}.{table} (
                 test_id, timestamp, device_name, public_ip, site_label,
                 dns_results, tcp_results, quic_results, ping_results,
                 ntp_result, speedtest_result, overall_status
-            ) VALUES (
+            ) VALUES {', '.join(rows)}
+            """
+
+    def _format_row(self, results: Dict[str, Any]):
+        """(test_id, VALUES tuple SQL) for one run"""
+        # Extract metadata
+        meta = results.get('_meta', {})
+        device_name = meta.get('device_name', 'unknown')
+        public_ip = meta.get('public_ip', 'unknown')
+
+        # Backfilled runs carry their own timestamp; live runs use now
+        ts = meta.get('timestamp')
+        timestamp_sql = f"timestamp_seconds({int(ts)})" if ts else "CURRENT_TIMESTAMP()"
+
+        # Generate test ID (suffix keeps runs in the same second distinct)
+        test_id = f"test_{int(ts or time.time())}_{device_name}_{uuid.uuid4().hex[:6]}"
+
+        # Process results for SQL insertion
+        dns_results = self._format_dns_results(results.get('dns', []))
+        tcp_results = self._format_tcp_results(results.get('tcp', []))
+        quic_results = self._format_quic_results(results.get('quic', []))
+        ping_results = self._format_ping_results(results.get('ping', []))
+        ntp_result = self._format_ntp_result(results.get('ntp', {}))
+        speedtest_result = self._format_speedtest_result(results.get('speedtest', {}))
+
+        # Calculate overall status
+        overall_status = self._calculate_overall_status(results)
+
+        values = f"""(
                 '{test_id}',
-                CURRENT_TIMESTAMP(),
+                {timestamp_sql},
                 '{device_name}',
                 '{public_ip}',
                 '{meta.get("site_label", "")}',
@@ -149,45 +389,16 @@ class DatabricksIntegration:
                 {ntp_result},
                 {speedtest_result},
                 '{overall_status}'
-            )
-            """
-            
-            result = self._execute_sql(sql_query)
-            if result.get('success'):
-                result['test_id'] = test_id
-            return result
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'Failed to insert results: {str(e)}'
-            }
+            )"""
+        return test_id, values
     
     def _execute_sql(self, sql_query: str) -> Dict[str, Any]:
         """Execute SQL query using Databricks SQL API"""
         try:
-            url = f"{self.workspace_url}/api/2.0/sql/statements/"
-            
-            payload = {
-                "statement": sql_query,
-                "warehouse_id": self.cluster_id,
-                "wait_timeout": "30s"
-            }
-            
-            response = requests.post(url, headers=self.headers, json=payload, timeout=60)
+            response = self._submit_sql(sql_query, "30s")
             
             if response.status_code == 200:
-                result = response.json()
-                if result.get('status', {}).get('state') == 'SUCCEEDED':
-                    return {
-                        'success': True,
-                        'result': result.get('result', {})
-                    }
-                else:
-                    return {
-                        'success': False,
-                        'error': f"Query failed: {result.get('status', {}).get('error', 'Unknown error')}"
-                    }
+                return _statement_result(response.json())
             else:
                 return {
                     'success': False,
@@ -199,6 +410,107 @@ class DatabricksIntegration:
                 'success': False,
                 'error': f'SQL execution failed: {str(e)}'
             }
+
+    def _submit_sql(self, sql_query: str, wait_timeout: str) -> requests.Response:
+        url = f"{self.workspace_url}/api/2.0/sql/statements/"
+        payload = {
+            "statement": sql_query,
+            "warehouse_id": self.cluster_id,
+            "wait_timeout": wait_timeout
+        }
+        return self.session.post(url, json=payload, timeout=60)
+
+    def _get_statement(self, statement_id: str) -> requests.Response:
+        url = f"{self.workspace_url}/api/2.0/sql/statements/{statement_id}"
+        return self.session.get(url, timeout=30)
+
+    def execute_sql_async(self, sql_query: str, callback: Optional[Callable] = None) -> Future:
+        """Submit SQL without waiting for it to run.
+
+        Returns a Future whose `statement_id` attribute is set once the
+        statement is accepted; it resolves to the same dict _execute_sql
+        returns. The shared poller checks pending statements with backoff.
+        `callback`, if given, is called with that dict on completion.
+        """
+        future = Future()
+        future.statement_id = None
+        if callback:
+            future.add_done_callback(lambda f: callback(f.result()))
+        try:
+            response = self._submit_sql(sql_query, "0s")
+            if response.status_code != 200:
+                future.set_result({'success': False, 'error': f'HTTP {response.status_code}: {response.text}'})
+                return future
+            body = response.json()
+            future.statement_id = body.get('statement_id')
+            if body.get('status', {}).get('state') in TERMINAL_STATES or not future.statement_id:
+                future.set_result(_statement_result(body))
+            else:
+                get_poller().track(self, future.statement_id, future, body.get('status', {}).get('state'))
+        except Exception as e:
+            future.set_result({'success': False, 'error': f'SQL execution failed: {str(e)}'})
+        return future
+
+    def await_statement(self, future: Future, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Block until an async statement finishes (or `timeout` passes)"""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            return {'success': False, 'pending': True, 'statement_id': future.statement_id,
+                    'error': 'Statement still running'}
+
+    def submit_test_results_batch(self, database: str, table: str, results_list: List[Dict[str, Any]]) -> Future:
+        """Submit several runs as one INSERT without waiting for it to run.
+
+        The returned Future is the one from execute_sql_async, with
+        `test_ids` added.
+        """
+        rows = [self._format_row(results) for results in results_list]
+        future = self.execute_sql_async(self._insert_sql(database, table, [values for _, values in rows]))
+        future.test_ids = [test_id for test_id, _ in rows]
+        return future
+
+    def track_statement(self, statement_id: str) -> Future:
+        """Future for a statement submitted earlier (possibly by another process), resolved by the poller"""
+        future = Future()
+        future.statement_id = statement_id
+        get_poller().track(self, statement_id, future)
+        return future
+
+    def insert_test_results_async(self, database: str, table: str, results: Dict[str, Any],
+                                  callback: Optional[Callable] = None) -> Future:
+        """Asynchronous insert_test_results, creating the table first if needed.
+
+        The returned Future carries `test_id` and the `statement_id` of the
+        statement currently running, and resolves to the insert's result.
+        """
+        test_id, values = self._format_row(results)
+        future = Future()
+        future.test_id = test_id
+        future.statement_id = None
+        if callback:
+            future.add_done_callback(lambda f: callback(f.result()))
+
+        def _finish(result):
+            if result.get('success'):
+                result = dict(result, test_id=test_id)
+            future.set_result(result)
+
+        def _insert(table_result=None):
+            if table_result is not None:
+                if not table_result.get('success'):
+                    future.set_result(table_result)
+                    return
+                self.remember_table(database, table)
+            step = self.execute_sql_async(self._insert_sql(database, table, [values]), callback=_finish)
+            future.statement_id = step.statement_id
+
+        if self.table_known(database, table):
+            _insert()
+        else:
+            step = self.execute_sql_async(self._create_table_sql(database, table), callback=_insert)
+            future.statement_id = future.statement_id or step.statement_id
+        return future
     
     def _format_dns_results(self, dns_results: list) -> str:
         """Format DNS results for SQL insertion"""
@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import io
+import json
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from databricks_integration import DatabricksIntegration, create_databricks_client
+from history_store import iter_probes
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet staging is optional; NDJSON needs nothing extra
+    pa = None
+    pq = None
+
+# Top-level columns; every other field of a probe result goes into `detail`
+COLUMNS = [
+    ('run_id', 'STRING'),
+    ('ts', 'TIMESTAMP'),
+    ('date', 'DATE'),
+    ('site', 'STRING'),
+    ('device_name', 'STRING'),
+    ('public_ip', 'STRING'),
+    ('category', 'STRING'),
+    ('target', 'STRING'),
+    ('label', 'STRING'),
+    ('host', 'STRING'),
+    ('port', 'INT'),
+    ('status', 'STRING'),
+    ('latency_ms', 'DOUBLE'),
+    ('timeout_ms', 'DOUBLE'),
+    ('failure_mode', 'STRING'),
+    ('root_cause', 'STRING'),
+    ('error', 'STRING'),
+    ('detail', 'STRING'),
+]
+_PROMOTED = {'target', 'label', 'host', 'port', 'status', 'latency_ms', 'timeout_ms',
+             'failure_mode', 'root_cause', 'error'}
+
+
+def _num(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def probe_rows(results: Dict[str, Any], site_label: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Flatten one run into one row per probe result."""
+    meta = results.get('_meta', {})
+    ts = float(meta.get('timestamp') or time.time())
+    when = datetime.fromtimestamp(ts, tz=timezone.utc)
+    device_name = meta.get('device_name', 'unknown')
+    run_id = meta.get('run_id') or f"{device_name}-{int(ts)}"
+    base = {
+        'run_id': run_id,
+        'ts': when.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        'date': when.strftime('%Y-%m-%d'),
+        'site': meta.get('site_label') or site_label or 'unknown',
+        'device_name': device_name,
+        'public_ip': meta.get('public_ip', 'unknown'),
+    }
+
+    rows = []
+    for category, r in iter_probes(results):
+        try:
+            port = int(r['port']) if r.get('port') is not None else None
+        except (TypeError, ValueError):
+            port = None
+        rows.append(dict(
+            base,
+            category=category,
+            target=str(r.get('target') or r.get('url') or ''),
+            label=r.get('label'),
+            host=r.get('host'),
+            port=port,
+            status=r.get('status'),
+            latency_ms=_num(r.get('latency_ms')),
+            timeout_ms=_num(r.get('timeout_ms')),
+            failure_mode=r.get('failure_mode'),
+            root_cause=r.get('root_cause'),
+            error=str(r['error']) if r.get('error') else None,
+            detail=json.dumps({k: v for k, v in r.items() if k not in _PROMOTED}, default=str),
+        ))
+    return rows
+
+
+def encode_ndjson_gz(rows: List[Dict[str, Any]]) -> bytes:
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+        for row in rows:
+            gz.write((json.dumps(row, default=str) + '\n').encode('utf-8'))
+    return buf.getvalue()
+
+
+def encode_parquet(rows: List[Dict[str, Any]]) -> bytes:
+    table = pa.Table.from_pylist(rows)
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression='zstd')
+    return buf.getvalue()
+
+
+class ProbeTableSink:
+    """Long-format Delta table with one row per probe, loaded in bulk.
+
+    Rows are staged as a compressed file in a Unity Catalog volume through the
+    Files API and loaded with COPY INTO, so no result data is embedded in SQL.
+    The staged file name is derived from the run ids, and COPY INTO skips files
+    it has already loaded, so retrying a batch never duplicates rows. The table
+    is partitioned by (date, site) for fleet-wide time/site queries.
+    """
+
+    def __init__(self, client: DatabricksIntegration, database: str, table: str, volume_path: str,
+                 file_format: str = 'ndjson'):
+        self.client = client
+        self.database = database
+        self.table = table
+        self.volume_path = '/' + volume_path.strip('/')
+        if file_format == 'parquet' and pa is None:
+            print("pyarrow not installed; staging probe rows as NDJSON instead of Parquet")
+            file_format = 'ndjson'
+        self.file_format = file_format
+
+    def create_table(self, force: bool = False) -> Dict[str, Any]:
+        if not force and self.client.table_known(self.database, self.table):
+            return {'success': True, 'cached': True}
+        columns = ',\n            '.join(f"{name} {kind}" for name, kind in COLUMNS)
+        result = self.client._execute_sql(f"""
+        CREATE TABLE IF NOT EXISTS {self.database}.{self.table} (
+            {columns}
+        )
+        USING DELTA
+        PARTITIONED BY (date, site)
+        TBLPROPERTIES (
+            'delta.autoOptimize.optimizeWrite' = 'true',
+            'delta.autoOptimize.autoCompact' = 'true'
+        )
+        """)
+        if result.get('success'):
+            self.client.remember_table(self.database, self.table)
+        return result
+
+    def _file_url(self, name: str) -> str:
+        return f"{self.client.workspace_url}/api/2.0/fs/files{self.volume_path}/{name}"
+
+    def stage(self, name: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Upload rows to the volume as `name`"""
+        data = encode_parquet(rows) if self.file_format == 'parquet' else encode_ndjson_gz(rows)
+        try:
+            response = self.client.session.put(self._file_url(name), params={'overwrite': 'true'}, data=data,
+                                               headers={'Content-Type': 'application/octet-stream'}, timeout=60)
+            if response.status_code >= 300:
+                return {'success': False, 'error': f'HTTP {response.status_code}: {response.text}'}
+            return {'success': True, 'path': f"{self.volume_path}/{name}", 'bytes': len(data)}
+        except Exception as e:
+            return {'success': False, 'error': f'Staging failed: {str(e)}'}
+
+    def unstage(self, name: str) -> None:
+        try:
+            self.client.session.delete(self._file_url(name), timeout=30)
+        except Exception as e:
+            print(f"Failed to remove staged file {name}: {e}")
+
+    def _copy_sql(self, name: str) -> str:
+        casts = ', '.join(f"CAST({name_} AS {kind}) AS {name_}" for name_, kind in COLUMNS)
+        fileformat = 'PARQUET' if self.file_format == 'parquet' else 'JSON'
+        return f"""
+        COPY INTO {self.database}.{self.table}
+        FROM (SELECT {casts} FROM '{self.volume_path}')
+        FILEFORMAT = {fileformat}
+        FILES = ('{name}')
+        COPY_OPTIONS ('mergeSchema' = 'false')
+        """
+
+    def write_runs(self, results_list: List[Dict[str, Any]], site_label: Optional[str] = None) -> Dict[str, Any]:
+        """Stage the probe rows of several runs as one file and COPY INTO the table"""
+        rows = []
+        for results in results_list:
+            rows.extend(probe_rows(results, site_label))
+        if not rows:
+            return {'success': True, 'rows': 0}
+
+        table_result = self.create_table()
+        if not table_result.get('success'):
+            return table_result
+
+        digest = hashlib.sha1('\n'.join(sorted({r['run_id'] for r in rows})).encode()).hexdigest()[:16]
+        ext = 'parquet' if self.file_format == 'parquet' else 'ndjson.gz'
+        name = f"probes-{rows[0]['date']}-{digest}.{ext}"
+        staged = self.stage(name, rows)
+        if not staged.get('success'):
+            return staged
+
+        result = self.client._execute_sql(self._copy_sql(name))
+        if not result.get('success'):
+            if 'TABLE_OR_VIEW_NOT_FOUND' in str(result.get('error', '')):
+                self.client.forget_table(self.database, self.table)
+            return result
+        self.unstage(name)
+        return {'success': True, 'rows': len(rows), 'runs': len(results_list), 'file': staged['path']}
+
+
+def create_probe_sink(config: Dict[str, Any]) -> Optional[ProbeTableSink]:
+    """Probe table sink from configuration (needs databricks.probe_table and volume_path)"""
+    databricks_config = config.get('databricks', {})
+    if not databricks_config.get('probe_table') or not databricks_config.get('volume_path'):
+        return None
+    client = create_databricks_client(config)
+    if not client:
+        return None
+    return ProbeTableSink(
+        client,
+        databricks_config.get('database', 'network_tests'),
+        databricks_config['probe_table'],
+        databricks_config['volume_path'],
+        file_format=databricks_config.get('staging_format', 'ndjson'),
+    )
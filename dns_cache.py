@@ -0,0 +1,232 @@
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# System resolver lookups (getaddrinfo) expose no TTL, so they are cached for
+# DEFAULT_TTL; answers that carry a real TTL are stored with it instead.
+DEFAULT_TTL = 300
+NEGATIVE_TTL = 30
+MIN_TTL = 5
+
+# getaddrinfo() ignores socket timeouts, so lookups run on a small pool and
+# are abandoned (not killed) once their timeout passes. The timeout counts
+# from when a worker starts the lookup, so abandoned lookups still holding
+# workers do not eat into the budget of the ones queued behind them.
+_lookup_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="dns-cache")
+
+# Answers that mean the name does not exist; only these are negative-cached.
+# Timeouts and transient failures (EAI_AGAIN) are retried on the next lookup.
+_NXDOMAIN_ERRORS = {socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)}
+
+
+def is_ip_literal(name):
+    try:
+        ipaddress.ip_address(name)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_nxdomain(err):
+    return isinstance(err, socket.gaierror) and err.errno in _NXDOMAIN_ERRORS
+
+
+def _started_lookup(name, started):
+    started.set()
+    return _system_lookup(name)
+
+
+def _system_lookup(name):
+    infos = socket.getaddrinfo(name, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+    addrs = []
+    for family, _, _, _, sockaddr in infos:
+        ip = sockaddr[0]
+        if ip not in addrs:
+            addrs.append(ip)
+    # IPv4 first to match the rest of the probes
+    addrs.sort(key=lambda a: 0 if ':' not in a else 1)
+    return addrs
+
+
+class DNSCache:
+    """Process-wide hostname -> addresses cache shared by every probe type.
+
+    Entries expire after their record TTL (or DEFAULT_TTL for system
+    resolver answers). Names that do not exist are cached for NEGATIVE_TTL
+    so later stages don't look them up again; timeouts are not cached. If `path` is set
+    the cache is loaded from and saved to that JSON file across restarts.
+    """
+
+    def __init__(self, default_ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, path=None):
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.path = path
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def _key(self, name):
+        return (name or '').strip().rstrip('.').lower()
+
+    def get(self, name):
+        """Return the live entry for `name` ({addrs, error, ttl, expires}) or None."""
+        key = self._key(name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expires'] <= time.time():
+                del self._entries[key]
+                entry = None
+            return dict(entry) if entry else None
+
+    def put(self, name, addrs, ttl=None, source='system'):
+        ttl = self.default_ttl if ttl is None else max(int(ttl), MIN_TTL)
+        with self._lock:
+            self._entries[self._key(name)] = {
+                'addrs': list(addrs),
+                'error': None,
+                'ttl': ttl,
+                'expires': time.time() + ttl,
+                'source': source,
+            }
+
+    def put_negative(self, name, error, ttl=None):
+        ttl = self.negative_ttl if ttl is None else max(int(ttl), MIN_TTL)
+        with self._lock:
+            self._entries[self._key(name)] = {
+                'addrs': [],
+                'error': str(error),
+                'ttl': ttl,
+                'expires': time.time() + ttl,
+                'source': 'negative',
+            }
+
+    def refresh(self, name, timeout=3):
+        """Do a fresh system lookup, store the outcome and return (addrs, error).
+
+        Waits up to `timeout` for a lookup worker and then up to `timeout`
+        for the lookup itself. Only "no such name" answers are stored as
+        negative entries.
+        """
+        started = threading.Event()
+        fut = _lookup_pool.submit(_started_lookup, name, started)
+        try:
+            if not started.wait(timeout):
+                fut.cancel()
+                raise FutureTimeout()
+            addrs = fut.result(timeout=timeout)
+            if not addrs:
+                raise socket.gaierror(socket.EAI_NONAME, 'No address associated with hostname')
+            self.put(name, addrs)
+            return addrs, None
+        except FutureTimeout:
+            return [], socket.timeout('DNS lookup timed out')
+        except Exception as e:
+            err = e
+        if _is_nxdomain(err):
+            self.put_negative(name, err)
+        return [], err
+
+    def resolve(self, name, timeout=3):
+        """Return cached addresses for `name`, resolving once on a miss.
+
+        IP literals are returned as-is. Concurrent callers for the same name
+        share one lookup. Raises socket.gaierror (or socket.timeout) when the
+        name does not resolve, including from a negative cache entry.
+        """
+        name = (name or '').strip()
+        if is_ip_literal(name):
+            return [name]
+
+        entry = self.get(name)
+        if entry is None:
+            key = self._key(name)
+            with self._lock:
+                pending = self._inflight.get(key)
+                owner = pending is None
+                if owner:
+                    pending = self._inflight[key] = {'event': threading.Event(), 'error': None}
+            if owner:
+                try:
+                    _, pending['error'] = self.refresh(name, timeout=timeout)
+                finally:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+                    pending['event'].set()
+            # A lookup may queue for a worker for up to `timeout` before its own `timeout` starts
+            elif not pending['event'].wait(2 * timeout):
+                raise socket.timeout('DNS lookup timed out')
+            entry = self.get(name)
+            if entry is None and pending['error'] is not None:
+                # Not cached (timeout or transient failure): report it without poisoning the cache
+                raise pending['error']
+
+        if not entry:
+            raise socket.timeout('DNS lookup timed out')
+        if entry.get('error'):
+            raise socket.gaierror(entry['error'])
+        return list(entry['addrs'])
+
+    def lookup(self, name, timeout=3):
+        """First cached address for `name`, or None if it does not resolve."""
+        try:
+            addrs = self.resolve(name, timeout=timeout)
+            return addrs[0] if addrs else None
+        except Exception:
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {k: dict(v) for k, v in self._entries.items() if v['expires'] > now}
+
+    def load(self):
+        try:
+            if self.path and os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                now = time.time()
+                with self._lock:
+                    for k, v in (data or {}).items():
+                        if isinstance(v, dict) and v.get('expires', 0) > now:
+                            self._entries[k] = v
+        except Exception as e:
+            print(f"Failed to load DNS cache: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Failed to save DNS cache: {e}")
+
+
+_default_cache = DNSCache()
+
+
+def get_cache():
+    return _default_cache
+
+
+def configure(path=None, default_ttl=None, negative_ttl=None):
+    """Replace the shared cache, e.g. to enable persistence from config."""
+    global _default_cache
+    _default_cache = DNSCache(
+        default_ttl=DEFAULT_TTL if default_ttl is None else default_ttl,
+        negative_ttl=NEGATIVE_TTL if negative_ttl is None else negative_ttl,
+        path=path,
+    )
+    return _default_cache
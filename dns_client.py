@@ -0,0 +1,278 @@
+import random
+import selectors
+import socket
+import struct
+import time
+
+from dns_cache import is_ip_literal
+
+QTYPES = {"A": 1, "CNAME": 5, "AAAA": 28}
+QTYPE_NAMES = {v: k for k, v in QTYPES.items()}
+RCODES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
+
+PUBLIC_RESOLVERS = ["8.8.8.8", "1.1.1.1", "9.9.9.9"]
+
+
+def _encode_name(name):
+    out = b""
+    for label in (name or "").strip(".").split("."):
+        if not label:
+            continue
+        raw = label.encode("idna")
+        if len(raw) > 63:
+            raise ValueError(f"DNS label too long: {label}")
+        out += bytes([len(raw)]) + raw
+    return out + b"\x00"
+
+
+def build_query(name, qtype="A", txid=None):
+    """Build a recursive (RD) query packet. Returns (txid, packet)."""
+    txid = random.getrandbits(16) if txid is None else txid
+    header = struct.pack("!HHHHHH", txid, 0x0100, 1, 0, 0, 0)
+    question = _encode_name(name) + struct.pack("!HH", QTYPES.get(qtype, qtype), 1)
+    return txid, header + question
+
+
+def _read_name(data, offset):
+    labels = []
+    jumped = False
+    end = offset
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            pointer = struct.unpack("!H", data[offset:offset + 2])[0] & 0x3FFF
+            if not jumped:
+                end = offset + 2
+            jumped = True
+            offset = pointer
+            continue
+        if length == 0:
+            if not jumped:
+                end = offset + 1
+            return ".".join(labels), end
+        offset += 1
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    raise ValueError("DNS name compression loop")
+
+
+def parse_response(data):
+    """Parse a DNS response into {txid, rcode, truncated, name, qtype, answers}.
+
+    `answers` is a list of {name, type, ttl, data}; A/AAAA data is the
+    address string and CNAME data is the target name. Other record types
+    are skipped.
+    """
+    if len(data) < 12:
+        raise ValueError("DNS response too short")
+    txid, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+    offset = 12
+    qname, qtype = None, None
+    for _ in range(qdcount):
+        qname, offset = _read_name(data, offset)
+        qtype = struct.unpack("!H", data[offset:offset + 2])[0]
+        offset += 4
+
+    answers = []
+    for _ in range(ancount):
+        name, offset = _read_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + rdlength]
+        if rtype == 1 and rdlength == 4:
+            answers.append({"name": name, "type": "A", "ttl": ttl, "data": socket.inet_ntop(socket.AF_INET, rdata)})
+        elif rtype == 28 and rdlength == 16:
+            answers.append({"name": name, "type": "AAAA", "ttl": ttl, "data": socket.inet_ntop(socket.AF_INET6, rdata)})
+        elif rtype == 5:
+            answers.append({"name": name, "type": "CNAME", "ttl": ttl, "data": _read_name(data, offset)[0]})
+        offset += rdlength
+
+    return {
+        "txid": txid,
+        "rcode": RCODES.get(flags & 0x000F, str(flags & 0x000F)),
+        "truncated": bool(flags & 0x0200),
+        "name": qname,
+        "qtype": QTYPE_NAMES.get(qtype, qtype),
+        "answers": answers,
+    }
+
+
+def _server_addr(server):
+    host, port = server, 53
+    if server.count(":") == 1:
+        host, port = server.split(":")
+        port = int(port)
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return family, (host, port)
+
+
+def query_many(queries, timeout=2.0, on_result=None):
+    """Send many DNS queries at once and collect answers on one socket per address family.
+
+    `queries` is a list of (server, name, qtype) where server is "ip" or
+    "ip:port". Returns one result dict per query, in input order, with
+    status, rcode, addresses, cnames, ttl and latency_ms.
+    """
+    queries = list(queries or [])
+    results = [None] * len(queries)
+    socks = {}
+    pending = {}
+    sel = selectors.DefaultSelector()
+    used_ids = set()
+
+    def _finish(i, r):
+        results[i] = r
+        if on_result:
+            on_result(r)
+
+    def _base(i):
+        server, name, qtype = queries[i]
+        return {"server": server, "target": name, "qtype": qtype}
+
+    try:
+        for i, (server, name, qtype) in enumerate(queries):
+            try:
+                family, addr = _server_addr(server)
+                s = socks.get(family)
+                if s is None:
+                    s = socks[family] = socket.socket(family, socket.SOCK_DGRAM)
+                    s.setblocking(False)
+                    sel.register(s, selectors.EVENT_READ)
+                txid = random.getrandbits(16)
+                while txid in used_ids and len(used_ids) < 65536:
+                    txid = random.getrandbits(16)
+                used_ids.add(txid)
+                _, packet = build_query(name, qtype, txid=txid)
+                s.sendto(packet, addr)
+                pending[(txid, addr[0], addr[1])] = (i, time.perf_counter())
+            except Exception as e:
+                _finish(i, dict(_base(i), status="FAIL", error=str(e)))
+
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in sel.select(remaining):
+                s = key.fileobj
+                while True:
+                    try:
+                        data, src = s.recvfrom(4096)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        # ICMP errors from one server surface on the shared socket; keep waiting for the rest
+                        break
+                    received = time.perf_counter()
+                    try:
+                        resp = parse_response(data)
+                    except Exception:
+                        continue
+                    match = pending.pop((resp["txid"], src[0], src[1]), None)
+                    if match is None:
+                        continue
+                    i, sent = match
+                    if (resp["name"] or "").lower().rstrip(".") != queries[i][1].lower().rstrip("."):
+                        # Not our question; put it back and ignore the spoofed/late packet
+                        pending[(resp["txid"], src[0], src[1])] = match
+                        continue
+                    addrs = [a["data"] for a in resp["answers"] if a["type"] in ("A", "AAAA")]
+                    cnames = [a["data"] for a in resp["answers"] if a["type"] == "CNAME"]
+                    ttls = [a["ttl"] for a in resp["answers"]]
+                    r = dict(_base(i),
+                             status="PASS" if resp["rcode"] == "NOERROR" and addrs else "FAIL",
+                             rcode=resp["rcode"],
+                             addresses=addrs,
+                             latency_ms=round((received - sent) * 1000, 2))
+                    if cnames:
+                        r["cnames"] = cnames
+                    if ttls:
+                        r["ttl"] = min(ttls)
+                    if resp["truncated"]:
+                        r["truncated"] = True
+                    if r["status"] == "FAIL":
+                        r["error"] = resp["rcode"] if resp["rcode"] != "NOERROR" else "No address records"
+                    _finish(i, r)
+
+        for i, _ in pending.values():
+            _finish(i, dict(_base(i), status="FAIL", error="timed out", failure_mode="timeout"))
+    finally:
+        sel.close()
+        for s in socks.values():
+            s.close()
+    return results
+
+
+def compare_resolvers(names, servers, qtype="A", timeout=2.0, cache=None, cache_from=None):
+    """Query every name against every server concurrently and compare the answers.
+
+    Returns a single result dict with per-server latency/answer stats and the
+    names whose outcome (resolves vs. rcode) differs between servers, which
+    usually means DNS filtering or a broken internal resolver. Differing IP
+    sets alone are reported but not treated as a problem (CDNs/geo-DNS). If
+    `cache` is given, answers from `cache_from` (default: the first server)
+    are stored with their TTL. That must be a resolver the system itself
+    uses: a public resolver's answers would replace split-horizon ones.
+    """
+    start = time.perf_counter()
+    names = [n for n in dict.fromkeys(names or []) if n and not is_ip_literal(n)]
+    servers = [s for s in dict.fromkeys(servers or []) if s]
+    if not names or not servers:
+        return {"target": "resolvers", "status": "WARN", "note": "No resolvers or names to compare"}
+
+    queries = [(srv, name, qtype) for name in names for srv in servers]
+    answers = query_many(queries, timeout=timeout)
+
+    per_server = {srv: {"server": srv, "answered": 0, "failed": 0, "timeouts": 0, "_lat": []} for srv in servers}
+    by_name = {}
+    for r in answers:
+        st = per_server[r["server"]]
+        if r.get("failure_mode") == "timeout":
+            st["timeouts"] += 1
+        elif r["status"] == "PASS":
+            st["answered"] += 1
+        else:
+            st["failed"] += 1
+        if "latency_ms" in r:
+            st["_lat"].append(r["latency_ms"])
+        by_name.setdefault(r["target"], {})[r["server"]] = r
+
+    for st in per_server.values():
+        lat = sorted(st.pop("_lat"))
+        if lat:
+            st["avg_latency_ms"] = round(sum(lat) / len(lat), 2)
+            st["min_latency_ms"] = lat[0]
+            st["max_latency_ms"] = lat[-1]
+
+    inconsistent, differing_addresses = [], 0
+    for name, by_srv in by_name.items():
+        outcomes = {srv: (r.get("rcode") or r.get("failure_mode") or "error") for srv, r in by_srv.items()}
+        if len(set(outcomes.values())) > 1:
+            inconsistent.append({"name": name, "outcomes": outcomes})
+        addr_sets = {tuple(sorted(r.get("addresses") or [])) for r in by_srv.values() if r.get("addresses")}
+        if len(addr_sets) > 1:
+            differing_addresses += 1
+
+    if cache is not None:
+        for name, by_srv in by_name.items():
+            r = by_srv.get(cache_from or servers[0])
+            if r and r["status"] == "PASS":
+                cache.put(name, r["addresses"], ttl=r.get("ttl"), source="wire")
+
+    answered_any = any(st["answered"] for st in per_server.values())
+    if not answered_any:
+        status = "FAIL"
+    elif inconsistent or any(st["timeouts"] == len(names) for st in per_server.values()):
+        status = "WARN"
+    else:
+        status = "PASS"
+
+    return {
+        "target": "resolvers",
+        "status": status,
+        "servers": list(per_server.values()),
+        "inconsistent": inconsistent,
+        "differing_addresses": differing_addresses,
+        "queries": len(queries),
+        "latency_ms": int((time.perf_counter() - start) * 1000),
+    }
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+
+# Retention tiers, overridable with the `history_retention` config section.
+# Runs keep full detail (results and per-probe rows) for `full_days`; after
+# that they live on only in the rollups built when they were saved. Hourly
+# rollups are kept `hourly_days`, daily rollups `daily_days` (null = forever).
+# `max_disk_mb` caps the history database plus any pre-SQLite JSON files.
+DEFAULT_RETENTION = {
+    "enabled": True,
+    "full_days": 7,
+    "hourly_days": 90,
+    "daily_days": None,
+    "max_disk_mb": 500,
+    "interval_seconds": 3600,
+}
+
+STARTUP_DELAY = 60
+QUOTA_BATCH = 50
+# VACUUM rewrites the whole file, so only do it when enough is reclaimable
+VACUUM_FREE_RATIO = 0.25
+
+DAY = 86400
+
+
+class HistoryRetention:
+    """Background compaction of the history store into coarser tiers.
+
+    run_once() prunes each tier past its age, removes already-migrated
+    test_<ts>.json files past the full-detail window, and then, if usage is
+    still over the quota, drops the oldest data coarsest-last: legacy JSON
+    files, then runs, hourly rollups and finally daily rollups. The last
+    report is kept for status().
+    """
+
+    def __init__(self, store, history_dir, config_loader=None):
+        self.store = store
+        self.history_dir = history_dir
+        self.config_loader = config_loader or (lambda: {})
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last = None
+
+    def settings(self):
+        settings = dict(DEFAULT_RETENTION)
+        settings.update((self.config_loader() or {}).get("history_retention") or {})
+        return settings
+
+    def _legacy_files(self):
+        """(timestamp, path, size) of old JSON history files, oldest first."""
+        files = []
+        if not os.path.isdir(self.history_dir):
+            return files
+        for name in os.listdir(self.history_dir):
+            if not (name.startswith("test_") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.history_dir, name)
+            try:
+                files.append((int(name[5:-5]), path, os.path.getsize(path)))
+            except (ValueError, OSError):
+                continue
+        return sorted(files)
+
+    def usage(self):
+        usage = self.store.disk_usage()
+        usage["legacy_bytes"] = sum(size for _, _, size in self._legacy_files())
+        return usage
+
+    def _over_quota(self, quota):
+        usage = self.usage()
+        return usage["used_bytes"] + usage["legacy_bytes"] > quota
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError as e:
+            print(f"Could not remove {path}: {e}")
+            return False
+
+    def run_once(self, now=None):
+        """Apply the retention tiers and disk quota once; returns a report."""
+        with self._lock:
+            settings = self.settings()
+            now = now or time.time()
+            report = {"ran_at": int(now), "runs": 0, "hourly_rollups": 0, "daily_rollups": 0,
+                      "legacy_files": 0, "quota": {"runs": 0, "hourly_rollups": 0, "daily_rollups": 0,
+                                                   "legacy_files": 0}, "vacuumed": False}
+            usage_before = self.usage()
+
+            if settings.get("full_days") is not None:
+                cutoff = now - float(settings["full_days"]) * DAY
+                report["runs"] = self.store.prune_runs(before=cutoff)
+                if self.store.json_migrated:
+                    for ts, path, _ in self._legacy_files():
+                        if ts < cutoff and self._remove(path):
+                            report["legacy_files"] += 1
+            if settings.get("hourly_days") is not None:
+                report["hourly_rollups"] = self.store.prune_rollups(
+                    "hour", before=now - float(settings["hourly_days"]) * DAY)
+            if settings.get("daily_days") is not None:
+                report["daily_rollups"] = self.store.prune_rollups(
+                    "day", before=now - float(settings["daily_days"]) * DAY)
+
+            if settings.get("max_disk_mb"):
+                self._enforce_quota(float(settings["max_disk_mb"]) * 1024 * 1024, report["quota"])
+
+            usage = self.store.disk_usage()
+            if usage["free_bytes"] > VACUUM_FREE_RATIO * max(usage["file_bytes"], 1):
+                self.store.vacuum()
+                report["vacuumed"] = True
+            report["usage_before"] = usage_before
+            report["usage"] = self.usage()
+            report["counts"] = self.store.counts()
+            self._last = report
+            return report
+
+    def _enforce_quota(self, quota, removed):
+        if not self._over_quota(quota):
+            return
+        # Only files already imported into the store are redundant copies
+        if self.store.json_migrated:
+            for _, path, _ in self._legacy_files():
+                if not self._over_quota(quota):
+                    return
+                if self._remove(path):
+                    removed["legacy_files"] += 1
+        while self._over_quota(quota):
+            deleted = self.store.prune_runs(oldest=QUOTA_BATCH)
+            if not deleted:
+                break
+            removed["runs"] += deleted
+        for bucket, key in (("hour", "hourly_rollups"), ("day", "daily_rollups")):
+            while self._over_quota(quota):
+                deleted = self.store.prune_rollups(bucket, oldest=QUOTA_BATCH)
+                if not deleted:
+                    break
+                removed[key] += deleted
+        if self._over_quota(quota):
+            print("History retention: still over the disk quota with nothing left to prune")
+
+    def status(self):
+        settings = self.settings()
+        return {"settings": settings, "last_run": self._last, "usage": self.usage(),
+                "counts": self.store.counts()}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        """Run a pass now instead of waiting for the interval."""
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        self._wake.wait(STARTUP_DELAY)
+        while True:
+            self._wake.clear()
+            settings = self.settings()
+            if settings.get("enabled", True):
+                try:
+                    report = self.run_once()
+                    pruned = report["runs"] + report["quota"]["runs"]
+                    if pruned or report["vacuumed"]:
+                        print(f"History retention: pruned {pruned} runs, vacuumed={report['vacuumed']}")
+                except Exception as e:
+                    print(f"History retention failed: {e}")
+            self._wake.wait(max(float(settings.get("interval_seconds") or 3600), 60))
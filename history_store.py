@@ -0,0 +1,672 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from latency_sketch import LatencySketch
+
+LIST_CATEGORIES = ('dns', 'tcp', 'https', 'quic', 'udp_range', 'ping')
+SINGLE_CATEGORIES = ('gateway', 'dns_resolvers', 'ntp', 'speedtest')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL UNIQUE,
+    datetime TEXT,
+    device_name TEXT,
+    private_ip TEXT,
+    public_ip TEXT,
+    site_label TEXT,
+    total_tests INTEGER,
+    passed INTEGER,
+    failed INTEGER,
+    warnings INTEGER,
+    results TEXT NOT NULL,
+    archived INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS probes (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    timestamp INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    target TEXT,
+    label TEXT,
+    status TEXT,
+    latency_ms REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    bucket INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    target TEXT NOT NULL,
+    label TEXT,
+    count INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    warnings INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    lat_count INTEGER NOT NULL,
+    lat_sum REAL NOT NULL,
+    lat_min REAL,
+    lat_max REAL,
+    sketch TEXT,
+    PRIMARY KEY (bucket, start, category, target)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_site ON runs(site_label, timestamp);
+CREATE INDEX IF NOT EXISTS idx_probes_run ON probes(run_id);
+"""
+
+# Every index is a B-tree write per row: a per-target index puts each of a
+# run's ~70 probes on a different page, which took a 74-probe save from
+# ~54 KB to ~430 KB of writes. So probes are indexed by run only, trading
+# away the per-target lookup: the history target filter (see _where) checks
+# the newest runs one by one through idx_probes_run, which is quick for
+# targets most runs probe but walks every run for one that is rarely
+# probed. Nothing queries probes by status or timestamp (run-level filters
+# use the runs table). Per-target charts read the rollups, which are keyed
+# by time so a save only touches the current buckets' pages. Lookups by run
+# timestamp use the UNIQUE constraint's own index.
+_DROPPED_INDEXES = ('idx_runs_timestamp', 'idx_probes_timestamp', 'idx_probes_target', 'idx_probes_status',
+                    'idx_rollups_label', 'idx_rollups_start')
+_ROLLUP_COLUMNS = ('bucket, start, category, target, label, count, passed, warnings, failed, '
+                   'lat_count, lat_sum, lat_min, lat_max, sketch')
+
+_RUN_COLUMNS = ('timestamp', 'datetime', 'device_name', 'private_ip', 'public_ip', 'site_label')
+
+# Run-level status, same precedence as the badges on the history page
+_STATUS_SQL = {
+    'FAIL': 'failed > 0',
+    'WARN': 'failed = 0 AND warnings > 0',
+    'PASS': 'failed = 0 AND warnings = 0',
+}
+MAX_PAGE = 200
+
+# Rollup bucket widths in seconds. Buckets are aligned to UTC.
+ROLLUP_BUCKETS = {'hour': 3600, 'day': 86400}
+_ROLLUP_FIELDS = ('count', 'passed', 'warnings', 'failed', 'lat_count', 'lat_sum', 'lat_min', 'lat_max')
+
+
+def iter_probes(results):
+    """Yield (category, result) for every probe result in a run."""
+    for category in LIST_CATEGORIES + SINGLE_CATEGORIES:
+        value = results.get(category)
+        if not value:
+            continue
+        for r in (value if isinstance(value, list) else [value]):
+            if isinstance(r, dict):
+                yield category, r
+
+
+def _latency(r):
+    try:
+        return float(r['latency_ms']) if r.get('latency_ms') is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _new_rollup(label):
+    return {'label': label, 'count': 0, 'passed': 0, 'warnings': 0, 'failed': 0,
+            'lat_count': 0, 'lat_sum': 0.0, 'lat_min': None, 'lat_max': None, 'sketch': LatencySketch()}
+
+
+def _merge_rollup(into, other):
+    """Fold rollup `other` into `into` (both dicts as built by _new_rollup)."""
+    for field in ('count', 'passed', 'warnings', 'failed', 'lat_count', 'lat_sum'):
+        into[field] += other[field]
+    for field, pick in (('lat_min', min), ('lat_max', max)):
+        values = [v for v in (into[field], other[field]) if v is not None]
+        into[field] = pick(values) if values else None
+    into['sketch'].merge(other['sketch'])
+    into['label'] = other['label'] or into['label']
+    return into
+
+
+def rollup_probes(probes, buckets=ROLLUP_BUCKETS.values()):
+    """Aggregate (timestamp, category, target, label, status, latency_ms) tuples.
+
+    Returns {(bucket, start, category, target): rollup}. Latency only counts
+    for probes that reported one; pass rate is over PASS/WARN/FAIL results.
+    """
+    rollups = {}
+    for timestamp, category, target, label, status, latency in probes:
+        if not target:
+            continue
+        for bucket in buckets:
+            key = (bucket, timestamp - timestamp % bucket, category, target)
+            r = rollups.get(key)
+            if r is None:
+                r = rollups[key] = _new_rollup(label)
+            r['count'] += 1
+            if status == 'PASS':
+                r['passed'] += 1
+            elif status == 'WARN':
+                r['warnings'] += 1
+            elif status in ('FAIL', 'ERROR'):
+                r['failed'] += 1
+            if latency is not None:
+                r['lat_count'] += 1
+                r['lat_sum'] += latency
+                r['lat_min'] = latency if r['lat_min'] is None else min(r['lat_min'], latency)
+                r['lat_max'] = latency if r['lat_max'] is None else max(r['lat_max'], latency)
+                r['sketch'].add(latency)
+            r['label'] = label or r['label']
+    return rollups
+
+
+class HistoryStore:
+    """Test history in SQLite (WAL mode): one row per run plus one per probe.
+
+    Each thread gets its own connection; WAL lets the UI read while a run
+    is being saved. Full results are kept as JSON on the run row, or, when
+    a RunArchive is given, compressed in the archive so each save writes a
+    few KB instead of the whole JSON (twice, through the WAL). The probes
+    table holds each probe's target, status and latency, indexed by run.
+    Per-target hourly and daily rollups (counts, latency
+    min/mean/max and a LatencySketch) for the current hour are buffered in
+    memory and written once the hour changes; after a crash the buffer is
+    rebuilt from the probes saved since the last flush. Deleting single
+    runs leaves the rollups as they were.
+    """
+
+    def __init__(self, path, archive=None):
+        self.path = path
+        self.archive = archive
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._pending_hour = None
+        self._flushed_until = 0
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(SCHEMA)
+            self._upgrade(conn)
+        if not self._get_meta('rollups_built'):
+            self.build_rollups()
+        self._load_pending()
+
+    def _upgrade(self, conn):
+        """Bring a store created by an earlier version up to the current layout."""
+        with conn:
+            columns = [r['name'] for r in conn.execute('PRAGMA table_info(runs)')]
+            if 'archived' not in columns:
+                conn.execute('ALTER TABLE runs ADD COLUMN archived INTEGER NOT NULL DEFAULT 0')
+            for name in _DROPPED_INDEXES:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'rollups'").fetchone()['sql']
+            if 'WITHOUT ROWID' not in sql:
+                # Re-key rollups by time, keeping the rows (runs behind them may be pruned)
+                conn.execute('ALTER TABLE rollups RENAME TO rollups_old')
+                conn.executescript(SCHEMA)
+                conn.execute(f'INSERT INTO rollups ({_ROLLUP_COLUMNS}) SELECT {_ROLLUP_COLUMNS} FROM rollups_old')
+                conn.execute('DROP TABLE rollups_old')
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'rollups_built'").fetchone() and \
+                    not conn.execute("SELECT 1 FROM meta WHERE key = 'rollups_flushed_until'").fetchone():
+                # Rollups used to be written on every save, so all probes so far are in them
+                last = conn.execute('SELECT MAX(timestamp) FROM runs').fetchone()[0]
+                conn.execute("INSERT INTO meta (key, value) VALUES ('rollups_flushed_until', ?)",
+                             (str((last or 0) + 1),))
+
+    def _load_pending(self):
+        """Rebuild the unflushed rollups from probes saved since the last flush."""
+        self._flushed_until = int(self._get_meta('rollups_flushed_until') or 0)
+        rows = self._conn().execute(
+            'SELECT timestamp, category, target, label, status, latency_ms FROM probes '
+            'WHERE run_id IN (SELECT id FROM runs WHERE timestamp >= ?)',
+            (self._flushed_until,)).fetchall()
+        self._pending = rollup_probes(tuple(r) for r in rows)
+        self._pending_hour = max(r['timestamp'] for r in rows) // 3600 if rows else None
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def _entry(self, row):
+        return {
+            'timestamp': row['timestamp'],
+            'datetime': row['datetime'],
+            'device_name': row['device_name'],
+            'private_ip': row['private_ip'],
+            'public_ip': row['public_ip'],
+            'site_label': row['site_label'],
+            'summary': {
+                'total_tests': row['total_tests'],
+                'passed': row['passed'],
+                'failed': row['failed'],
+                'warnings': row['warnings'],
+            },
+        }
+
+    def save_run(self, results, summary, timestamp=None):
+        """Store a run; returns its index entry. Same-second runs get the next free second."""
+        meta = results.get('_meta', {})
+        timestamp = int(timestamp or time.time())
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                while conn.execute('SELECT 1 FROM runs WHERE timestamp = ?', (timestamp,)).fetchone():
+                    timestamp += 1
+                run = {
+                    'timestamp': timestamp,
+                    'datetime': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)),
+                    'device_name': meta.get('device_name', 'unknown'),
+                    'private_ip': meta.get('private_ip', 'unknown'),
+                    'public_ip': meta.get('public_ip', 'unknown'),
+                    'site_label': meta.get('site_label'),
+                }
+                if self.archive is not None:
+                    self.archive.append(timestamp, results)
+                    stored, archived = '', 1
+                else:
+                    stored, archived = json.dumps(results, default=str), 0
+                cur = conn.execute(
+                    'INSERT INTO runs (timestamp, datetime, device_name, private_ip, public_ip, site_label, '
+                    'total_tests, passed, failed, warnings, results, archived) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [run[c] for c in _RUN_COLUMNS] + [summary.get('total_tests', 0), summary.get('passed', 0),
+                                                       summary.get('failed', 0), summary.get('warnings', 0),
+                                                       stored, archived])
+                probes = [(timestamp, category, str(r.get('target') or r.get('url') or ''),
+                           r.get('label'), r.get('status'), _latency(r), str(r['error']) if r.get('error') else None)
+                          for category, r in iter_probes(results)]
+                conn.executemany(
+                    'INSERT INTO probes (run_id, timestamp, category, target, label, status, latency_ms, error) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(cur.lastrowid,) + p for p in probes])
+                rollups = rollup_probes(p[:6] for p in probes)
+                flushed = None
+                if timestamp < self._flushed_until:
+                    # Older than what has been flushed (e.g. imported history): write through
+                    self._write_rollups(conn, rollups)
+                    rollups = None
+                elif self._pending and timestamp // 3600 != self._pending_hour:
+                    self._write_rollups(conn, self._pending)
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_flushed_until', ?)",
+                                 (str(timestamp),))
+                    flushed = timestamp
+            # Only touch the in-memory buffer once the transaction has committed
+            if flushed is not None:
+                self._pending = {}
+                self._flushed_until = flushed
+            if rollups:
+                self._fold_pending(rollups)
+                self._pending_hour = timestamp // 3600
+        return dict(run, summary=summary)
+
+    def _fold_pending(self, rollups):
+        for key, r in rollups.items():
+            if key in self._pending:
+                _merge_rollup(self._pending[key], r)
+            else:
+                self._pending[key] = r
+
+    def flush_rollups(self):
+        """Write the buffered rollups now (they are otherwise written when the hour changes)."""
+        with self._write_lock:
+            if not self._pending:
+                return
+            conn = self._conn()
+            until = max(key[1] for key in self._pending if key[0] == ROLLUP_BUCKETS['hour']) + 3600
+            with conn:
+                self._write_rollups(conn, self._pending)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_flushed_until', ?)",
+                             (str(until),))
+            self._pending = {}
+            self._flushed_until = until
+
+    def _write_rollups(self, conn, rollups):
+        """Merge new rollups into the stored buckets (caller holds the write lock and transaction)."""
+        for (bucket, start, category, target), r in rollups.items():
+            key = (bucket, start, category, target)
+            row = conn.execute(
+                'SELECT * FROM rollups WHERE bucket = ? AND start = ? AND category = ? AND target = ?', key).fetchone()
+            if row is None:
+                conn.execute(
+                    f'INSERT INTO rollups ({_ROLLUP_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    key + (r['label'],) + tuple(r[f] for f in _ROLLUP_FIELDS) + (r['sketch'].to_json(),))
+                continue
+            stored = {f: row[f] for f in _ROLLUP_FIELDS}
+            stored.update(label=row['label'], sketch=LatencySketch.from_json(row['sketch']))
+            r = _merge_rollup(stored, r)
+            conn.execute(
+                'UPDATE rollups SET label = ?, ' + ', '.join(f'{f} = ?' for f in _ROLLUP_FIELDS) + ', sketch = ? '
+                'WHERE bucket = ? AND start = ? AND category = ? AND target = ?',
+                (r['label'],) + tuple(r[f] for f in _ROLLUP_FIELDS) + (r['sketch'].to_json(),) + key)
+
+    def build_rollups(self):
+        """Rebuild every rollup from the probes table; returns buckets written.
+
+        Runs once on first open of a store that predates rollups; after that
+        save_run() keeps them current incrementally.
+        """
+        with self._write_lock:
+            conn = self._conn()
+            rows = conn.execute(
+                'SELECT timestamp, category, target, label, status, latency_ms FROM probes').fetchall()
+            rollups = rollup_probes(tuple(r) for r in rows)
+            until = max((r['timestamp'] for r in rows), default=0) + 1
+            with conn:
+                conn.execute('DELETE FROM rollups')
+                self._write_rollups(conn, rollups)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_flushed_until', ?)",
+                             (str(until),))
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_built', ?)",
+                             (str(int(time.time())),))
+            self._pending = {}
+            self._flushed_until = until
+        return len(rollups)
+
+    def trends(self, target=None, category=None, bucket='hour', since=None, until=None,
+               quantiles=(0.5, 0.9, 0.99)):
+        """Per-target time series from the rollup buckets.
+
+        `target` matches a probe target or its label exactly. Returns a list of
+        {category, target, label, points}, one point per bucket with count,
+        pass_rate, latency min/mean/max and the requested latency quantiles
+        (as p50, p90, ...). Reads only the rollup rows in range (plus the
+        buffered current hour), so the cost does not grow with the number of
+        stored runs.
+        """
+        if bucket not in ROLLUP_BUCKETS:
+            raise ValueError(f"Unknown bucket: {bucket}")
+        width = ROLLUP_BUCKETS[bucket]
+        since = int(since) - int(since) % width if since is not None else None
+        clauses, params = ['bucket = ?'], [width]
+        if target:
+            clauses.append('(target = ? OR label = ?)')
+            params += [target, target]
+        if category:
+            clauses.append('category = ?')
+            params.append(category)
+        if since is not None:
+            clauses.append('start >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('start <= ?')
+            params.append(int(until))
+        buckets = {}
+        for row in self._conn().execute(f'SELECT * FROM rollups WHERE {" AND ".join(clauses)}', params):
+            r = {f: row[f] for f in _ROLLUP_FIELDS}
+            r.update(label=row['label'], sketch=LatencySketch.from_json(row['sketch']))
+            buckets[(row['category'], row['target'], row['start'])] = r
+        with self._write_lock:
+            pending = [(key, dict(r, sketch=LatencySketch().merge(r['sketch'])))
+                       for key, r in self._pending.items() if key[0] == width]
+        for (_, start, cat, tgt), r in pending:
+            if (target and target not in (tgt, r['label'])) or (category and cat != category) \
+                    or (since is not None and start < since) or (until is not None and start > int(until)):
+                continue
+            key = (cat, tgt, start)
+            buckets[key] = _merge_rollup(buckets[key], r) if key in buckets else r
+        series = {}
+        for (cat, tgt, start), r in sorted(buckets.items()):
+            s = series.get((cat, tgt))
+            if s is None:
+                s = series[(cat, tgt)] = {'category': cat, 'target': tgt, 'label': r['label'], 'points': []}
+            s['label'] = r['label'] or s['label']
+            graded = r['passed'] + r['warnings'] + r['failed']
+            point = {
+                'start': start,
+                'count': r['count'],
+                'passed': r['passed'],
+                'warnings': r['warnings'],
+                'failed': r['failed'],
+                'pass_rate': round(100.0 * r['passed'] / graded, 1) if graded else None,
+                'min': r['lat_min'],
+                'mean': round(r['lat_sum'] / r['lat_count'], 2) if r['lat_count'] else None,
+                'max': r['lat_max'],
+            }
+            for q in quantiles:
+                value = r['sketch'].quantile(q)
+                if value is not None:
+                    # The exact extremes are known; keep estimates inside them
+                    value = round(min(max(value, r['lat_min']), r['lat_max']), 2)
+                point[f'p{q * 100:g}'] = value
+            s['points'].append(point)
+        return list(series.values())
+
+    def list_runs(self, limit=100):
+        rows = self._conn().execute('SELECT * FROM runs ORDER BY timestamp DESC LIMIT ?', (limit,)).fetchall()
+        return [self._entry(r) for r in rows]
+
+    def _matching_targets(self, text):
+        """Targets whose name or label contains `text` (case-insensitive, as LIKE).
+
+        Read from the daily rollups plus the unflushed current hour, which
+        together hold every target a stored run has probed.
+        """
+        rows = self._conn().execute(
+            'SELECT DISTINCT target FROM rollups WHERE bucket = ? AND (target LIKE ? OR label LIKE ?)',
+            (ROLLUP_BUCKETS['day'], f'%{text}%', f'%{text}%')).fetchall()
+        found = {r['target'] for r in rows}
+        needle = text.lower()
+        with self._write_lock:
+            pending = list(self._pending.items())
+        for (_, _, _, name), r in pending:
+            if needle in name.lower() or needle in (r['label'] or '').lower():
+                found.add(name)
+        return sorted(found)
+
+    def _where(self, status=None, since=None, until=None, target=None, site=None, search=None):
+        """WHERE clause and params for the history filters (all optional, ANDed)."""
+        clauses, params = [], []
+        if status:
+            statuses = [s.strip().upper() for s in str(status).split(',') if s.strip()]
+            unknown = [s for s in statuses if s not in _STATUS_SQL]
+            if unknown:
+                raise ValueError(f"Unknown status: {', '.join(unknown)}")
+            clauses.append('(' + ' OR '.join(f'({_STATUS_SQL[s]})' for s in statuses) + ')')
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(int(since))
+        if until is not None:
+            clauses.append('timestamp <= ?')
+            params.append(int(until))
+        if site:
+            clauses.append('site_label = ?')
+            params.append(site)
+        if target:
+            # Resolved to whole target names first, so each run is checked with
+            # an equality test on its own probes (idx_probes_run) instead of a
+            # LIKE scan over every probe ever stored
+            targets = self._matching_targets(target)
+            clauses.append('EXISTS (SELECT 1 FROM probes WHERE probes.run_id = runs.id AND target IN '
+                           f"({', '.join('?' * len(targets))}))" if targets else '0')
+            params += targets
+        if search:
+            clauses.append('(device_name LIKE ? OR private_ip LIKE ? OR public_ip LIKE ? OR datetime LIKE ?)')
+            params += [f'%{search}%'] * 4
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query_runs(self, limit=50, cursor=None, **filters):
+        """One page of runs, newest first. Returns (entries, next_cursor).
+
+        `cursor` is the timestamp of the last run on the previous page
+        (timestamps are unique, so `timestamp < cursor` is a stable keyset
+        that doesn't shift when runs are added). next_cursor is None on the
+        last page. Filters are the keyword arguments of _where().
+        """
+        limit = max(1, min(int(limit), MAX_PAGE))
+        where, params = self._where(**filters)
+        if cursor is not None:
+            where += (' AND ' if where else ' WHERE ') + 'timestamp < ?'
+            params.append(int(cursor))
+        rows = self._conn().execute(
+            f'SELECT * FROM runs{where} ORDER BY timestamp DESC LIMIT ?', params + [limit + 1]).fetchall()
+        entries = [self._entry(r) for r in rows[:limit]]
+        next_cursor = entries[-1]['timestamp'] if len(rows) > limit else None
+        return entries, next_cursor
+
+    def stats(self, **filters):
+        """Aggregate counts over every run matching the filters."""
+        where, params = self._where(**filters)
+        row = self._conn().execute(
+            'SELECT COUNT(*) AS runs, COALESCE(SUM(total_tests), 0) AS total_tests, '
+            'COALESCE(SUM(passed), 0) AS passed, COALESCE(SUM(warnings), 0) AS warnings, '
+            'COALESCE(SUM(failed), 0) AS failed, '
+            'COALESCE(SUM(failed > 0), 0) AS failed_runs, '
+            'COALESCE(SUM(failed = 0 AND warnings > 0), 0) AS warning_runs, '
+            f'MIN(timestamp) AS first, MAX(timestamp) AS last FROM runs{where}', params).fetchone()
+        stats = dict(row)
+        stats['pass_rate'] = round(100.0 * stats['passed'] / stats['total_tests'], 1) if stats['total_tests'] else None
+        return stats
+
+    def sites(self):
+        """Distinct site labels, for the filter dropdown."""
+        rows = self._conn().execute(
+            "SELECT DISTINCT site_label FROM runs WHERE site_label IS NOT NULL AND site_label != '' "
+            'ORDER BY site_label').fetchall()
+        return [r['site_label'] for r in rows]
+
+    def get_run(self, timestamp):
+        """Full history entry (index fields plus `results`) or None"""
+        row = self._conn().execute('SELECT * FROM runs WHERE timestamp = ?', (int(timestamp),)).fetchone()
+        if row is None:
+            return None
+        entry = self._entry(row)
+        if row['archived']:
+            results = self.archive.get(row['timestamp']) if self.archive is not None else None
+            if results is None:
+                print(f"Run {row['timestamp']} is missing from the archive")
+            entry['results'] = results or {}
+        else:
+            entry['results'] = json.loads(row['results'])
+        return entry
+
+    def delete_run(self, timestamp):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                return conn.execute('DELETE FROM runs WHERE timestamp = ?', (int(timestamp),)).rowcount > 0
+
+    def clear(self):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute('DELETE FROM runs')
+                conn.execute('DELETE FROM rollups')
+            self._pending = {}
+            if self.archive is not None:
+                self.archive.clear()
+
+    def prune_runs(self, before=None, oldest=None):
+        """Delete runs older than `before`, or the `oldest` N runs; returns runs deleted.
+
+        Their probes go with them; the rollups built from them stay. Archive
+        segments are dropped once every run in them is gone.
+        """
+        if before is None and oldest is None:
+            return 0
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                if oldest is not None:
+                    deleted = conn.execute(
+                        'DELETE FROM runs WHERE id IN (SELECT id FROM runs ORDER BY timestamp LIMIT ?)',
+                        (int(oldest),)).rowcount
+                else:
+                    deleted = conn.execute('DELETE FROM runs WHERE timestamp < ?', (int(before),)).rowcount
+            if self.archive is not None and deleted:
+                row = conn.execute('SELECT MIN(timestamp) FROM runs WHERE archived = 1').fetchone()
+                self.archive.prune(row[0] if row[0] is not None else float('inf'))
+        return deleted
+
+    def prune_rollups(self, bucket, before=None, oldest=None):
+        """Delete `bucket` ('hour'/'day') rollups starting before `before`, or the
+        `oldest` N bucket periods; returns rows deleted."""
+        width = ROLLUP_BUCKETS[bucket]
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                if oldest is not None:
+                    row = conn.execute(
+                        'SELECT MAX(start) AS start FROM (SELECT DISTINCT start FROM rollups WHERE bucket = ? '
+                        'ORDER BY start LIMIT ?)', (width, int(oldest))).fetchone()
+                    if row['start'] is None:
+                        return 0
+                    before = row['start'] + 1
+                if before is None:
+                    return 0
+                return conn.execute('DELETE FROM rollups WHERE bucket = ? AND start < ?',
+                                    (width, int(before))).rowcount
+
+    def counts(self):
+        """Row counts: runs, probes and rollups per bucket."""
+        conn = self._conn()
+        counts = {
+            'runs': conn.execute('SELECT COUNT(*) FROM runs').fetchone()[0],
+            'probes': conn.execute('SELECT COUNT(*) FROM probes').fetchone()[0],
+        }
+        for name, width in ROLLUP_BUCKETS.items():
+            counts[f'{name}_rollups'] = conn.execute(
+                'SELECT COUNT(*) FROM rollups WHERE bucket = ?', (width,)).fetchone()[0]
+        return counts
+
+    def disk_usage(self):
+        """Bytes on disk (database plus WAL), archive bytes, and bytes in use (live pages plus archive)."""
+        conn = self._conn()
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        on_disk = sum(os.path.getsize(self.path + suffix) for suffix in ('', '-wal')
+                      if os.path.exists(self.path + suffix))
+        archived = self.archive.disk_bytes() if self.archive is not None else 0
+        return {'file_bytes': on_disk, 'archive_bytes': archived,
+                'used_bytes': (pages - free) * page_size + archived, 'free_bytes': free * page_size}
+
+    def vacuum(self):
+        """Return free pages to the filesystem and truncate the WAL."""
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    @property
+    def json_migrated(self):
+        return bool(self._get_meta('json_migrated'))
+
+    def _get_meta(self, key):
+        row = self._conn().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_meta(self, key, value):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def migrate_json(self, history_dir, summarize):
+        """One-time import of the old test_<ts>.json files; returns runs imported.
+
+        The JSON files are left in place; a meta flag stops re-importing.
+        """
+        if self._get_meta('json_migrated') or not os.path.isdir(history_dir):
+            return 0
+        imported = 0
+        for name in sorted(os.listdir(history_dir)):
+            if not (name.startswith('test_') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(history_dir, name), 'r') as f:
+                    saved = json.load(f)
+                ts = int(saved.get('timestamp') or name[5:-5])
+                if self.get_run(ts) is not None:
+                    continue
+                results = saved.get('results') or {}
+                self.save_run(results, summarize(results), timestamp=ts)
+                imported += 1
+            except Exception as e:
+                print(f"Skipping history file {name}: {e}")
+        self._set_meta('json_migrated', int(time.time()))
+        return imported
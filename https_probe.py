@@ -0,0 +1,275 @@
+import base64
+import http.client
+import socket
+import ssl
+import threading
+import time
+import urllib.request
+from urllib.parse import unquote, urlparse
+
+import dns_cache
+
+MAX_BODY = 64 * 1024
+USER_AGENT = "skydio-network-tester"
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class PhaseError(Exception):
+    """A probe failure, tagged with the phase it happened in and the timings so far."""
+
+    def __init__(self, phase, error, timing):
+        super().__init__(str(error))
+        self.phase = phase
+        self.error = error
+        self.timing = timing
+
+
+def proxy_for(host):
+    """The proxy HTTPS_PROXY sends connections to `host` through, honouring NO_PROXY.
+
+    Returns {"host", "port", "scheme", "auth"} or None for a direct connection.
+    """
+    url = urllib.request.getproxies().get("https")
+    if not url or urllib.request.proxy_bypass(host):
+        return None
+    parsed = urlparse(url if "://" in url else f"http://{url}")
+    auth = None
+    if parsed.username:
+        credentials = f"{unquote(parsed.username)}:{unquote(parsed.password or '')}"
+        auth = "Basic " + base64.b64encode(credentials.encode()).decode("ascii")
+    return {"host": parsed.hostname, "port": parsed.port or 80, "scheme": parsed.scheme, "auth": auth}
+
+
+class _TimedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection to a pre-resolved address that times the TCP and TLS phases.
+
+    The hostname is still used for SNI, the Host header and certificate
+    checks. Passing a TLS session from an earlier connection asks the server
+    to resume it (abbreviated handshake). With a `proxy`, `ip` is the
+    proxy's address and the TLS session runs through a CONNECT tunnel,
+    timed as its own phase.
+    """
+
+    def __init__(self, host, port, ip, context, timeout, tls_session=None, proxy=None):
+        super().__init__(host, port, timeout=timeout, context=context)
+        self.ip = ip
+        self.proxy = proxy
+        self.tls_session = tls_session
+        self.tls_sock = None
+        self.tls_version = None
+        self.phases = {}
+
+    def _open_tunnel(self, sock):
+        """Ask the proxy on `sock` for a CONNECT tunnel to host:port."""
+        if self.proxy["scheme"] != "http":
+            raise OSError(f"Unsupported proxy scheme {self.proxy['scheme']!r} (only http:// proxies can tunnel)")
+        target = f"{self.host}:{self.port}"
+        lines = [f"CONNECT {target} HTTP/1.1", f"Host: {target}", f"User-Agent: {USER_AGENT}"]
+        if self.proxy["auth"]:
+            lines.append(f"Proxy-Authorization: {self.proxy['auth']}")
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        # Unbuffered, so nothing past the proxy's headers is read off the socket
+        reader = sock.makefile("rb", buffering=0)
+        try:
+            status = reader.readline(65537)
+            while reader.readline(65537) not in (b"\r\n", b"\n", b""):
+                pass
+        finally:
+            reader.close()
+        parts = status.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise OSError(f"Bad CONNECT response from proxy: {status!r}")
+        if not parts[1].startswith("2"):
+            reason = parts[2].strip() if len(parts) > 2 else ""
+            raise OSError(f"Proxy refused CONNECT to {target}: {parts[1]} {reason}".rstrip())
+
+    def connect(self):
+        phase = "connect"
+        t0 = time.perf_counter()
+        try:
+            port = self.proxy["port"] if self.proxy else self.port
+            sock = socket.create_connection((self.ip, port), self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            t1 = time.perf_counter()
+            self.phases["connect_ms"] = _ms(t1 - t0)
+            if self.proxy:
+                phase = "proxy"
+                self._open_tunnel(sock)
+                t2 = time.perf_counter()
+                self.phases["proxy_ms"] = _ms(t2 - t1)
+                t1 = t2
+            phase = "tls"
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host, session=self.tls_session)
+            self.phases["tls_ms"] = _ms(time.perf_counter() - t1)
+            # http.client drops self.sock on "Connection: close"; keep the TLS details
+            self.tls_sock = self.sock
+            self.tls_version = self.sock.version()
+        except Exception as e:
+            raise PhaseError(phase, e, dict(self.phases))
+
+
+class HostSession:
+    """Per-host:port HTTPS state shared across probes and runs: one SSL
+    context (certificate store loaded once) and the latest TLS session,
+    which later connections offer for resumption."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.context = ssl.create_default_context()
+        self.tls_session = None
+
+    def connection(self, ip, timeout, resume=False, proxy=None):
+        return _TimedHTTPSConnection(self.host, self.port, ip, self.context, timeout,
+                                     tls_session=self.tls_session if resume else None, proxy=proxy)
+
+    def remember(self, conn):
+        """Keep `conn`'s TLS session (TLS 1.3 tickets arrive after the handshake)."""
+        try:
+            if conn.tls_sock is not None and conn.tls_sock.session is not None:
+                self.tls_session = conn.tls_sock.session
+        except (ValueError, OSError, AttributeError):
+            pass
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session_for(host, port):
+    key = (host.lower(), int(port))
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = HostSession(host, int(port))
+        return session
+
+
+def _exchange(conn, method, path, timeout):
+    """One request on `conn`; returns (response, body_bytes, ttfb_ms, transfer_ms).
+
+    TTFB is measured from sending the request to receiving the status line
+    and headers. GETs ask for a single byte; servers that ignore Range have
+    their body read up to MAX_BODY and the connection is then dropped.
+    """
+    headers = {"User-Agent": USER_AGENT, "Accept": "*/*", "Connection": "keep-alive"}
+    if method == "GET":
+        headers["Range"] = "bytes=0-0"
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    try:
+        t0 = time.perf_counter()
+        conn.request(method, path, headers=headers)
+        resp = conn.getresponse()
+        t1 = time.perf_counter()
+    except PhaseError:
+        raise
+    except Exception as e:
+        raise PhaseError("http", e, {})
+    try:
+        body = resp.read(MAX_BODY)
+        if not resp.isclosed():
+            resp.close()
+            conn.close()
+    except Exception as e:
+        raise PhaseError("http", e, {})
+    return resp, body, _ms(t1 - t0), _ms(time.perf_counter() - t1)
+
+
+def _request(conn, method, path, timeout):
+    """Send `method` (falling back to a ranged GET if HEAD is refused); returns (response, method, timing)."""
+    timing = {}
+    if conn.sock is None:
+        conn.connect()
+        timing = dict(conn.phases)
+    resp, body, ttfb, transfer = _exchange(conn, method, path, timeout)
+    if method == "HEAD" and resp.status in (405, 501):
+        method = "GET"
+        if conn.sock is None:
+            conn.connect()
+            timing = dict(conn.phases)
+        resp, body, ttfb, transfer = _exchange(conn, method, path, timeout)
+    timing.update(ttfb_ms=ttfb, transfer_ms=transfer, bytes=len(body))
+    return resp, method, timing
+
+
+def measure(host, port=443, path="/", timeout=5, method="HEAD", warm=True, resumed=True):
+    """Time an HTTPS request phase by phase, cold and then warm.
+
+    cold:    DNS (from the shared cache, `dns_cached` says whether it was a
+             hit) + TCP connect + full TLS handshake + request
+    warm:    the same request again on the kept-alive connection
+    resumed: a new TCP connection resuming the cold handshake's TLS session
+             (`tls_resumed` says whether the server accepted it)
+
+    When HTTPS_PROXY applies to `host` (see proxy_for), DNS and connect
+    time the proxy, `proxy_ms` times the CONNECT tunnel and `proxy` names it.
+
+    Times are floats in milliseconds from time.perf_counter(). Raises
+    PhaseError if the cold request fails; warm/resumed failures are
+    reported in their own entry instead.
+    """
+    session = session_for(host, port)
+    proxy = proxy_for(host)
+    dial = proxy["host"] if proxy else host
+    cache = dns_cache.get_cache()
+    t0 = time.perf_counter()
+    dns_cached = dns_cache.is_ip_literal(dial) or cache.get(dial) is not None
+    try:
+        ip = cache.resolve(dial, timeout=timeout)[0]
+    except Exception as e:
+        raise PhaseError("dns", e, {"dns_ms": _ms(time.perf_counter() - t0)})
+    dns_ms = _ms(time.perf_counter() - t0)
+
+    conn = session.connection(ip, timeout, proxy=proxy)
+    try:
+        resp, method, cold = _request(conn, method, path, timeout)
+    except PhaseError as e:
+        conn.close()
+        e.timing = {**conn.phases, **(e.timing or {}), "dns_ms": dns_ms}
+        raise
+    session.remember(conn)
+    cold = dict(cold, dns_ms=dns_ms, dns_cached=dns_cached,
+                total_ms=round(dns_ms + cold.get("connect_ms", 0) + cold.get("proxy_ms", 0)
+                               + cold.get("tls_ms", 0) + cold["ttfb_ms"] + cold["transfer_ms"], 2))
+    out = {
+        "http_status": resp.status,
+        "location": resp.getheader("Location"),
+        "server": resp.getheader("Server"),
+        "method": method,
+        "tls_version": conn.tls_version,
+        "ip": ip,
+        "timing": cold,
+    }
+    if proxy:
+        out["proxy"] = f"{proxy['host']}:{proxy['port']}"
+
+    if warm:
+        if conn.sock is None:
+            out["warm"] = {"error": "Server closed the connection (no keep-alive)", "phase": "http"}
+        else:
+            try:
+                _, _, t = _request(conn, method, path, timeout)
+                out["warm"] = dict(t, reused=True, total_ms=round(t["ttfb_ms"] + t["transfer_ms"], 2))
+            except PhaseError as e:
+                out["warm"] = {"error": str(e), "phase": e.phase}
+    conn.close()
+
+    if resumed and session.tls_session is not None:
+        rconn = session.connection(ip, timeout, resume=True, proxy=proxy)
+        try:
+            _, _, t = _request(rconn, method, path, timeout)
+            t["tls_resumed"] = bool(rconn.tls_sock is not None and rconn.tls_sock.session_reused)
+            t["total_ms"] = round(t.get("connect_ms", 0) + t.get("proxy_ms", 0) + t.get("tls_ms", 0)
+                                  + t["ttfb_ms"] + t["transfer_ms"], 2)
+            out["resumed"] = t
+            session.remember(rconn)
+        except PhaseError as e:
+            out["resumed"] = {"error": str(e), "phase": e.phase}
+        finally:
+            rconn.close()
+    return out
@@ -0,0 +1,293 @@
+import math
+import os
+import selectors
+import socket
+import struct
+import time
+
+import udp_errors
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP6_ECHO_REQUEST = 128
+ICMP6_ECHO_REPLY = 129
+_ICMP_HEADER = struct.Struct("!BBHHH")
+
+DEFAULT_COUNT = 4
+DEFAULT_INTERVAL = 0.2
+DEFAULT_TIMEOUT = 1.0
+PAYLOAD_SIZE = 56
+
+_ERROR_NAMES = {
+    (socket.AF_INET, 3): "Destination unreachable",
+    (socket.AF_INET, 11): "Time to live exceeded",
+    (socket.AF_INET6, 1): "Destination unreachable",
+    (socket.AF_INET6, 3): "Hop limit exceeded",
+}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def open_socket(family):
+    """Non-blocking ICMP socket for `family` as (socket, kind).
+
+    Unprivileged ping sockets ("dgram") are tried first: Linux allows them
+    for groups in net.ipv4.ping_group_range, macOS always. Raw sockets
+    ("raw") need root or CAP_NET_RAW. Raises the last OSError if neither
+    can be opened.
+    """
+    proto = socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+    error = None
+    for kind, sock_type in (("dgram", socket.SOCK_DGRAM), ("raw", socket.SOCK_RAW)):
+        try:
+            s = socket.socket(family, sock_type, proto)
+        except OSError as e:
+            error = e
+            continue
+        s.setblocking(False)
+        if kind == "dgram":
+            udp_errors.enable(s)
+        return s, kind
+    raise error
+
+
+def echo_request(family, ident, seq, payload):
+    kind = ICMP_ECHO_REQUEST if family == socket.AF_INET else ICMP6_ECHO_REQUEST
+    header = _ICMP_HEADER.pack(kind, 0, 0, ident, seq)
+    # The kernel fills in the ICMPv6 checksum (it covers the IPv6 pseudo-header)
+    csum = checksum(header + payload) if family == socket.AF_INET else 0
+    return _ICMP_HEADER.pack(kind, 0, csum, ident, seq) + payload
+
+
+def parse(family, data):
+    """("reply", ident, seq, payload) or ("error", ident, seq, (type, code)) for our echoes, else None.
+
+    Errors quoting an echo request only arrive in-band on raw sockets; ping
+    sockets get them through the error queue instead.
+    """
+    if family == socket.AF_INET and data and data[0] >> 4 == 4:
+        data = data[(data[0] & 0x0f) * 4:]  # raw (and macOS dgram) sockets include the IP header
+    if len(data) < _ICMP_HEADER.size:
+        return None
+    kind, code, _, ident, seq = _ICMP_HEADER.unpack_from(data)
+    if kind == (ICMP_ECHO_REPLY if family == socket.AF_INET else ICMP6_ECHO_REPLY):
+        return "reply", ident, seq, data[_ICMP_HEADER.size:]
+    if (family, kind) not in _ERROR_NAMES:
+        return None
+    quoted = data[_ICMP_HEADER.size:]
+    if family == socket.AF_INET:
+        if not quoted:
+            return None
+        quoted = quoted[(quoted[0] & 0x0f) * 4:]
+        request = ICMP_ECHO_REQUEST
+    else:
+        quoted = quoted[40:]
+        request = ICMP6_ECHO_REQUEST
+    if len(quoted) < _ICMP_HEADER.size or quoted[0] != request:
+        return None
+    _, _, _, q_ident, q_seq = _ICMP_HEADER.unpack_from(quoted)
+    return "error", q_ident, q_seq, (kind, code)
+
+
+def _icmp_error(family, kind, code, offender):
+    return {"errno": None, "error": f"{_ERROR_NAMES[(family, kind)]} (code {code})",
+            "origin": "icmp" if family == socket.AF_INET else "icmp6",
+            "icmp_type": kind, "icmp_code": code, "offender": offender}
+
+
+def rtt_stats(samples):
+    """min/avg/max/stddev (population, like ping's mdev) of the received RTTs, or None."""
+    rtts = [s for s in samples if s is not None]
+    if not rtts:
+        return None
+    avg = sum(rtts) / len(rtts)
+    return {"min": min(rtts), "avg": round(avg, 2), "max": max(rtts),
+            "stddev": round(math.sqrt(sum((r - avg) ** 2 for r in rtts) / len(rtts)), 2)}
+
+
+def ping_many(addrs, count=DEFAULT_COUNT, interval=DEFAULT_INTERVAL, timeout=DEFAULT_TIMEOUT,
+              payload_size=PAYLOAD_SIZE, on_outcome=None, cancel=None):
+    """Ping every (family, ip) in `addrs` concurrently from one ICMP socket per family.
+
+    Each target gets `count` echo requests `interval` seconds apart, with
+    the targets' first packets spread across one interval so they do not
+    leave as a single burst. A packet is lost `timeout` seconds after it
+    was sent. Replies are matched by sequence number (unique per socket)
+    and a per-run payload token, so concurrent pings elsewhere on the
+    host are ignored.
+
+    Outcomes (dicts, in input order, also passed to on_outcome(i, outcome)):
+      samples:  RTT in ms per packet, None if lost
+      sent, received, loss_pct, rtt (see rtt_stats)
+      errors:   ICMP error dicts (see udp_errors) in arrival order
+      method:   "icmp-dgram" or "icmp-raw"
+      socket_error: the OSError if no ICMP socket could be opened
+      cancelled: True if `cancel` fired first; the other fields then cover
+                 the packets answered or lost so far (those still in flight
+                 are left out rather than counted as lost)
+    """
+    outcomes = [None] * len(addrs)
+    n = len(addrs)
+    token = os.urandom(8)
+    payload = (token * (payload_size // 8 + 1))[:max(payload_size, 8)]
+    ident = int.from_bytes(os.urandom(2), "big")
+    sockets = {}
+    sel = selectors.DefaultSelector()
+    in_flight = {}
+    state = {}
+    seqs = {}
+
+    def _finish(i, cancelled=False):
+        st = state.pop(i)
+        for seq in st["seqs"]:
+            in_flight.pop((addrs[i][0], seq), None)
+        samples = [s for k, s in enumerate(st["samples"]) if k not in st["pending"]]
+        sent = len(samples)
+        received = sum(1 for s in samples if s is not None)
+        outcome = {"samples": samples, "sent": sent, "received": received,
+                   "loss_pct": round(100.0 * (sent - received) / sent, 1) if sent else 100.0,
+                   "rtt": rtt_stats(samples), "errors": st["errors"], "method": st["method"]}
+        if cancelled:
+            outcome["cancelled"] = True
+        outcomes[i] = outcome
+        if on_outcome:
+            on_outcome(i, outcome)
+
+    def _fail(i, outcome):
+        outcomes[i] = outcome
+        if on_outcome:
+            on_outcome(i, outcome)
+
+    def _socket(family):
+        if family not in sockets:
+            try:
+                s, kind = open_socket(family)
+            except OSError as e:
+                sockets[family] = e
+            else:
+                sel.register(s, selectors.EVENT_READ, family)
+                sockets[family] = (s, kind)
+        return sockets[family]
+
+    def _lost(i, k, err):
+        st = state[i]
+        st["samples"][k] = None
+        st["pending"].discard(k)
+        if err is not None:
+            st["errors"].append(err)
+
+    def _send(i):
+        family, ip = addrs[i]
+        st = state[i]
+        k = st["sent"]
+        seq = seqs[family] = (seqs.get(family, 0) + 1) & 0xffff
+        s, _ = sockets[family]
+        st["sent"] += 1
+        st["samples"].append(None)
+        st["seqs"].append(seq)
+        try:
+            sent_at = time.monotonic()
+            s.sendto(echo_request(family, ident, seq, payload), (ip, 0))
+        except OSError as e:
+            _lost(i, k, udp_errors.from_exception(e))
+            return
+        st["pending"].add(k)
+        st["sent_at"][k] = sent_at
+        in_flight[(family, seq)] = (i, k)
+
+    def _receive(family, s, kind):
+        now = time.monotonic()
+        # Ping sockets: the queued payload is the echo request the error quotes
+        for _, err, data in udp_errors.drain(s):
+            if len(data) < _ICMP_HEADER.size:
+                continue
+            match = in_flight.pop((family, _ICMP_HEADER.unpack_from(data)[4]), None)
+            if match and match[0] in state:
+                _lost(match[0], match[1], err)
+        while True:
+            try:
+                data, src = s.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            parsed = parse(family, data)
+            if parsed is None:
+                continue
+            what, r_ident, seq, extra = parsed
+            # Ping sockets rewrite the identifier to their local port; only raw sockets see other processes' echoes
+            if kind == "raw" and r_ident != ident:
+                continue
+            match = in_flight.get((family, seq))
+            if match is None or match[0] not in state:
+                continue
+            if what == "reply" and extra[:8] != token:
+                continue
+            del in_flight[(family, seq)]
+            i, k = match
+            if what == "reply":
+                state[i]["samples"][k] = _ms(now - state[i]["sent_at"][k])
+                state[i]["pending"].discard(k)
+            else:
+                _lost(i, k, _icmp_error(family, extra[0], extra[1], src[0]))
+
+    start = time.monotonic()
+    for i, (family, ip) in enumerate(addrs):
+        sock = _socket(family)
+        if isinstance(sock, OSError):
+            _fail(i, {"socket_error": sock})
+            continue
+        state[i] = {"first": start + interval * i / max(n, 1), "sent": 0, "samples": [], "seqs": [],
+                    "sent_at": {}, "pending": set(), "errors": [], "method": f"icmp-{sock[1]}"}
+
+    try:
+        while state:
+            if cancel is not None and cancel.cancelled:
+                for i in list(state):
+                    _finish(i, cancelled=True)
+                break
+            now = time.monotonic()
+            wake = now + 1
+            for i in list(state):
+                st = state[i]
+                if st["sent"] < count and now >= st["first"] + st["sent"] * interval:
+                    _send(i)
+                for k in list(st["pending"]):
+                    if now >= st["sent_at"][k] + timeout:
+                        _lost(i, k, None)
+                    else:
+                        wake = min(wake, st["sent_at"][k] + timeout)
+                if st["sent"] >= count and not st["pending"]:
+                    _finish(i)
+                    continue
+                if st["sent"] < count:
+                    wake = min(wake, st["first"] + st["sent"] * interval)
+            if not state:
+                break
+            wait = max(wake - time.monotonic(), 0)
+            if cancel is not None:
+                wait = min(wait, 0.25)
+            for key, _ in sel.select(wait):
+                _receive(key.data, *sockets[key.data])
+                for i in [i for i, st in state.items() if st["sent"] >= count and not st["pending"]]:
+                    _finish(i)
+    finally:
+        for sock in sockets.values():
+            if not isinstance(sock, OSError):
+                try:
+                    sock[0].close()
+                except OSError:
+                    pass
+        sel.close()
+    return outcomes
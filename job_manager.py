@@ -0,0 +1,206 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from network_tests import CancelToken
+
+MAX_FINISHED_JOBS = 20
+MAX_FINISHED_AGE = 3600
+
+
+def new_job_id():
+    return f"job-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+
+def _summary(results):
+    """Per-category PASS/WARN/FAIL/SKIPPED counts for the final event."""
+    counts = {}
+    for category, value in (results or {}).items():
+        if category.startswith("_") or not value:
+            continue
+        for r in (value if isinstance(value, list) else [value]):
+            status = (r or {}).get("status") or "UNKNOWN"
+            counts.setdefault(category, {}).setdefault(status, 0)
+            counts[category][status] += 1
+    return counts
+
+
+class JobManager:
+    """Registry of test jobs with a single-runner admission queue.
+
+    Only one suite runs at a time: two suites (and two speedtests) at once
+    corrupt each other's numbers. A start that arrives while a job is queued
+    or running attaches to it unless coalesce=False, in which case a new job
+    is queued behind it. Finished jobs are evicted once there are more than
+    `max_finished` of them (least recently read first) or once they are
+    older than `max_age` seconds.
+
+    Each job also keeps an ordered event log (probe results, progress ticks
+    and a final "done" event) that SSE clients read with events_since().
+    Events are serialized once, when published.
+    """
+
+    def __init__(self, runner, max_finished=MAX_FINISHED_JOBS, max_age=MAX_FINISHED_AGE):
+        self._runner = runner
+        self.max_finished = max_finished
+        self.max_age = max_age
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        while True:
+            jid = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(jid)
+                if job is None:
+                    continue
+                job["state"] = "running"
+                job["started"] = time.time()
+                cancel = job["cancel"]
+                skip = cancel.cancelled
+                # The deadline covers the run itself, not time spent queued
+                if job.get("deadline_seconds") and not skip:
+                    cancel.deadline = time.monotonic() + float(job["deadline_seconds"])
+            try:
+                if not skip:
+                    self._runner(jid)
+            except Exception as e:
+                print(f"Job {jid} failed: {e}")
+            finally:
+                with self._lock:
+                    if skip:
+                        job["cancelled"] = cancel.reason
+                    job["done"] = True
+                    job["state"] = "done"
+                    job["finished"] = time.time()
+                    self._append_event(job, "done", {
+                        "progress": job.get("progress", 0) if job.get("cancelled") else 100,
+                        "cancelled": job.get("cancelled"),
+                        "summary": _summary(job.get("results")),
+                    })
+                    self._evict()
+
+    def _active(self):
+        for jid, job in reversed(self._jobs.items()):
+            if job.get("state") in ("queued", "running"):
+                return jid, job
+        return None, None
+
+    def _evict(self):
+        now = time.time()
+        finished = [(jid, j) for jid, j in self._jobs.items() if j.get("state") == "done"]
+        for jid, j in finished:
+            if now - (j.get("finished") or now) > self.max_age:
+                del self._jobs[jid]
+        finished = [jid for jid, j in self._jobs.items() if j.get("state") == "done"]
+        for jid in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[jid]
+
+    def start(self, coalesce=True, deadline_seconds=None):
+        """Admit a start request. Returns (job_id, attached)."""
+        with self._lock:
+            if coalesce:
+                jid, job = self._active()
+                if job is not None:
+                    job["attached"] = job.get("attached", 0) + 1
+                    self._jobs.move_to_end(jid)
+                    return jid, True
+            jid = new_job_id()
+            self._jobs[jid] = {
+                "state": "queued",
+                "progress": 0,
+                "done": False,
+                "results": None,
+                "queued": time.time(),
+                "started": None,
+                "deadline_seconds": deadline_seconds,
+                "cancel": CancelToken(),
+                "cancelled": None,
+                "attached": 0,
+                "events": [],
+            }
+            self._evict()
+            self._ensure_worker()
+        self._queue.put(jid)
+        return jid, False
+
+    def get(self, jid):
+        """Shallow copy of the job's fields (None if unknown or evicted)."""
+        with self._lock:
+            job = self._jobs.get(jid)
+            if job is None:
+                return None
+            self._jobs.move_to_end(jid)
+            return dict(job)
+
+    def update(self, jid, **fields):
+        with self._lock:
+            job = self._jobs.get(jid)
+            if job is not None:
+                job.update(fields)
+
+    def _append_event(self, job, event, data):
+        eid = len(job["events"]) + 1
+        payload = f"id: {eid}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        job["events"].append(payload)
+        self._changed.notify_all()
+
+    def publish(self, jid, event, data):
+        """Append an event to the job's log and wake any waiting streams."""
+        with self._lock:
+            job = self._jobs.get(jid)
+            if job is not None and job.get("state") != "done":
+                self._append_event(job, event, data)
+
+    def events_since(self, jid, last_id=0, timeout=15):
+        """Wait up to `timeout` for events after `last_id`.
+
+        Returns (events, finished), where events is a list of (id, payload)
+        with the payload already formatted as an SSE frame, or (None, True)
+        if the job is unknown or has been evicted.
+        """
+        with self._lock:
+            deadline = time.monotonic() + timeout
+            while True:
+                job = self._jobs.get(jid)
+                if job is None:
+                    return None, True
+                events = job["events"]
+                if len(events) > last_id or job.get("state") == "done":
+                    break
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._changed.wait(left)
+            new = [(i + 1, events[i]) for i in range(max(last_id, 0), len(events))]
+            return new, job.get("state") == "done"
+
+    def cancel(self, jid):
+        """Cancel a queued/running job. Returns "cancelled", "finished" or "not_found"."""
+        with self._lock:
+            job = self._jobs.get(jid)
+            if job is None:
+                return "not_found"
+            if job.get("done"):
+                return "finished"
+            job["cancel"].cancel("cancelled")
+            return "cancelled"
+
+    def active_job_id(self):
+        with self._lock:
+            return self._active()[0]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
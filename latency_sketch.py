@@ -0,0 +1,70 @@
+import json
+import math
+
+# Relative accuracy of quantile estimates: a reported p95 of 40 ms means the
+# true p95 is within 40 ms +/- 1%. 1% keeps a typical latency range
+# (0.1 ms .. 10 s) to a few hundred bins at most.
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1e-3
+
+
+class LatencySketch:
+    """Mergeable streaming quantile sketch (log-bucketed histogram, DDSketch style).
+
+    Each value lands in bin ceil(log_gamma(value)); quantiles read back the
+    bin midpoint, so every estimate is within RELATIVE_ACCURACY of a real
+    sample. Sketches merge by adding bin counts, which is what lets hourly
+    buckets roll up into days (and trend queries span many buckets) without
+    keeping the raw samples. Values at or below MIN_VALUE share one bin.
+    """
+
+    def __init__(self, bins=None, zero=0, alpha=RELATIVE_ACCURACY):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = dict(bins or {})
+        self.zero = zero
+
+    def __len__(self):
+        return self.zero + sum(self.bins.values())
+
+    def add(self, value, count=1):
+        if value is None:
+            return
+        if value <= MIN_VALUE:
+            self.zero += count
+            return
+        key = int(math.ceil(math.log(value) / self._log_gamma))
+        self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, other):
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero += other.zero
+        return self
+
+    def quantile(self, q):
+        """Estimated q-quantile (0..1), or None for an empty sketch."""
+        total = len(self)
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_json(self):
+        return json.dumps({'z': self.zero, 'b': {str(k): v for k, v in self.bins.items()}},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        if not text:
+            return cls()
+        data = json.loads(text)
+        return cls({int(k): v for k, v in data.get('b', {}).items()}, data.get('z', 0))
@@ -1,9 +1,81 @@
-import socket, subprocess, time, requests, os, json, random
+import socket, subprocess, time, requests, os, json, random, queue, threading
 from concurrent.futures import ThreadPoolExecutor
 import asyncio
+import errno
+import selectors
 import ssl
-import struct
 from urllib.parse import urlparse
+import dns_cache
+import dns_client
+import https_probe
+import icmp_probe
+import ntp_probe
+import quic_probe
+import udp_errors
+import udp_scan
+from adaptive_timeouts import AdaptiveTimeoutPolicy
+
+
+class RunCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """Cooperative cancellation for one test run, with an optional run-wide deadline (seconds from now)."""
+
+    def __init__(self, deadline=None):
+        self._event = threading.Event()
+        self.reason = None
+        self.deadline = (time.monotonic() + float(deadline)) if deadline else None
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if self.deadline is not None and not self._event.is_set() and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def remaining(self, timeout=None):
+        """`timeout` capped to the time left before the deadline (None if neither applies)."""
+        if self.deadline is None:
+            return timeout
+        left = max(self.deadline - time.monotonic(), 0.05)
+        return left if timeout is None else min(timeout, left)
+
+    def check(self):
+        if self.cancelled:
+            raise RunCancelled(self.reason)
+
+    def wait(self, seconds):
+        """Sleep up to `seconds`; returns True if the run was cancelled meanwhile."""
+        if self._event.wait(self.remaining(seconds)):
+            return True
+        return self.cancelled
+
+
+def _cancelled_result(target, reason, label=None):
+    r = {
+        "target": target,
+        "status": "SKIPPED",
+        "root_cause": f"job:{reason}",
+        "note": "Not run: job deadline reached" if reason == "deadline" else "Not run: job was cancelled",
+    }
+    if label:
+        r["label"] = label
+    return r
+
+
+def _partial_result(r, reason):
+    """Mark `r`, built from what a probe collected before the job stopped it, as partial."""
+    stopped = "Stopped early: job deadline reached" if reason == "deadline" else "Stopped early: job was cancelled"
+    r["partial"] = True
+    r["cancelled"] = reason
+    r["note"] = f"{r['note']}; {stopped}" if r.get("note") else stopped
+    return r
 
 
 def _expand_dns_targets(targets):
@@ -36,14 +108,14 @@ def _expand_dns_targets(targets):
         out.append(item)
     return out
 
-def resolve_dns(name, timeout=3):
+def resolve_dns(name, timeout=3, cache=None):
+    """Fresh lookup of `name`; the answer (or failure) is stored in the shared DNS cache for later stages."""
+    cache = cache or dns_cache.get_cache()
     start=time.time()
-    try:
-        socket.setdefaulttimeout(timeout)
-        ip=socket.gethostbyname(name)
-        return {"target":name,"status":"PASS","ip":ip,"latency_ms":int((time.time()-start)*1000)}
-    except Exception as e:
-        return {"target":name,"status":"FAIL","error":str(e)}
+    addrs, err = cache.refresh(name, timeout=timeout)
+    if err is not None:
+        return {"target":name,"status":"FAIL","error":str(err)}
+    return {"target":name,"status":"PASS","ip":addrs[0],"addresses":addrs,"latency_ms":int((time.time()-start)*1000)}
 
 
 def _classify_connect_error(err):
@@ -73,74 +145,466 @@ def _classify_connect_error(err):
 def tcp_check(host, port, timeout=8, label=None, verify_tls=False):
     """Enhanced TCP check with optional TLS validation to match Dock behavior"""
     start=time.time()
-    s=socket.socket(socket.AF_INET, socket.SOCK_STREAM); s.settimeout(timeout)
+    s=None
     try:
-        s.connect((host,int(port)))
+        ip = dns_cache.get_cache().resolve(host)[0]
+        s=socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM); s.settimeout(timeout)
+        s.connect((ip,int(port)))
         latency_ms = int((time.time()-start)*1000)
         
-        # For HTTPS ports (443), verify TLS handshake like the Dock does
-        if verify_tls and int(port) == 443:
-            try:
-                # Wrap socket with TLS - mimics Dock's secure connection
-                context = ssl.create_default_context()
-                # Dock validates certificates - we should too
-                context.check_hostname = True
-                context.verify_mode = ssl.CERT_REQUIRED
-                
-                with context.wrap_socket(s, server_hostname=host) as ssock:
-                    # Verify we can complete TLS handshake
-                    cert = ssock.getpeercert()
-                    tls_version = ssock.version()
-                    r={"target":f"{host}:{port}","status":"PASS","latency_ms":latency_ms,
-                       "tls_version":tls_version,"cert_valid":True}
-            except ssl.SSLError as ssl_err:
-                r={"target":f"{host}:{port}","status":"FAIL","error":f"TLS Error: {str(ssl_err)}",
-                   "latency_ms":latency_ms}
-            except Exception as tls_err:
-                r={"target":f"{host}:{port}","status":"FAIL","error":f"TLS Validation Failed: {str(tls_err)}",
-                   "latency_ms":latency_ms}
-        else:
-            s.shutdown(socket.SHUT_RDWR)
-            r={"target":f"{host}:{port}","status":"PASS","latency_ms":latency_ms}
-        
+        r = _tcp_connected_result(s, host, port, latency_ms, verify_tls)
         if label: r["label"]=label
         return r
     except Exception as e:
-        failure_mode, hint = _classify_connect_error(e)
-        r={"target":f"{host}:{port}","status":"FAIL","error":str(e),"failure_mode":failure_mode,"hint":hint}
-        if label: r["label"]=label
-        return r
+        return _tcp_failed_result(host, port, e, label)
     finally:
         try: s.close()
         except: pass
 
-def ping(host, count=2):
+
+def _tcp_connected_result(s, host, port, latency_ms, verify_tls):
+    # For HTTPS ports (443), verify TLS handshake like the Dock does
+    if verify_tls and int(port) == 443:
+        try:
+            # Wrap socket with TLS - mimics Dock's secure connection
+            context = ssl.create_default_context()
+            # Dock validates certificates - we should too
+            context.check_hostname = True
+            context.verify_mode = ssl.CERT_REQUIRED
+
+            with context.wrap_socket(s, server_hostname=host) as ssock:
+                # Verify we can complete TLS handshake
+                cert = ssock.getpeercert()
+                tls_version = ssock.version()
+                return {"target":f"{host}:{port}","status":"PASS","latency_ms":latency_ms,
+                        "tls_version":tls_version,"cert_valid":True}
+        except ssl.SSLError as ssl_err:
+            return {"target":f"{host}:{port}","status":"FAIL","error":f"TLS Error: {str(ssl_err)}",
+                    "latency_ms":latency_ms}
+        except Exception as tls_err:
+            return {"target":f"{host}:{port}","status":"FAIL","error":f"TLS Validation Failed: {str(tls_err)}",
+                    "latency_ms":latency_ms}
+    s.shutdown(socket.SHUT_RDWR)
+    return {"target":f"{host}:{port}","status":"PASS","latency_ms":latency_ms}
+
+
+def _tcp_failed_result(host, port, err, label=None):
+    failure_mode, hint = _classify_connect_error(err)
+    r={"target":f"{host}:{port}","status":"FAIL","error":str(err),"failure_mode":failure_mode,"hint":hint}
+    if label: r["label"]=label
+    return r
+
+
+def _resolve_tcp_addrs(hosts, timeout=3):
+    """Resolve each distinct host once (concurrently) via the DNS cache. Returns {host: (family, ip) or exception}."""
+    cache = dns_cache.get_cache()
+
+    def _one(host):
+        try:
+            ip = cache.resolve(host, timeout=timeout)[0]
+            return (socket.AF_INET6 if ':' in ip else socket.AF_INET), ip
+        except Exception as e:
+            return e
+
+    hosts = [h for h in dict.fromkeys(hosts) if h]
+    if not hosts:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(16, len(hosts))) as ex:
+        return dict(zip(hosts, ex.map(_one, hosts)))
+
+
+# TLS handshakes verified concurrently per tcp_check_many() call
+TLS_HANDSHAKE_WORKERS = 16
+
+
+def tcp_check_many(targets, timeout=8, max_in_flight=256, on_result=None, timeout_for=None, cancel=None):
+    """Connect to many TCP targets at once from a single thread.
+
+    Every connect is started non-blocking and completion is awaited with
+    selectors (epoll on Linux), so N filtered ports cost one timeout window
+    rather than N. TLS verification (verify_tls on port 443) is handed to a
+    small worker pool so a slow handshake does not hold up other connects.
+
+    `targets` is a list of dicts with host/port and optional label/verify_tls,
+    like the "tcp" target list. Results have the same shape as tcp_check()
+    and are returned in input order; `on_result` (if given) is called with
+    (result, target) as soon as each result is known.
+
+    `timeout_for(target)` (optional) returns the connect timeout in seconds
+    for a target. It is re-evaluated while connects are pending, so an
+    adaptive policy fed by on_result can shorten the deadline of blocked
+    ports as soon as the reachable ones have answered. If `cancel` (a
+    CancelToken) fires, pending and unstarted connects are reported as
+    skipped without waiting out their timeouts.
+    """
+    targets = list(targets or [])
+    results = [None] * len(targets)
+
+    def _timeout(i):
+        return timeout_for(targets[i]) if timeout_for else timeout
+
+    def _finish(i, r):
+        label = targets[i].get("label")
+        if label and "label" not in r:
+            r["label"] = label
+        r["timeout_ms"] = int(_timeout(i) * 1000)
+        results[i] = r
+        if on_result:
+            on_result(r, targets[i])
+
+    addrs = _resolve_tcp_addrs([t.get("host") for t in targets])
+    waiting = list(range(len(targets)))
+    waiting.reverse()
+    pending = {}
+    sel = selectors.DefaultSelector()
+    tls_pool = None
+
+    def _start(i):
+        t = targets[i]
+        host, port = t.get("host"), t.get("port")
+        try:
+            addr = addrs.get(host)
+            if addr is None:
+                raise OSError("No host specified")
+            if isinstance(addr, Exception):
+                raise addr
+            family, ip = addr
+            s = socket.socket(family, socket.SOCK_STREAM)
+        except Exception as e:
+            _finish(i, _tcp_failed_result(host, port, e))
+            return
+        try:
+            s.setblocking(False)
+            start = time.monotonic()
+            err = s.connect_ex((ip, int(port)))
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                raise OSError(err, os.strerror(err))
+            sel.register(s, selectors.EVENT_WRITE, i)
+            pending[i] = (s, start)
+        except Exception as e:
+            s.close()
+            _finish(i, _tcp_failed_result(host, port, e))
+
+    def _handshake(i, s, latency_ms):
+        t = targets[i]
+        try:
+            _finish(i, _tcp_connected_result(s, t.get("host"), t.get("port"), latency_ms, True))
+        except Exception as e:
+            _finish(i, _tcp_failed_result(t.get("host"), t.get("port"), e))
+        finally:
+            try: s.close()
+            except: pass
+
+    def _complete(i, s, start, connected_at):
+        nonlocal tls_pool
+        t = targets[i]
+        host, port = t.get("host"), t.get("port")
+        try:
+            err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise OSError(err, os.strerror(err))
+            # Timed from when the selector saw the connect finish, not from when this loop got to it
+            latency_ms = int((connected_at - start) * 1000)
+            if t.get("verify_tls", False) and int(port) == 443:
+                # The TLS handshake blocks, so it runs off the selector loop
+                s.setblocking(True)
+                s.settimeout(max(_timeout(i) - (time.monotonic() - start), 1))
+                if tls_pool is None:
+                    tls_pool = ThreadPoolExecutor(max_workers=TLS_HANDSHAKE_WORKERS)
+                tls_pool.submit(_handshake, i, s, latency_ms)
+                return
+            _finish(i, _tcp_connected_result(s, host, port, latency_ms, False))
+        except Exception as e:
+            _finish(i, _tcp_failed_result(host, port, e))
+        try: s.close()
+        except: pass
+
+    try:
+        while waiting or pending:
+            if cancel is not None and cancel.cancelled:
+                for i in list(pending) + waiting:
+                    if i in pending:
+                        s, _ = pending.pop(i)
+                        sel.unregister(s)
+                        s.close()
+                    t = targets[i]
+                    _finish(i, _cancelled_result(f"{t.get('host')}:{t.get('port')}", cancel.reason))
+                waiting = []
+                break
+            while waiting and len(pending) < max_in_flight:
+                _start(waiting.pop())
+            if not pending:
+                continue
+            now = time.monotonic()
+            next_deadline = min(start + _timeout(i) for i, (_, start) in pending.items())
+            wait = max(next_deadline - now, 0)
+            if cancel is not None:
+                wait = min(wait, 0.25)
+            events = sel.select(wait)
+            fired = time.monotonic()
+            for key, _ in events:
+                i = key.data
+                s, start = pending.pop(i)
+                sel.unregister(s)
+                _complete(i, s, start, fired)
+            now = time.monotonic()
+            for i, (s, start) in list(pending.items()):
+                if now - start >= _timeout(i):
+                    del pending[i]
+                    sel.unregister(s)
+                    s.close()
+                    t = targets[i]
+                    _finish(i, _tcp_failed_result(t.get("host"), t.get("port"), socket.timeout("timed out")))
+    finally:
+        for s, _ in pending.values():
+            try: s.close()
+            except: pass
+        sel.close()
+        if tls_pool is not None:
+            tls_pool.shutdown(wait=True)
+    return results
+
+PING_TIMEOUT_HINT = ("Ping timed out. ICMP is commonly blocked on enterprise networks and many cloud IPs; "
+                     "validate reachability using TCP/HTTPS to the required ports instead.")
+PING_ERROR_HINTS = {
+    "filtered": "ICMP administratively prohibited: a firewall or ACL is rejecting pings to this host.",
+    "unreachable": "No route / host unreachable. Check default gateway, VLAN routing, or upstream ACLs.",
+    "local": "The local network stack refused to send the ping (local firewall or interface down).",
+}
+
+
+def _ping_summary(outcome):
+    """ping(8)-style two-line summary, kept as `output` for exports."""
+    lines = [f"{outcome['sent']} packets transmitted, {outcome['received']} received, "
+             f"{outcome['loss_pct']:g}% packet loss"]
+    rtt = outcome.get("rtt")
+    if rtt:
+        lines.append(f"rtt min/avg/max/stddev = {rtt['min']}/{rtt['avg']}/{rtt['max']}/{rtt['stddev']} ms")
+    return "\n".join(lines)
+
+
+def _ping_result(host, ip, outcome):
+    r = {"target": host, "ip": ip, "method": outcome["method"], "sent": outcome["sent"],
+         "received": outcome["received"], "loss_pct": outcome["loss_pct"], "rtt": outcome["rtt"],
+         "samples": outcome["samples"], "output": _ping_summary(outcome)}
+    if outcome["rtt"]:
+        r["latency_ms"] = outcome["rtt"]["avg"]
+    if outcome["received"] == outcome["sent"]:
+        r["status"] = "PASS"
+    elif outcome["received"]:
+        r["status"] = "WARN"
+        r["note"] = f"{outcome['loss_pct']:g}% packet loss"
+    elif outcome["errors"]:
+        err = outcome["errors"][0]
+        failure_mode, _ = udp_errors.classify(err)
+        failure_mode = failure_mode if failure_mode in PING_ERROR_HINTS else "unreachable"
+        r.update(status="FAIL", error=err.get("error"), failure_mode=failure_mode, hint=PING_ERROR_HINTS[failure_mode])
+        if err.get("offender"):
+            r["icmp_from"] = err["offender"]
+    else:
+        r.update(status="FAIL", error="No echo replies", failure_mode="timeout", hint=PING_TIMEOUT_HINT)
+    return r
+
+
+def _ping_binary(host, count=2):
+    """Fallback through the system ping binary when no ICMP socket can be opened."""
     try:
-        res=subprocess.run(["ping","-n","-c",str(count),host], capture_output=True, text=True, timeout=8)
+        addr = dns_cache.get_cache().lookup(host) or host
+        res=subprocess.run(["ping","-n","-c",str(count),addr], capture_output=True, text=True, timeout=8)
         ok=(res.returncode==0); tail="\n".join(res.stdout.splitlines()[-2:])
-        return {"target":host,"status":"PASS" if ok else "FAIL","output":tail}
+        return {"target":host,"status":"PASS" if ok else "FAIL","output":tail,"method":"ping-binary"}
     except subprocess.TimeoutExpired as e:
-        return {"target":host,"status":"FAIL","error":str(e),"failure_mode":"timeout","hint":"Ping timed out. ICMP is commonly blocked on enterprise networks and many cloud IPs; validate reachability using TCP/HTTPS to the required ports instead."}
+        return {"target":host,"status":"FAIL","error":str(e),"failure_mode":"timeout","hint":PING_TIMEOUT_HINT}
     except Exception as e:
         return {"target":host,"status":"FAIL","error":str(e)}
 
-def ntp_check(server="time.skydio.com", timeout=3):
-    try:
-        import ntplib
-        c=ntplib.NTPClient(); r=c.request(server, version=3, timeout=timeout)
-        return {"target":server,"status":"PASS","offset_ms":int(r.offset*1000)}
-    except Exception as e:
-        return {"target":server,"status":"FAIL","error":str(e)}
 
-def _try_ookla(attempts=2):
+def ping_many(hosts, count=icmp_probe.DEFAULT_COUNT, interval=icmp_probe.DEFAULT_INTERVAL,
+              timeout=icmp_probe.DEFAULT_TIMEOUT, on_result=None, cancel=None):
+    """Ping many hosts at once in-process; see icmp_probe.ping_many().
+
+    Results carry min/avg/max/stddev RTT, loss and per-packet samples
+    (`latency_ms` is the average). PASS when every echo came back, WARN on
+    partial loss, FAIL when none did. Hosts whose ICMP socket cannot be
+    opened (no ping-socket group, not root) fall back to the ping binary.
+    Results are returned in input order and also passed to
+    on_result(result, host) as each completes.
+    """
+    hosts = list(hosts or [])
+    results = [None] * len(hosts)
+
+    def _finish(i, r):
+        results[i] = r
+        if on_result:
+            on_result(r, hosts[i])
+
+    addrs = _resolve_tcp_addrs(hosts)
+    probes = []
+    for i, host in enumerate(hosts):
+        addr = addrs.get(host)
+        if cancel is not None and cancel.cancelled:
+            _finish(i, _cancelled_result(host, cancel.reason))
+        elif addr is None or isinstance(addr, Exception):
+            _finish(i, {"target": host, "status": "FAIL", "error": str(addr or OSError("No host specified")),
+                        "failure_mode": "dns"})
+        else:
+            probes.append((i, addr))
+
+    fallback = []
+
+    def _outcome(j, outcome):
+        i, (_, ip) = probes[j]
+        if outcome.get("socket_error"):
+            fallback.append(i)
+        elif outcome.get("cancelled") and not outcome["sent"]:
+            _finish(i, _cancelled_result(hosts[i], cancel.reason))
+        elif outcome.get("cancelled"):
+            _finish(i, _partial_result(_ping_result(hosts[i], ip, outcome), cancel.reason))
+        else:
+            _finish(i, _ping_result(hosts[i], ip, outcome))
+
+    icmp_probe.ping_many([addr for _, addr in probes], count=count, interval=interval, timeout=timeout,
+                         on_outcome=_outcome, cancel=cancel)
+    if fallback:
+        with ThreadPoolExecutor(max_workers=min(4, len(fallback))) as ex:
+            for i, r in zip(fallback, ex.map(lambda i: _ping_binary(hosts[i], count), fallback)):
+                _finish(i, r)
+    return results
+
+
+def ping(host, count=2):
+    return ping_many([host], count=count)[0]
+
+# Local clock offsets beyond this are reported as WARN (the dock's TLS and
+# log timestamps tolerate little skew)
+NTP_OFFSET_WARN_MS = 500
+
+
+def _ntp_server_result(server, ip, outcome):
+    r = {"server": server, "ip": ip, "sent": outcome.get("sent", 0), "received": outcome.get("received", 0),
+         "reachable": bool(outcome.get("received"))}
+    for key in ("offset_ms", "delay_ms", "jitter_ms", "stratum", "refid", "leap", "root_distance_ms", "samples"):
+        if key in outcome:
+            r[key] = outcome[key]
+    if outcome.get("kiss"):
+        r["kiss"] = outcome["kiss"]
+        r["error"] = f"Server sent kiss-o'-death {outcome['kiss']}" + (
+            " (rate limited)" if outcome["kiss"] == "RATE" else " (access denied)" if outcome["kiss"] in ("DENY", "RSTR") else "")
+    elif outcome.get("icmp"):
+        r["error"] = outcome["icmp"].get("error")
+        r["failure_mode"], r["hint"] = udp_errors.classify(outcome["icmp"])
+    elif not outcome.get("received"):
+        r["error"] = "No NTP replies"
+        r["failure_mode"] = "timeout"
+        r["hint"] = "No reply on UDP 123. Outbound NTP is likely blocked by a firewall; the dock's clock will drift."
+    elif outcome.get("leap") == ntp_probe.LEAP_UNSYNCHRONIZED or not 1 <= outcome.get("stratum", 0) <= 15:
+        r["error"] = "Server is not synchronized"
+    r["status"] = "PASS" if r["reachable"] and "error" not in r else ("WARN" if r["reachable"] else "FAIL")
+    return r
+
+
+def ntp_check(server="time.skydio.com", timeout=3, servers=None, samples=ntp_probe.DEFAULT_SAMPLES, cancel=None):
+    """Clock offset against `server` plus any other `servers`, all sampled concurrently.
+
+    Every server gets several requests paced across ntp_probe.DEFAULT_WINDOW,
+    each reply waited for up to `timeout` seconds (a short timeout never
+    polls servers faster); per server the lowest-delay sample gives offset
+    and delay, and the
+    spread of the rest gives jitter. The best estimate (`offset_ms`,
+    `source`) comes from the synchronized server with the smallest root
+    distance among those that agree with each other (falsetickers are
+    flagged per server). Status follows `server` itself: FAIL if it cannot be
+    reached, WARN if it is unsynchronized or the local clock is off by
+    more than NTP_OFFSET_WARN_MS.
+    """
+    names = list(dict.fromkeys([server] + [s for s in (servers or []) if s]))
+    addrs = _resolve_tcp_addrs(names)
+    per_server = [None] * len(names)
+    probes = []
+    for i, name in enumerate(names):
+        addr = addrs.get(name)
+        if addr is None or isinstance(addr, Exception):
+            per_server[i] = {"server": name, "status": "FAIL", "reachable": False, "failure_mode": "dns",
+                             "error": str(addr or OSError("No host specified"))}
+        else:
+            probes.append((i, addr))
+
+    outcomes = ntp_probe.query_many([addr for _, addr in probes], samples=samples, window=ntp_probe.DEFAULT_WINDOW,
+                                    timeout=timeout, cancel=cancel)
+    stopped = any(outcome.get("cancelled") for outcome in outcomes)
+    for (i, addr), outcome in zip(probes, outcomes):
+        if outcome.get("cancelled") and not outcome["sent"]:
+            if i == 0:
+                return _cancelled_result(server, cancel.reason)
+            per_server[i] = {"server": names[i], "ip": addr[1], "status": "SKIPPED", "sent": 0, "received": 0,
+                             "note": _cancelled_result(names[i], cancel.reason)["note"]}
+        else:
+            per_server[i] = _ntp_server_result(names[i], addr[1], outcome)
+
+    r = {"target": server, "servers": per_server}
+    usable = [s for s in per_server if s["status"] == "PASS"]
+    if usable:
+        agree = ntp_probe.select_truechimers([(s["offset_ms"], s["root_distance_ms"]) for s in usable],
+                                             prefer=0 if usable[0] is per_server[0] else None)
+        for j, s in enumerate(usable):
+            if j not in agree:
+                s["falseticker"] = True
+        best = min((usable[j] for j in agree), key=lambda s: s["root_distance_ms"])
+        r.update(offset_ms=best["offset_ms"], delay_ms=best["delay_ms"], jitter_ms=best["jitter_ms"],
+                 stratum=best["stratum"], source=best["server"])
+        if len(usable) > 1:
+            offsets = [s["offset_ms"] for s in usable]
+            r["spread_ms"] = round(max(offsets) - min(offsets), 2)
+
+    primary = per_server[0]
+    if primary.get("delay_ms") is not None:
+        r["latency_ms"] = primary["delay_ms"]
+    if primary["status"] == "FAIL":
+        r.update(status="FAIL", error=primary.get("error"))
+        for key in ("failure_mode", "hint"):
+            if primary.get(key):
+                r[key] = primary[key]
+        if usable:
+            r["note"] = f"Time is available from {best['server']}, but not from {server}"
+    elif primary["status"] == "WARN":
+        r.update(status="WARN", note=primary.get("error"))
+    elif primary.get("falseticker"):
+        r.update(status="WARN", note=f"{server} disagrees with the other servers by "
+                                     f"{abs(primary['offset_ms'] - r['offset_ms']):.0f} ms")
+    elif abs(r["offset_ms"]) > NTP_OFFSET_WARN_MS:
+        r.update(status="WARN", note=f"Local clock is {abs(r['offset_ms']):.0f} ms "
+                                     f"{'behind' if r['offset_ms'] > 0 else 'ahead of'} {r['source']}")
+    else:
+        r["status"] = "PASS"
+    if stopped:
+        _partial_result(r, cancel.reason)
+    return r
+
+def _run_cancellable(cmd, timeout, cancel=None):
+    """subprocess.run() equivalent that kills the child promptly when `cancel` fires."""
+    if cancel is None:
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    end = time.monotonic() + cancel.remaining(timeout)
+    while True:
+        try:
+            out, err = proc.communicate(timeout=0.25)
+            return subprocess.CompletedProcess(cmd, proc.returncode, out, err)
+        except subprocess.TimeoutExpired:
+            if cancel.cancelled or time.monotonic() >= end:
+                proc.kill()
+                proc.communicate()
+                cancel.check()
+                raise
+
+def _try_ookla(attempts=2, cancel=None):
     best = None
     for i in range(max(1, int(attempts))):
         try:
-            res = subprocess.run(
+            res = _run_cancellable(
                 ["speedtest", "--accept-license", "--accept-gdpr", "-f", "json", "--progress=no"],
-                capture_output=True,
-                text=True,
                 timeout=120,
+                cancel=cancel,
             )
             if res.returncode != 0:
                 continue
@@ -156,18 +620,28 @@ def _try_ookla(attempts=2):
             if best is None or (dl + ul) > (best.get("download_mbps", 0) + best.get("upload_mbps", 0)):
                 best = cand
             if i < attempts - 1:
-                time.sleep(1)
+                if cancel is not None:
+                    cancel.wait(1)
+                    cancel.check()
+                else:
+                    time.sleep(1)
+        except RunCancelled:
+            raise
         except Exception:
             continue
     return best
 
-def _cloudflare_down_bytes(min_bytes=25_000_000, timeout=60):
+def _cloudflare_down_bytes(min_bytes=25_000_000, timeout=60, cancel=None):
     url = f"https://speed.cloudflare.com/__down?bytes={min_bytes}"
     total = 0
     chunk_size = 262144
+    if cancel is not None:
+        timeout = cancel.remaining(timeout)
     with requests.get(url, stream=True, timeout=timeout) as r:
         r.raise_for_status()
         for chunk in r.iter_content(chunk_size=chunk_size):
+            if cancel is not None:
+                cancel.check()
             if not chunk:
                 break
             total += len(chunk)
@@ -176,15 +650,18 @@ def _cloudflare_down_bytes(min_bytes=25_000_000, timeout=60):
     return total
 
 
-def _cloudflare_down(min_bytes=25_000_000, timeout=60):
+def _cloudflare_down(min_bytes=25_000_000, timeout=60, cancel=None):
     start = time.time()
-    total = _cloudflare_down_bytes(min_bytes=min_bytes, timeout=timeout)
+    total = _cloudflare_down_bytes(min_bytes=min_bytes, timeout=timeout, cancel=cancel)
     elapsed = max(time.time() - start, 1e-6)
     return round((total * 8) / 1_000_000 / elapsed, 1)
 
-def _cloudflare_up(min_bytes=10_000_000, timeout=60):
+def _cloudflare_up(min_bytes=10_000_000, timeout=60, cancel=None):
     url = "https://speed.cloudflare.com/__up"
     data = os.urandom(min_bytes)
+    if cancel is not None:
+        cancel.check()
+        timeout = cancel.remaining(timeout)
     start = time.time()
     r = requests.post(url, data=data, timeout=timeout)
     r.raise_for_status()
@@ -192,7 +669,7 @@ def _cloudflare_up(min_bytes=10_000_000, timeout=60):
     return round((len(data) * 8) / 1_000_000 / elapsed, 1)
 
 
-def _cloudflare_parallel(download_total_bytes=80_000_000, upload_total_bytes=20_000_000, download_conns=4, upload_conns=2, timeout=60):
+def _cloudflare_parallel(download_total_bytes=80_000_000, upload_total_bytes=20_000_000, download_conns=4, upload_conns=2, timeout=60, cancel=None):
     download_total_bytes = max(int(download_total_bytes), 1)
     upload_total_bytes = max(int(upload_total_bytes), 1)
     download_conns = max(int(download_conns), 1)
@@ -203,13 +680,16 @@ def _cloudflare_parallel(download_total_bytes=80_000_000, upload_total_bytes=20_
 
     start = time.time()
     with ThreadPoolExecutor(max_workers=download_conns) as ex:
-        totals = list(ex.map(lambda _: _cloudflare_down_bytes(min_bytes=down_bytes_per_conn, timeout=timeout), range(download_conns)))
+        totals = list(ex.map(lambda _: _cloudflare_down_bytes(min_bytes=down_bytes_per_conn, timeout=timeout, cancel=cancel), range(download_conns)))
     down_elapsed = max(time.time() - start, 1e-6)
     down_total = sum(totals)
     dl_mbps = round((down_total * 8) / 1_000_000 / down_elapsed, 1)
 
     payload = os.urandom(up_bytes_per_conn)
     up_url = "https://speed.cloudflare.com/__up"
+    if cancel is not None:
+        cancel.check()
+        timeout = cancel.remaining(timeout)
     up_start = time.time()
     with ThreadPoolExecutor(max_workers=upload_conns) as ex:
         res = list(ex.map(lambda _: requests.post(up_url, data=payload, timeout=timeout), range(upload_conns)))
@@ -220,197 +700,260 @@ def _cloudflare_parallel(download_total_bytes=80_000_000, upload_total_bytes=20_
 
     return dl_mbps, ul_mbps
 
-def quic_check(host, port=443, timeout=5, label=None):
-    """Test QUIC protocol connectivity - simplified approach for better reliability"""
-    start = time.time()
-    try:
-        # First try: Check if curl supports HTTP/3
-        curl_check = subprocess.run(["curl", "--version"], capture_output=True, text=True, timeout=5)
-        has_http3 = "HTTP3" in curl_check.stdout or "http3" in curl_check.stdout
-        
-        if has_http3:
-            # Try HTTP/3 with curl
-            cmd = ["curl", "-s", "-I", "--http3-only", "--connect-timeout", str(timeout), 
-                   "--max-time", str(timeout), f"https://{host}:{port}/"]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout + 2)
-            latency_ms = int((time.time() - start) * 1000)
-            
-            if result.returncode == 0 and "HTTP/3" in result.stdout:
-                r = {"target": f"{host}:{port}", "status": "PASS", "latency_ms": latency_ms, "protocol": "QUIC/HTTP3"}
-            else:
-                # Fall back to UDP port check
-                r = _quic_udp_check(host, port, timeout, start)
+QUIC_TIMEOUT_HINT = ("No reply to QUIC probes. An outbound firewall is probably dropping UDP to this port; "
+                     "HTTP/3 clients will fall back to TCP and QUIC-only traffic will fail.")
+
+
+def _quic_result(t, addr, outcome):
+    host, port = t.get("host"), t.get("port", 443)
+    r = {"target": f"{host}:{port}", "protocol": "QUIC", "ip": addr[1], "attempts": outcome.get("attempts", 0)}
+    if outcome.get("icmp"):
+        err = outcome["icmp"]
+        failure_mode, hint = udp_errors.classify(err)
+        r.update(status="FAIL", error=err.get("error"), failure_mode=failure_mode, hint=hint)
+        if err.get("offender"):
+            r["icmp_from"] = err["offender"]
+    elif outcome.get("timed_out"):
+        r.update(status="FAIL", error=f"No reply after {r['attempts']} QUIC probes",
+                 failure_mode="timeout", hint=QUIC_TIMEOUT_HINT)
+    elif outcome.get("reply") == "version_negotiation":
+        versions = outcome.get("versions") or []
+        r["latency_ms"] = outcome.get("rtt_ms")
+        r["versions"] = [quic_probe.version_name(v) for v in versions if quic_probe.version_name(v) != "reserved"]
+        if not outcome.get("valid", True):
+            r.update(status="WARN", note="Malformed Version Negotiation reply (middlebox or non-compliant server)")
+        elif any(v in quic_probe.STANDARD_VERSIONS for v in versions):
+            r["status"] = "PASS"
         else:
-            # No HTTP/3 support, do UDP port check
-            r = _quic_udp_check(host, port, timeout, start)
-        
-        if label:
-            r["label"] = label
-        return r
-        
-    except subprocess.TimeoutExpired:
-        r = {"target": f"{host}:{port}", "status": "FAIL", "error": "QUIC test timeout", "protocol": "QUIC"}
-        if label:
-            r["label"] = label
-        return r
-    except Exception as e:
-        r = {"target": f"{host}:{port}", "status": "FAIL", "error": str(e), "protocol": "QUIC"}
-        if label:
+            r.update(status="WARN", note="QUIC endpoint answered but offers neither QUIC v1 nor v2")
+    elif outcome.get("reply") == "long_header":
+        r.update(status="PASS", latency_ms=outcome.get("rtt_ms"),
+                 versions=[quic_probe.version_name(outcome.get("version", 0))])
+    else:
+        r.update(status="WARN", latency_ms=outcome.get("rtt_ms"),
+                 note="UDP port answered, but not with a QUIC packet")
+    return r
+
+
+def quic_check_many(targets, timeout=3, on_result=None, timeout_for=None, cancel=None):
+    """QUIC reachability of many {"host","port","label"} targets at once.
+
+    Sends each target a padded long-header Initial with a reserved version
+    from one UDP socket per address family; a QUIC server answers with
+    Version Negotiation in one round trip, listing the versions it speaks.
+    A lost datagram is retransmitted (up to three attempts), ICMP
+    rejections fail immediately, silence fails at the timeout.
+    Results are returned in input order and also passed to
+    on_result(result, target) as each completes.
+    """
+    targets = list(targets or [])
+    results = [None] * len(targets)
+
+    def _timeout(i):
+        return timeout_for(targets[i]) if timeout_for else timeout
+
+    def _finish(i, r):
+        label = targets[i].get("label")
+        if label and "label" not in r:
             r["label"] = label
-        return r
+        r["timeout_ms"] = int(_timeout(i) * 1000)
+        results[i] = r
+        if on_result:
+            on_result(r, targets[i])
 
-def _quic_udp_check(host, port, timeout, start_time):
-    """Enhanced UDP port check for QUIC - matches Dock's QUIC connection pattern"""
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(timeout)
-        
-        # Resolve hostname to IP if needed
-        try:
-            ip_addr = socket.gethostbyname(host)
-        except:
-            ip_addr = host
-        
-        # Send QUIC Initial packet (matches Dock's connection initiation)
-        # QUIC Initial packet format: Header Form (1) | Fixed Bit (1) | Long Packet Type (2) | Reserved (2) | Packet Number Length (2)
-        quic_version = 0x00000001  # QUIC v1
-        
-        # Build QUIC Initial packet header
-        header_byte = 0xc0  # Long header, Initial packet
-        packet = struct.pack('!B', header_byte)
-        packet += struct.pack('!I', quic_version)
-        packet += b'\x00' * 20  # Simplified DCID/SCID
-        
-        try:
-            sock.sendto(packet, (ip_addr, port))
-            
-            # Wait for response (QUIC server should respond or reject)
-            sock.settimeout(2)
-            try:
-                data, addr = sock.recvfrom(1500)
-                latency_ms = int((time.time() - start_time) * 1000)
-                # Received response - QUIC endpoint is active
-                return {"target": f"{host}:{port}", "status": "PASS", "latency_ms": latency_ms, 
-                       "protocol": "QUIC/UDP", "response_size": len(data)}
-            except socket.timeout:
-                # No response within timeout - port may be filtered or endpoint inactive
-                latency_ms = int((time.time() - start_time) * 1000)
-                # Try one more time with basic UDP probe
-                sock.sendto(b'\x00' * 16, (ip_addr, port))
-                sock.settimeout(1)
-                try:
-                    data, addr = sock.recvfrom(1500)
-                    return {"target": f"{host}:{port}", "status": "PASS", "latency_ms": latency_ms, 
-                           "protocol": "QUIC/UDP"}
-                except:
-                    return {"target": f"{host}:{port}", "status": "WARN", "latency_ms": latency_ms, 
-                           "protocol": "QUIC/UDP", "note": "Port accessible but no QUIC response"}
-        finally:
-            sock.close()
-            
-    except Exception as e:
-        return {"target": f"{host}:{port}", "status": "FAIL", "error": str(e), "protocol": "QUIC/UDP"}
+    addrs = _resolve_tcp_addrs([t.get("host") for t in targets])
+    probes = []
+    for i, t in enumerate(targets):
+        host, port = t.get("host"), t.get("port", 443)
+        addr = addrs.get(host)
+        if cancel is not None and cancel.cancelled:
+            _finish(i, _cancelled_result(f"{host}:{port}", cancel.reason))
+        elif addr is None or isinstance(addr, Exception):
+            err = addr or OSError("No host specified")
+            _finish(i, {"target": f"{host}:{port}", "status": "FAIL", "error": str(err),
+                        "failure_mode": "dns", "protocol": "QUIC"})
+        else:
+            probes.append((i, addr))
 
-def udp_port_range_check(host, port_start, port_end, sample_size=5, timeout=2, label=None):
-    """Test UDP port range accessibility (for WebRTC ports 40000-41000, 50000-60000)
-    Note: Cannot fully validate without active WebRTC session, but can check if ports are filtered"""
-    start_time = time.time()
-    
-    # Sample random ports from the range
-    import random
-    port_range = list(range(port_start, port_end + 1))
-    sample_ports = random.sample(port_range, min(sample_size, len(port_range)))
-    
-    results = {"accessible": 0, "filtered": 0, "errors": 0}
-    
-    for port in sample_ports:
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(timeout)
-            
-            # Send UDP probe packet
-            probe = b'\x00' * 16
-            sock.sendto(probe, (host, port))
-            
-            # Check for ICMP port unreachable (indicates firewall allows but no service)
-            try:
-                sock.recvfrom(1024)
-                results["accessible"] += 1
-            except socket.timeout:
-                # Timeout could mean filtered or no response - assume accessible
-                results["accessible"] += 1
-            
-            sock.close()
-        except Exception as e:
-            results["errors"] += 1
-    
-    latency_ms = int((time.time() - start_time) * 1000)
-    
-    # Determine status based on results
-    if results["accessible"] >= sample_size * 0.8:
-        status = "PASS"
-    elif results["accessible"] >= sample_size * 0.5:
-        status = "WARN"
-    else:
-        status = "FAIL"
-    
+    def _outcome(j, outcome):
+        i, addr = probes[j]
+        t = targets[i]
+        if outcome.get("cancelled"):
+            _finish(i, _cancelled_result(f"{t.get('host')}:{t.get('port', 443)}", cancel.reason))
+        else:
+            _finish(i, _quic_result(t, addr, outcome))
+
+    quic_probe.probe_many([(family, ip, int(targets[i].get("port", 443))) for i, (family, ip) in probes],
+                          timeout=timeout, on_outcome=_outcome,
+                          timeout_for=(lambda j: _timeout(probes[j][0])), cancel=cancel)
+    return results
+
+
+def quic_check(host, port=443, timeout=5, label=None):
+    """Test QUIC (UDP) reachability of one host:port; see quic_check_many()."""
+    return quic_check_many([{"host": host, "port": port, "label": label}], timeout=timeout)[0]
+
+UDP_SILENT_HINT = ("No ICMP or UDP answer from any sampled port. The range may be dropped by a firewall, "
+                   "or the host silently ignores unsolicited UDP (common for cloud media servers); "
+                   "confirm the firewall rule for this range.")
+
+
+def _udp_range_result(t, ip, outcome):
+    host, port_start, port_end = t.get("host"), int(t.get("port_start")), int(t.get("port_end"))
+    ports = outcome["ports"]
+    states = list(ports.values())
+    probed = len(states)
+    replied = states.count("reply")
+    refused = states.count("refused")
+    blocked = sum(1 for s in states if s in udp_scan.BLOCKED_STATES)
+    silent = states.count("silent")
+    opened = replied + refused
+    rtts = sorted(outcome["rtts"].values())
     r = {
         "target": f"{host}:{port_start}-{port_end}",
-        "status": status,
-        "latency_ms": latency_ms,
-        "ports_tested": sample_size,
-        "accessible": results["accessible"],
-        "note": "Sampled port range - full validation requires active WebRTC session"
+        "ip": ip,
+        "ports_tested": probed,
+        "range_size": port_end - port_start + 1,
+        "coverage_pct": round(100.0 * probed / (port_end - port_start + 1), 2),
+        "open": opened,
+        "replied": replied,
+        "refused": refused,
+        "blocked": blocked,
+        "silent": silent,
+        "confirmed_pct": round(100.0 * (opened + blocked) / probed, 1) if probed else 0.0,
+        "icmp_detection": outcome["recverr"],
     }
-    
-    if label:
-        r["label"] = label
-    
+    if rtts:
+        r["latency_ms"] = rtts[len(rtts) // 2]
+    if blocked:
+        r["blocked_ports"] = sorted(p for p, s in ports.items() if s in udp_scan.BLOCKED_STATES)[:20]
+    if not probed:
+        r.update(status="FAIL", error="No ports probed within the time budget")
+    elif blocked and not opened:
+        err = next(iter(outcome["errors"].values()))
+        r["failure_mode"], r["hint"] = udp_errors.classify(err)
+        r.update(status="FAIL", error=err.get("error"))
+    elif blocked:
+        r.update(status="WARN", note=f"{blocked} of {probed} sampled ports are blocked; the rest reach the host")
+    elif opened:
+        r["status"] = "PASS"
+        if silent:
+            # Hosts rate-limit ICMP port unreachable (Linux: a burst of ~6, then 1/s), so silence after refusals is expected
+            r["note"] = f"{silent} sampled ports did not answer (likely ICMP rate limiting)"
+    else:
+        r.update(status="WARN", failure_mode="silent", hint=UDP_SILENT_HINT)
+        if not outcome["recverr"]:
+            r["note"] = "ICMP errors cannot be observed on this platform"
     return r
 
+
+def udp_range_check_many(targets, budget=udp_scan.DEFAULT_BUDGET, rate=udp_scan.DEFAULT_RATE,
+                         on_result=None, cancel=None):
+    """UDP reachability of sampled ports in many {"host","port_start","port_end","sample_size","label"} ranges.
+
+    Every range is scanned concurrently from one socket within `budget`
+    seconds; see udp_scan.scan_many(). A port that answers (a reply, or
+    ICMP port unreachable from the host itself) proves the path is open;
+    ICMP administratively-prohibited or unreachable proves it is blocked;
+    silence proves nothing. PASS when no sampled port is blocked and at
+    least one is confirmed open, WARN when the range is partly blocked or
+    nothing answered at all, FAIL when only blocked ports answered.
+    `sample_size` caps the ports sampled per range.
+    """
+    targets = list(targets or [])
+    results = [None] * len(targets)
+
+    def _finish(i, r):
+        label = targets[i].get("label")
+        if label and "label" not in r:
+            r["label"] = label
+        results[i] = r
+        if on_result:
+            on_result(r, targets[i])
+
+    addrs = _resolve_tcp_addrs([t.get("host") for t in targets])
+    jobs = []
+    for i, t in enumerate(targets):
+        target = f"{t.get('host')}:{t.get('port_start')}-{t.get('port_end')}"
+        addr = addrs.get(t.get("host"))
+        if cancel is not None and cancel.cancelled:
+            _finish(i, _cancelled_result(target, cancel.reason))
+        elif addr is None or isinstance(addr, Exception):
+            _finish(i, {"target": target, "status": "FAIL", "failure_mode": "dns",
+                        "error": str(addr or OSError("No host specified"))})
+        else:
+            jobs.append((i, addr))
+
+    def _outcome(j, outcome):
+        i, (_, ip) = jobs[j]
+        t = targets[i]
+        if outcome.get("cancelled"):
+            _finish(i, _cancelled_result(f"{t.get('host')}:{t.get('port_start')}-{t.get('port_end')}", cancel.reason))
+        else:
+            _finish(i, _udp_range_result(t, ip, outcome))
+
+    udp_scan.scan_many([(family, ip, int(targets[i]["port_start"]), int(targets[i]["port_end"]),
+                         int(targets[i].get("sample_size") or udp_scan.DEFAULT_MAX_PORTS))
+                        for i, (family, ip) in jobs],
+                       budget=budget, rate=rate, on_outcome=_outcome, cancel=cancel)
+    return results
+
+
+def udp_port_range_check(host, port_start, port_end, sample_size=udp_scan.DEFAULT_MAX_PORTS,
+                         timeout=udp_scan.DEFAULT_BUDGET, label=None):
+    """Test UDP reachability of one port range (e.g. WebRTC 40000-41000, 50000-60000) within `timeout` seconds."""
+    return udp_range_check_many([{"host": host, "port_start": port_start, "port_end": port_end,
+                                  "sample_size": sample_size, "label": label}], budget=timeout)[0]
+
 def https_full_check(url, timeout=5, label=None):
-    """Full HTTPS check including TLS handshake and certificate validation - matches Dock's connection pattern"""
-    start = time.time()
+    """Full HTTPS check including TLS handshake and certificate validation - matches Dock's connection pattern
+
+    Sends a HEAD (or a one-byte ranged GET if HEAD is refused) without
+    following redirects, and reports per-phase timings: `timing` for the
+    cold request (DNS, connect, TLS, TTFB, total), `warm` for a repeat on
+    the kept-alive connection and `resumed` for a new connection resuming
+    the TLS session. `latency_ms` is the cold total, as before.
+    """
+    parsed = urlparse(url if url.startswith('http') else f'https://{url}')
+    host = parsed.hostname
+    port = parsed.port or 443
+    path = (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
     
     try:
-        # Parse URL
-        parsed = urlparse(url if url.startswith('http') else f'https://{url}')
-        host = parsed.hostname
-        port = parsed.port or 443
-        
-        # Perform full HTTPS request like the Dock does
-        response = requests.get(
-            f'https://{host}:{port}',
-            timeout=timeout,
-            verify=True,  # Verify SSL certificates like Dock does
-            allow_redirects=True
-        )
-        
-        latency_ms = int((time.time() - start) * 1000)
-        
+        m = https_probe.measure(host, port, path=path, timeout=timeout)
         r = {
             "target": f"{host}:{port}",
-            "status": "PASS" if response.status_code < 400 else "WARN",
-            "latency_ms": latency_ms,
-            "http_status": response.status_code,
-            "tls_verified": True
+            "status": "PASS" if m["http_status"] < 400 else "WARN",
+            "latency_ms": int(round(m["timing"]["total_ms"])),
+            "http_status": m["http_status"],
+            "tls_verified": True,
+            "tls_version": m["tls_version"],
+            "method": m["method"],
+            "timing": m["timing"],
+            "warm": m.get("warm"),
+            "resumed": m.get("resumed"),
         }
+        if m.get("location"):
+            r["location"] = m["location"]
+        if m.get("proxy"):
+            r["proxy"] = m["proxy"]
         
-        if label:
-            r["label"] = label
-        
-        return r
-        
-    except requests.exceptions.SSLError as e:
-        hint = "TLS validation failed. This can be caused by SSL inspection (corporate proxy), missing CA roots, or hostname/certificate mismatch."
+    except https_probe.PhaseError as e:
         r = {
             "target": f"{host}:{port}",
             "status": "FAIL",
-            "error": f"SSL/TLS Error: {str(e)}",
-            "hint": hint,
-            "tls_verified": False
+            "error": str(e.error),
+            "phase": e.phase,
+            "timing": e.timing,
         }
+        if e.phase == "tls":
+            r["error"] = f"SSL/TLS Error: {str(e.error)}"
+            r["hint"] = "TLS validation failed. This can be caused by SSL inspection (corporate proxy), missing CA roots, or hostname/certificate mismatch."
+            r["tls_verified"] = False
+        elif e.phase == "proxy":
+            r["hint"] = "The HTTPS proxy (HTTPS_PROXY) did not open a tunnel to this host. Check the proxy's allow list and credentials, or add the host to NO_PROXY."
+        elif e.phase == "connect":
+            r["failure_mode"], r["hint"] = _classify_connect_error(e.error)
     except Exception as e:
         r = {
             "target": f"{host}:{port}",
@@ -423,10 +966,16 @@ def https_full_check(url, timeout=5, label=None):
     
     return r
 
-def speedtest():
+def speedtest(cancel=None):
     """Enhanced speedtest with Skydio-specific thresholds from documentation"""
+    try:
+        return _speedtest(cancel)
+    except RunCancelled as e:
+        return _cancelled_result("speedtest", str(e))
+
+def _speedtest(cancel=None):
     # Try Ookla first (most accurate)
-    st = _try_ookla(attempts=2)
+    st = _try_ookla(attempts=2, cancel=cancel)
     
     # If Ookla fails, try Cloudflare with multiple attempts for consistency
     if st is None:
@@ -436,10 +985,12 @@ def speedtest():
         for attempt in range(attempts):
             try:
                 try:
-                    dl, ul = _cloudflare_parallel()
+                    dl, ul = _cloudflare_parallel(cancel=cancel)
+                except RunCancelled:
+                    raise
                 except Exception:
-                    dl = _cloudflare_down()
-                    ul = _cloudflare_up()
+                    dl = _cloudflare_down(cancel=cancel)
+                    ul = _cloudflare_up(cancel=cancel)
                 
                 # Keep the best results from multiple attempts
                 if dl > best_dl:
@@ -449,8 +1000,14 @@ def speedtest():
                     
                 # Small delay between attempts
                 if attempt < attempts - 1:
-                    time.sleep(2)
+                    if cancel is not None:
+                        cancel.wait(2)
+                        cancel.check()
+                    else:
+                        time.sleep(2)
                     
+            except RunCancelled:
+                raise
             except Exception as e:
                 if attempt == attempts - 1:  # Last attempt failed
                     return {"status":"FAIL","error":str(e)}
@@ -479,10 +1036,128 @@ def speedtest():
     st["note"] = note
     return st
 
+def default_route_check(gateway=None, probe_ip="8.8.8.8"):
+    """Check the box has a route off the local link.
+
+    A UDP connect() makes the kernel pick a route and source address without
+    sending a packet, so this is instant and works even where ICMP is blocked.
+    """
+    target = gateway or "default route"
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((probe_ip, 53))
+        return {"target": target, "status": "PASS", "source_ip": s.getsockname()[0]}
+    except OSError as e:
+        failure_mode, hint = _classify_connect_error(e)
+        return {"target": target, "status": "FAIL", "error": str(e), "failure_mode": failure_mode,
+                "hint": "No default route. Check the cable/Wi-Fi association, DHCP lease and default gateway."}
+    finally:
+        s.close()
+
+
+def _skipped_result(target, cause, label=None):
+    r = {
+        "target": target,
+        "status": "SKIPPED",
+        "root_cause": f"{cause['probe']}:{cause['target']}",
+        "note": f"Skipped: {cause['probe'].upper()} {cause['target']} failed ({cause.get('error') or 'unknown error'})",
+    }
+    if label:
+        r["label"] = label
+    return r
+
+
+def _host_of(target):
+    if "://" in (target or ""):
+        return urlparse(target).hostname
+    return target
+
+
+def _cached_addr(host):
+    """Resolved address for `host` if the DNS cache already has one, else the host itself."""
+    if not host or dns_cache.is_ip_literal(host):
+        return host
+    entry = dns_cache.get_cache().get(host)
+    if entry and entry.get("addrs"):
+        return entry["addrs"][0]
+    return host
+
+
+def _probe_key(category, host, port=None, options=()):
+    """Canonical identity of a probe: the same key means the same packets on the wire."""
+    return (category, _cached_addr(host), port, tuple(options))
+
+
+def _timeout_kw(timeout):
+    return {"timeout": timeout} if timeout else {}
+
+
+def _fan_out(r, target, label, shared):
+    """Copy one probe result for another label/target that referenced the same probe."""
+    r = dict(r)
+    r["target"] = target
+    r.pop("label", None)
+    if label:
+        r["label"] = label
+    if shared:
+        r["shared_probe"] = shared
+    return r
+
+
+# Per-category and global caps on how many individually scheduled probes may
+# be in flight at once. TCP, QUIC, UDP range and ping targets run as batches
+# that multiplex over shared sockets (see tcp_check_many's max_in_flight), so
+# they have no entry here. Speedtest is deliberately absent: it always runs
+# alone after every probe has finished so probe traffic does not skew the
+# throughput numbers.
+DEFAULT_CONCURRENCY = {"dns": 8, "https": 4, "ntp": 1}
+DEFAULT_MAX_CONCURRENCY = 24
+
+# Echo requests per ping target, their spacing and how long each may take to come back
+DEFAULT_PING_OPTIONS = {"count": icmp_probe.DEFAULT_COUNT, "interval_ms": int(icmp_probe.DEFAULT_INTERVAL * 1000),
+                        "timeout_ms": int(icmp_probe.DEFAULT_TIMEOUT * 1000)}
+
+_RUN_DONE = object()
+
+# Probes run in dependency order: gateway -> DNS -> TCP/QUIC/UDP/ping/NTP -> HTTPS.
+# A probe whose prerequisite failed is reported as SKIPPED with a root_cause
+# reference instead of waiting out its own timeout.
+_STAGES = (
+    ("gateway",),
+    ("dns", "dns_resolvers"),
+    ("tcp", "quic", "udp_range", "ping", "ntp"),
+    ("https",),
+)
+
+
 class StepRunner:
-    def __init__(self, targets):
+    def __init__(self, targets, concurrency=None, max_concurrency=None, short_circuit=True, timeout_policy=None, cancel=None,
+                 ping_options=None):
         self.targets=targets
+        self.ping_options = dict(DEFAULT_PING_OPTIONS)
+        for k, v in (ping_options or {}).items():
+            try:
+                self.ping_options[k] = max(1, int(v))
+            except (TypeError, ValueError):
+                pass
         self._dns_targets = _expand_dns_targets(self.targets.get('dns', []))
+        self.concurrency = dict(DEFAULT_CONCURRENCY)
+        for k, v in (concurrency or {}).items():
+            try:
+                self.concurrency[k] = max(1, int(v))
+            except (TypeError, ValueError):
+                pass
+        try:
+            self.max_concurrency = max(1, int(max_concurrency or DEFAULT_MAX_CONCURRENCY))
+        except (TypeError, ValueError):
+            self.max_concurrency = DEFAULT_MAX_CONCURRENCY
+        self.short_circuit = short_circuit
+        # None -> adaptive timeouts learned within this run only; False -> fixed per-probe defaults
+        self.timeout_policy = AdaptiveTimeoutPolicy() if timeout_policy is None else (timeout_policy or None)
+        self.cancel = cancel or CancelToken()
+        self._route_failure = None
+        self._dns_failures = {}
+        self._tcp_failures = {}
         self.steps=self._count_steps()
 
     def _count_steps(self):
@@ -491,29 +1166,331 @@ class StepRunner:
                 len(self.targets.get("https",[]))+
                 len(self.targets.get("ping",[]))+
                 len(self.targets.get("quic",[]))+
-                2) # + ntp + speedtest
+                len(self.targets.get("udp_ranges",[]))+
+                (1 if self.targets.get("dns_resolvers") else 0)+
+                3) # + gateway + ntp + speedtest
 
-    def run(self):
-        # DNS
-        for n in self._dns_targets:
-            r = resolve_dns(n.get('name'))
-            if n.get('expanded_from'):
-                r['expanded_from'] = n.get('expanded_from')
-            yield ("dns", r)
-        # TCP with optional TLS validation
+    def _blocked_by(self, category, host=None, port=None):
+        """Root cause ({probe, target, error}) that makes this probe pointless, or None."""
+        if not self.short_circuit or category == "gateway":
+            return None
+        if self._route_failure:
+            return self._route_failure
+        if host and host in self._dns_failures:
+            return {"probe": "dns", "target": host, "error": self._dns_failures[host]}
+        if category == "https" and f"{host}:{port}" in self._tcp_failures:
+            return {"probe": "tcp", "target": f"{host}:{port}", "error": self._tcp_failures[f"{host}:{port}"]}
+        return None
+
+    def _timeout(self, category, target):
+        if not self.timeout_policy or category not in self.timeout_policy.rules:
+            return self.cancel.remaining()
+        return self.cancel.remaining(self.timeout_policy.timeout_for(category, target))
+
+    def _observe(self, category, target, r):
+        if self.timeout_policy and r.get("status") == "PASS":
+            self.timeout_policy.observe(category, target, r.get("latency_ms"))
+
+    def _timed(self, category, target, fn):
+        """Run fn(timeout) with the policy's timeout for this target, recording both ways."""
+        timeout = self._timeout(category, target)
+        r = fn(timeout)
+        if timeout is not None:
+            r["timeout_ms"] = int(timeout * 1000)
+        self._observe(category, target, r)
+        return r
+
+    def _gateway_probe(self):
+        r = default_route_check(self.targets.get("gateway"))
+        if r.get("status") == "FAIL":
+            self._route_failure = {"probe": "gateway", "target": r.get("target"), "error": r.get("error")}
+        return r
+
+    def _dns_probe(self, n, timeout=None):
+        r = resolve_dns(n.get('name'), **_timeout_kw(timeout))
+        if n.get('expanded_from'):
+            r['expanded_from'] = n.get('expanded_from')
+        if r.get("status") == "FAIL":
+            self._dns_failures[n.get('name')] = r.get("error")
+        return r
+
+    def _prerequisite_dns(self):
+        """Resolve downstream hostnames that were not DNS targets, recording failures as root causes."""
+        hosts = [t.get("host") for t in self.targets.get("tcp",[]) + self.targets.get("quic",[]) + self.targets.get("udp_ranges",[])]
+        hosts += [_host_of(h.get("url")) for h in self.targets.get("https",[])]
+        hosts += list(self.targets.get("ping",[])) + [self.targets.get("ntp","time.skydio.com")]
+        cache = dns_cache.get_cache()
+        todo = [h for h in dict.fromkeys(hosts) if h and not dns_cache.is_ip_literal(h) and h not in self._dns_failures]
+
+        def _one(host):
+            try:
+                cache.resolve(host)
+            except Exception as e:
+                self._dns_failures[host] = str(e)
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency.get("dns", 8), len(todo))) as ex:
+                list(ex.map(_one, todo))
+
+    def _tcp_batch(self, emit):
+        # Identical (address, port, TLS options) connects run once and fan out to every label
+        groups = {}
         for t in self.targets.get("tcp",[]):
-            verify_tls = t.get("verify_tls", False)
-            yield ("tcp", tcp_check(t.get("host"), t.get("port"), label=t.get("label"), verify_tls=verify_tls))
-        # Full HTTPS checks (TLS + HTTP)
-        for h in self.targets.get("https",[]):
-            yield ("https", https_full_check(h.get("url"), label=h.get("label")))
-        # QUIC
+            cause = self._blocked_by("tcp", t.get("host"), t.get("port"))
+            if cause:
+                emit(_skipped_result(f"{t.get('host')}:{t.get('port')}", cause, t.get("label")))
+                continue
+            verify_tls = bool(t.get("verify_tls", False))
+            key = _probe_key("tcp", t.get("host"), int(t.get("port")),
+                             (verify_tls, t.get("host") if verify_tls else None))
+            groups.setdefault(key, []).append(t)
+
+        reps = [members[0] for members in groups.values()]
+        members_of = {id(members[0]): members for members in groups.values()}
+
+        def _record(r, rep):
+            members = members_of[id(rep)]
+            shared = f"tcp://{_cached_addr(rep.get('host'))}:{rep.get('port')}" if len(members) > 1 else None
+            for t in members:
+                target = f"{t.get('host')}:{t.get('port')}"
+                self._observe("tcp", target, r)
+                mr = _fan_out(r, target, t.get("label"), shared)
+                if mr.get("status") == "FAIL":
+                    self._tcp_failures[target] = mr.get("error")
+                emit(mr)
+
+        # Deadlines are enforced by the cancel token inside the loop, so only the policy shapes per-connect timeouts
+        timeout_for = None
+        if self.timeout_policy and "tcp" in self.timeout_policy.rules:
+            timeout_for = lambda t: self.timeout_policy.timeout_for("tcp", f"{t.get('host')}:{t.get('port')}")
+        tcp_check_many(reps, on_result=_record, timeout_for=timeout_for, cancel=self.cancel)
+
+    def _quic_batch(self, emit):
+        groups = {}
         for q in self.targets.get("quic",[]):
-            yield ("quic", quic_check(q.get("host"), q.get("port", 443), label=q.get("label")))
-        # PING
+            target = f"{q.get('host')}:{q.get('port', 443)}"
+            cause = self._blocked_by("quic", q.get("host"), q.get("port", 443))
+            if cause:
+                emit(_skipped_result(target, cause, q.get("label")))
+                continue
+            groups.setdefault(_probe_key("quic", q.get("host"), int(q.get("port", 443))), []).append(q)
+
+        reps = [members[0] for members in groups.values()]
+        members_of = {id(members[0]): members for members in groups.values()}
+
+        def _record(r, rep):
+            members = members_of[id(rep)]
+            shared = f"quic://{_cached_addr(rep.get('host'))}:{rep.get('port', 443)}" if len(members) > 1 else None
+            for q in members:
+                target = f"{q.get('host')}:{q.get('port', 443)}"
+                self._observe("quic", target, r)
+                emit(_fan_out(r, target, q.get("label"), shared))
+
+        timeout_for = None
+        if self.timeout_policy and "quic" in self.timeout_policy.rules:
+            timeout_for = lambda q: self.timeout_policy.timeout_for("quic", f"{q.get('host')}:{q.get('port', 443)}")
+        quic_check_many(reps, on_result=_record, timeout_for=timeout_for, cancel=self.cancel)
+
+    def _udp_range_batch(self, emit):
+        groups = {}
+        for u in self.targets.get("udp_ranges",[]):
+            target = f"{u.get('host')}:{u.get('port_start')}-{u.get('port_end')}"
+            cause = self._blocked_by("udp_range", u.get("host"))
+            if cause:
+                emit(_skipped_result(target, cause, u.get("label")))
+                continue
+            key = _probe_key("udp_range", u.get("host"), (int(u.get("port_start")), int(u.get("port_end"))),
+                             (u.get("sample_size"),))
+            groups.setdefault(key, []).append(u)
+
+        reps = [members[0] for members in groups.values()]
+        members_of = {id(members[0]): members for members in groups.values()}
+
+        def _record(r, rep):
+            members = members_of[id(rep)]
+            shared = (f"udp://{_cached_addr(rep.get('host'))}:{rep.get('port_start')}-{rep.get('port_end')}"
+                      if len(members) > 1 else None)
+            for u in members:
+                emit(_fan_out(r, f"{u.get('host')}:{u.get('port_start')}-{u.get('port_end')}", u.get("label"), shared))
+
+        udp_range_check_many(reps, budget=self.cancel.remaining(udp_scan.DEFAULT_BUDGET),
+                             on_result=_record, cancel=self.cancel)
+
+    def _ping_batch(self, emit):
+        groups = {}
         for h in self.targets.get("ping",[]):
-            yield ("ping", ping(h))
+            cause = self._blocked_by("ping", h)
+            if cause:
+                emit(_skipped_result(h, cause))
+                continue
+            groups.setdefault(_probe_key("ping", h), []).append(h)
+
+        reps = [members[0] for members in groups.values()]
+        members_of = {rep: members for rep, members in zip(reps, groups.values())}
+
+        def _record(r, rep):
+            members = members_of[rep]
+            shared = f"ping://{_cached_addr(rep)}" if len(members) > 1 else None
+            for h in members:
+                emit(_fan_out(r, h, None, shared))
+
+        opts = self.ping_options
+        ping_many(reps, count=opts["count"], interval=opts["interval_ms"] / 1000.0,
+                  timeout=opts["timeout_ms"] / 1000.0, on_result=_record, cancel=self.cancel)
+
+    def _batches(self):
+        """Probes that run as one multiplexed batch as (category, [(target, label)], callable(emit))."""
+        batches = []
+        # Wire-level DNS queries of every name against every resolver, compared side by side
+        resolvers = self.targets.get("dns_resolvers") or []
+        if resolvers:
+            names = [n.get('name') for n in self._dns_targets]
+            # Only the system's own resolver may fill the shared cache the later stages connect from
+            system = [s for s in (self.targets.get("dns_system_resolvers") or []) if s in resolvers]
+            cache = dns_cache.get_cache() if system else None
+            batches.append(("dns_resolvers", [("resolvers", None)], lambda emit: emit(
+                _cancelled_result("resolvers", self.cancel.reason) if self.cancel.cancelled else
+                dns_client.compare_resolvers(names, resolvers, cache=cache, cache_from=system[0] if system else None))))
+        # TCP with optional TLS validation, all connects in flight at once
+        if self.targets.get("tcp"):
+            batches.append(("tcp", [(f"{t.get('host')}:{t.get('port')}", t.get("label") or None) for t in self.targets["tcp"]],
+                            self._tcp_batch))
+        # ICMP echo, every target from one socket per address family
+        if self.targets.get("ping"):
+            batches.append(("ping", [(h, None) for h in self.targets["ping"]], self._ping_batch))
+        # QUIC version negotiation, every target from one UDP socket
+        if self.targets.get("quic"):
+            batches.append(("quic", [(f"{q.get('host')}:{q.get('port', 443)}", q.get("label") or None) for q in self.targets["quic"]],
+                            self._quic_batch))
+        # Sampled UDP port ranges, every range within one time budget from one UDP socket
+        if self.targets.get("udp_ranges"):
+            batches.append(("udp_range", [(f"{u.get('host')}:{u.get('port_start')}-{u.get('port_end')}", u.get("label") or None)
+                                          for u in self.targets["udp_ranges"]],
+                            self._udp_range_batch))
+        return batches
+
+    def _probes(self):
+        """Individually scheduled probes (except the speedtest) as (category, target, host, port, label, callable)."""
+        probes = [("gateway", self.targets.get("gateway") or "default route", None, None, None, lambda tmo: self._gateway_probe())]
+        for n in self._dns_targets:
+            probes.append(("dns", n.get('name'), None, None, None, lambda tmo, n=n: self._dns_probe(n, tmo)))
+        # Full HTTPS checks (TLS + HTTP)
+        for h in self.targets.get("https",[]):
+            parsed = urlparse(h.get("url") if (h.get("url") or "").startswith("http") else f"https://{h.get('url')}")
+            probes.append(("https", f"{parsed.hostname}:{parsed.port or 443}", parsed.hostname, parsed.port or 443, h.get("label"),
+                           lambda tmo, h=h: https_full_check(h.get("url"), label=h.get("label"), **_timeout_kw(tmo))))
         # NTP
-        yield ("ntp", ntp_check(self.targets.get("ntp","time.skydio.com")))
-        # Speedtest
-        yield ("speedtest", speedtest())
+        ntp_server = self.targets.get("ntp","time.skydio.com")
+        ntp_servers = self.targets.get("ntp_servers") or []
+        probes.append(("ntp", ntp_server, ntp_server, None, None,
+                       lambda tmo: ntp_check(ntp_server, servers=ntp_servers, cancel=self.cancel, **_timeout_kw(tmo))))
+        return probes
+
+    async def _run_probes(self, out):
+        loop = asyncio.get_running_loop()
+        global_sem = asyncio.Semaphore(self.max_concurrency)
+        sems = {}
+
+        async def _one(group):
+            category, target, host, port, label, fn = group[0]
+            cause = self._blocked_by(category, host, port)
+            if cause:
+                for _, m_target, _, _, m_label, _ in group:
+                    out.put((category, _skipped_result(m_target, cause, m_label)))
+                return
+            sem = sems.setdefault(category, asyncio.Semaphore(self.concurrency.get(category, 1)))
+            async with sem:
+                async with global_sem:
+                    # Checked once a slot is free: probes queued behind the limits must not start after a cancel
+                    if self.cancel.cancelled:
+                        for _, m_target, _, _, m_label, _ in group:
+                            out.put((category, _cancelled_result(m_target, self.cancel.reason, m_label)))
+                        return
+                    try:
+                        r = await loop.run_in_executor(executor, self._timed, category, target, fn)
+                    except Exception as e:
+                        r = {"target": target, "status": "FAIL", "error": str(e)}
+            if len(group) == 1:
+                out.put((category, r))
+                return
+            shared = f"{category}://{_cached_addr(host)}" + (f":{port}" if port else "")
+            for _, m_target, _, _, m_label, _ in group:
+                out.put((category, _fan_out(r, m_target, m_label, shared)))
+
+        def _grouped(stage):
+            # Keys are computed per stage so they see addresses resolved by earlier stages
+            groups = {}
+            for p in probes:
+                if p[0] not in stage:
+                    continue
+                category, target, host, port = p[:4]
+                key = _probe_key(category, host, port) if host else (category, target, id(p))
+                if category == "https":
+                    # SNI, Host header and certificate checks depend on the name, not just the address
+                    key = key + (host,)
+                groups.setdefault(key, []).append(p)
+            return list(groups.values())
+
+        async def _batch(category, members, fn):
+            # Targets still owed a result, so a batch that dies part-way reports the rest as failed
+            owed = {}
+            for member in members:
+                owed[member] = owed.get(member, 0) + 1
+            lock = threading.Lock()
+
+            def _emit(r):
+                key = (r.get("target"), r.get("label") or None)
+                with lock:
+                    if owed.get(key):
+                        owed[key] -= 1
+                out.put((category, r))
+
+            async with global_sem:
+                try:
+                    await loop.run_in_executor(executor, fn, _emit)
+                except Exception as e:
+                    print(f"{category} batch failed: {e}")
+                    for target, label in members:
+                        with lock:
+                            if not owed.get((target, label)):
+                                continue
+                            owed[(target, label)] -= 1
+                        r = {"target": target, "status": "FAIL", "error": f"{category} batch failed: {e}"}
+                        if label:
+                            r["label"] = label
+                        out.put((category, r))
+
+        probes = self._probes()
+        batches = self._batches()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for stage in _STAGES:
+                if "tcp" in stage and self.short_circuit and not self._route_failure and not self.cancel.cancelled:
+                    # Hostnames only referenced downstream still gate their probes on DNS
+                    await loop.run_in_executor(executor, self._prerequisite_dns)
+                await asyncio.gather(*([_batch(c, members, fn) for c, members, fn in batches if c in stage] +
+                                       [_one(g) for g in _grouped(stage)]))
+
+    def _run_loop(self, out):
+        try:
+            asyncio.run(self._run_probes(out))
+        finally:
+            out.put(_RUN_DONE)
+
+    def run(self):
+        """Run all probes concurrently, yielding (category, result) as each completes."""
+        out = queue.Queue()
+        worker = threading.Thread(target=self._run_loop, args=(out,), daemon=True)
+        worker.start()
+        while True:
+            item = out.get()
+            if item is _RUN_DONE:
+                break
+            yield item
+        worker.join()
+        # Speedtest runs last and alone
+        if self.cancel.cancelled:
+            yield ("speedtest", _cancelled_result("speedtest", self.cancel.reason))
+        elif self.short_circuit and self._route_failure:
+            yield ("speedtest", _skipped_result("speedtest", self._route_failure))
+        else:
+            yield ("speedtest", speedtest(cancel=self.cancel))
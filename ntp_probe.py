@@ -0,0 +1,285 @@
+import math
+import os
+import selectors
+import socket
+import struct
+import time
+
+import udp_errors
+
+NTP_PORT = 123
+# Seconds between the NTP epoch (1900) and the Unix epoch (1970)
+NTP_DELTA = 2208988800
+_PACKET = struct.Struct("!BBbbII4sQQQQ")
+
+DEFAULT_SAMPLES = 4
+# Spacing between samples to one server. Public servers rate-limit clients
+# polling much faster than this; the spacing shrinks if the window is short.
+DEFAULT_SPACING = 0.5
+DEFAULT_WINDOW = 3.0
+
+LEAP_UNSYNCHRONIZED = 3
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) + 0.0  # no "-0.0" for offsets that round to zero
+
+
+def to_ntp(t):
+    return int((t + NTP_DELTA) * 2 ** 32) & 0xffffffffffffffff
+
+
+def from_ntp(value):
+    seconds = value / 2 ** 32
+    # Era 1 starts in 2036: small values there are later than the 1968-2036 era 0
+    if value >> 32 < 0x80000000:
+        seconds += 2 ** 32
+    return seconds - NTP_DELTA
+
+
+def request(nonce):
+    """48-byte client request (LI 0, version 4, mode 3); `nonce` goes in the transmit timestamp.
+
+    The server echoes the transmit timestamp as its origin timestamp, so a
+    random value both matches replies to requests and rejects spoofed or
+    stale ones, and keeps the local clock reading out of the packet.
+    """
+    return _PACKET.pack(0x23, 0, 0, 0, 0, 0, b"\x00" * 4, 0, 0, 0, nonce)
+
+
+def parse(data):
+    """Server reply fields, or None if it is not a well-formed server-mode packet."""
+    if len(data) < _PACKET.size:
+        return None
+    (li_vn_mode, stratum, poll, precision, root_delay, root_disp, refid,
+     _, origin, receive, transmit) = _PACKET.unpack_from(data)
+    if li_vn_mode & 0x07 != 4:
+        return None
+    if stratum <= 1:
+        # Kiss code (stratum 0) or reference clock name such as GPS (stratum 1)
+        refid_text = refid.decode("ascii", "replace").rstrip("\x00")
+    else:
+        refid_text = socket.inet_ntoa(refid)
+    return {
+        "leap": li_vn_mode >> 6,
+        "version": (li_vn_mode >> 3) & 0x07,
+        "stratum": stratum,
+        "precision": precision,
+        "root_delay": root_delay / 2 ** 16,
+        "root_dispersion": root_disp / 2 ** 16,
+        "refid": refid_text,
+        "origin": origin,
+        "receive": from_ntp(receive),
+        "transmit": from_ntp(transmit),
+    }
+
+
+def filter_samples(samples):
+    """Reduce (offset, delay) samples in seconds to one server estimate, NTP clock-filter style.
+
+    The sample with the lowest delay has the least room for asymmetric
+    queueing, so its offset is the estimate; jitter is the RMS difference
+    of the other samples' offsets from it.
+    """
+    if not samples:
+        return None
+    best = min(samples, key=lambda s: s[1])
+    others = [s for s in samples if s is not best]
+    jitter = math.sqrt(sum((s[0] - best[0]) ** 2 for s in others) / len(others)) if others else 0.0
+    return {"offset": best[0], "delay": best[1], "jitter": jitter}
+
+
+def select_truechimers(estimates, prefer=None):
+    """Indices of the largest group of (offset, root_distance) estimates that agree.
+
+    Each server's true time lies within offset +/- root distance; the
+    servers whose intervals share a common point are consistent with each
+    other (Marzullo's algorithm, as in NTP's selection step), the rest are
+    falsetickers. Ties go to the group containing index `prefer`, then to
+    the tighter group.
+    """
+    best = []
+    for lo, _ in ((o - d, d) for o, d in estimates):
+        group = [i for i, (o, d) in enumerate(estimates) if o - d <= lo <= o + d]
+        rank = (len(group), prefer in group, -sum(estimates[i][1] for i in group))
+        if not best or rank > best[0]:
+            best = [rank, group]
+    return best[1] if best else []
+
+
+def query_many(addrs, samples=DEFAULT_SAMPLES, spacing=DEFAULT_SPACING, window=DEFAULT_WINDOW,
+               timeout=None, on_outcome=None, cancel=None):
+    """Sample every (family, ip) in `addrs` concurrently within one `window` (seconds).
+
+    Each server is sent `samples` requests `spacing` apart from one UDP
+    socket per address family (the servers' first requests spread across
+    one spacing). A request is lost if it is unanswered `timeout` seconds
+    after it was sent or, without a `timeout`, when the window closes; the
+    window only paces the requests, so a short timeout never makes them
+    come faster. A server stops being polled once it sends a kiss-o'-death
+    or the network rejects it (ICMP, read through udp_errors).
+
+    Outcomes (dicts, in input order, also passed to on_outcome(i, outcome)):
+      sent, received, samples ([{offset_ms, delay_ms}] or None per request)
+      offset_ms, delay_ms, jitter_ms (see filter_samples), stratum, refid,
+      leap, root_delay_ms, root_dispersion_ms, root_distance_ms
+      kiss: kiss-o'-death code (RATE, DENY, RSTR, ...)
+      icmp: error dict from udp_errors
+      cancelled: True if `cancel` fired first; the other fields then cover
+                 the requests answered or lost so far (those still
+                 outstanding are left out rather than counted as lost)
+    """
+    outcomes = [None] * len(addrs)
+    n = len(addrs)
+    spacing = min(spacing, window / (samples + 1))
+    sockets = {}
+    sel = selectors.DefaultSelector()
+    by_nonce = {}
+    expires = {}
+    state = {}
+
+    def _finish(i, cancelled=False):
+        st = state.pop(i)
+        outstanding = set()
+        for nonce in st["nonces"]:
+            match = by_nonce.pop(nonce, None)
+            if match is not None:
+                outstanding.add(match[1])
+            expires.pop(nonce, None)
+        if not cancelled:
+            outstanding = set()
+        kept = [s for k, s in enumerate(st["samples"]) if k not in outstanding]
+        got = [s for s in kept if s is not None]
+        outcome = {"sent": len(kept), "received": len(got),
+                   "samples": [{"offset_ms": _ms(s[0]), "delay_ms": _ms(s[1])} if s else None
+                               for s in kept]}
+        estimate = filter_samples(got)
+        if estimate:
+            header = st["header"]
+            outcome.update(offset_ms=_ms(estimate["offset"]), delay_ms=_ms(estimate["delay"]),
+                           jitter_ms=_ms(estimate["jitter"]), stratum=header["stratum"],
+                           refid=header["refid"], leap=header["leap"],
+                           root_delay_ms=_ms(header["root_delay"]),
+                           root_dispersion_ms=_ms(header["root_dispersion"]),
+                           # Bound on the server's error relative to its reference (RFC 5905 section 11.2)
+                           root_distance_ms=_ms((header["root_delay"] + estimate["delay"]) / 2
+                                                + header["root_dispersion"] + estimate["jitter"]))
+        for key in ("kiss", "icmp"):
+            if st.get(key):
+                outcome[key] = st[key]
+        if cancelled:
+            outcome["cancelled"] = True
+        outcomes[i] = outcome
+        if on_outcome:
+            on_outcome(i, outcome)
+
+    def _socket(family):
+        s = sockets.get(family)
+        if s is None:
+            s = socket.socket(family, socket.SOCK_DGRAM)
+            s.setblocking(False)
+            udp_errors.enable(s)
+            sel.register(s, selectors.EVENT_READ, family)
+            sockets[family] = s
+        return s
+
+    def _send(i):
+        family, ip = addrs[i]
+        st = state[i]
+        nonce = int.from_bytes(os.urandom(8), "big")
+        k = len(st["samples"])
+        st["samples"].append(None)
+        try:
+            t1 = time.time()
+            m1 = time.monotonic()
+            _socket(family).sendto(request(nonce), (ip, NTP_PORT))
+        except OSError as e:
+            st["icmp"] = udp_errors.from_exception(e)
+            st["stopped"] = True
+            return
+        st["nonces"].append(nonce)
+        by_nonce[nonce] = (i, k, t1, m1)
+        expires[nonce] = m1 + timeout if timeout is not None else deadline
+
+    def _receive(family, s):
+        for dest, err, _ in udp_errors.drain(s):
+            for i, st in state.items():
+                if dest and addrs[i][0] == family and addrs[i][1] == dest[0]:
+                    st["icmp"] = err
+                    st["stopped"] = True
+        while True:
+            try:
+                data, _ = s.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            m4 = time.monotonic()
+            reply = parse(data)
+            match = by_nonce.pop(reply["origin"], None) if reply else None
+            expires.pop(reply["origin"] if reply else None, None)
+            if match is None or match[0] not in state:
+                continue
+            i, k, t1, m1 = match
+            st = state[i]
+            if reply["stratum"] == 0:
+                st["kiss"] = reply["refid"] or "????"
+                st["stopped"] = True
+                continue
+            t4 = t1 + (m4 - m1)
+            offset = ((reply["receive"] - t1) + (reply["transmit"] - t4)) / 2
+            delay = max((m4 - m1) - (reply["transmit"] - reply["receive"]), 0.0)
+            st["samples"][k] = (offset, delay)
+            st["header"] = reply
+
+    start = time.monotonic()
+    deadline = start + window
+    if timeout is not None:
+        # Room for the answer to the last request, sent just inside the window
+        deadline += timeout
+    for i in range(n):
+        state[i] = {"first": start + spacing * i / max(n, 1), "samples": [], "nonces": [],
+                    "header": None, "stopped": False}
+
+    try:
+        while state:
+            if cancel is not None and cancel.cancelled:
+                for i in list(state):
+                    _finish(i, cancelled=True)
+                break
+            now = time.monotonic()
+            if now >= deadline:
+                for i in list(state):
+                    _finish(i)
+                break
+            for nonce in [nonce for nonce, at in expires.items() if at <= now]:
+                expires.pop(nonce)
+                by_nonce.pop(nonce, None)
+            wake = min([deadline] + list(expires.values()))
+            for i in list(state):
+                st = state[i]
+                if not st["stopped"] and len(st["samples"]) < samples:
+                    due = st["first"] + len(st["samples"]) * spacing
+                    if now >= due:
+                        _send(i)
+                        due += spacing
+                    if len(st["samples"]) < samples:
+                        wake = min(wake, due)
+                if st["stopped"] or (len(st["samples"]) >= samples
+                                     and not any(v[0] == i for v in by_nonce.values())):
+                    _finish(i)
+            if not state:
+                break
+            wait = max(wake - time.monotonic(), 0)
+            if cancel is not None:
+                wait = min(wait, 0.25)
+            for key, _ in sel.select(wait):
+                _receive(key.data, key.fileobj)
+    finally:
+        for s in sockets.values():
+            try:
+                s.close()
+            except OSError:
+                pass
+        sel.close()
+    return outcomes
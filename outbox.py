@@ -0,0 +1,395 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from databricks_integration import create_databricks_client, MAX_ROWS_PER_STATEMENT
+from databricks_probes import create_probe_sink
+
+# Retry schedule: exponential from BACKOFF_BASE, capped, with jitter so a
+# fleet coming back online doesn't retry in lockstep. Items older than
+# MAX_AGE are dropped to the dead-letter file.
+BACKOFF_BASE = 5
+BACKOFF_CAP = 15 * 60
+MAX_AGE = 7 * 24 * 3600
+IDLE_WAIT = 60
+# How long one Databricks delivery waits for its INSERT, and how soon a
+# batch whose INSERT is still running is checked again
+DATABRICKS_WAIT = 120
+PENDING_RECHECK = 30
+
+
+def backoff_delay(attempts):
+    """Seconds to wait after the `attempts`-th failure (equal jitter)."""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * (2 ** max(attempts - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _http_outcome(response):
+    """Map an HTTP response to a delivery result; 408/429/5xx are retried."""
+    code = response.status_code
+    if code < 400:
+        return {'success': True, 'status_code': code}
+    retry = code in (408, 429) or code >= 500
+    return {'success': False, 'retry': retry, 'error': f'HTTP {code}'}
+
+
+def deliver_cloud(payloads, config):
+    cloud = config.get('cloud_push', {})
+    url = cloud.get('api_url')
+    if not url:
+        return {'success': False, 'retry': True, 'error': 'No API URL configured'}
+    headers = {'Content-Type': 'application/json'}
+    if cloud.get('api_key'):
+        headers['Authorization'] = f"Bearer {cloud['api_key']}"
+    body = payloads[0] if len(payloads) == 1 else {'batch': payloads}
+    return _http_outcome(requests.post(url, json=body, headers=headers, timeout=30))
+
+
+def deliver_webhook(payloads, config):
+    url = (config.get('webhook_url') or '').strip()
+    if not url:
+        return {'success': False, 'retry': True, 'error': 'No webhook URL configured'}
+    headers = {}
+    auth = (config.get('webhook_auth') or '').strip()
+    if auth:
+        headers['Authorization'] = auth
+    return _http_outcome(requests.post(url, json=payloads[0], headers=headers, timeout=10))
+
+
+def deliver_databricks(payloads, config, statement_id=None, on_submit=None):
+    """Insert the batch as one statement and wait up to DATABRICKS_WAIT for it.
+
+    `statement_id` is the batch's INSERT from an earlier attempt; it is
+    waited on instead of inserting the rows again. `on_submit(statement_id)`
+    is called as soon as a new INSERT is accepted. Only a FAILED or CANCELED
+    statement, or an error before one was accepted, is retried; a statement
+    still running (or whose status is unknown) comes back `pending`.
+    """
+    databricks_config = config.get('databricks', {})
+    client = create_databricks_client({'databricks': databricks_config})
+    if not client:
+        return {'success': False, 'retry': True, 'error': 'Failed to create Databricks client'}
+    database = databricks_config.get('database', 'network_tests')
+    table = databricks_config.get('table', 'test_results')
+    if statement_id:
+        future = client.track_statement(statement_id)
+    else:
+        table_result = client.create_table_if_not_exists(database, table)
+        if not table_result.get('success'):
+            return {'success': False, 'retry': True, 'error': table_result.get('error')}
+        # One statement for the whole batch, so a failure never leaves it half-written
+        future = client.submit_test_results_batch(database, table, payloads)
+        if future.statement_id and on_submit:
+            on_submit(future.statement_id)
+    result = client.await_statement(future, timeout=DATABRICKS_WAIT)
+    # CLOSED: finished successfully and its result set was released
+    if result.get('success') or result.get('state') == 'CLOSED':
+        return dict(result, success=True)
+    if result.get('statement_id') and result.get('state') not in ('FAILED', 'CANCELED'):
+        return {'success': False, 'retry': True, 'pending': True, 'statement_id': result['statement_id'],
+                'error': result.get('error') or 'Statement still running'}
+    if 'TABLE_OR_VIEW_NOT_FOUND' in str(result.get('error', '')):
+        client.forget_table(database, table)
+    return dict(result, retry=True)
+
+
+def deliver_databricks_probes(payloads, config):
+    sink = create_probe_sink(config)
+    if not sink:
+        return {'success': False, 'retry': True, 'error': 'Probe table sink not configured'}
+    site_label = config.get('cloud_push', {}).get('site_label')
+    result = sink.write_runs(payloads, site_label=site_label)
+    return result if result.get('success') else dict(result, retry=True)
+
+
+# sink -> (deliver(payloads, config), max batch size for config[, resumable])
+# A resumable sink's deliver also takes statement_id/on_submit (see deliver_databricks)
+DEFAULT_SINKS = {
+    'cloud': (deliver_cloud, lambda cfg: int(cfg.get('cloud_push', {}).get('batch_size', 1) or 1)),
+    'webhook': (deliver_webhook, lambda cfg: 1),
+    'databricks': (deliver_databricks,
+                   lambda cfg: min(int(cfg.get('databricks', {}).get('batch_size', 20) or 1), MAX_ROWS_PER_STATEMENT),
+                   True),
+    # One staged file per batch; COPY INTO has no statement-size limit to respect
+    'databricks_probes': (deliver_databricks_probes,
+                          lambda cfg: int(cfg.get('databricks', {}).get('probe_batch_size', 50) or 1)),
+}
+
+
+class Outbox:
+    """Persistent queue of outbound deliveries, drained in the background.
+
+    Every change is appended to a JSON-lines journal and fsync'd before the
+    call returns, so a queued delivery survives a crash or power cut; a torn
+    final line is ignored on load. The journal is compacted once it is
+    mostly acknowledged entries. Deliveries to a sink are sent in FIFO order,
+    batched up to the sink's batch size; when a batch fails the whole sink
+    backs off. Items that fail permanently (retry=False) or exceed MAX_AGE
+    are moved to `<path>.dead`. For resumable sinks the remote statement_id
+    of a submitted batch is journaled, and the batch is resumed by waiting
+    on that statement rather than sent again.
+    """
+
+    def __init__(self, path, sinks=None, config_loader=None, max_age=MAX_AGE):
+        self.path = path
+        self.sinks = dict(DEFAULT_SINKS if sinks is None else sinks)
+        self.config_loader = config_loader or (lambda: {})
+        self.max_age = max_age
+        self._items = {}
+        self._sink_state = {}
+        self._journal_lines = 0
+        self._delivered = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.sinks), 1), thread_name_prefix="outbox")
+        self.load()
+        if self._items:
+            self.start()  # deliveries left over from a previous run
+
+    # -- journal --
+
+    def _append(self, records):
+        with open(self.path, 'a') as f:
+            for rec in records:
+                f.write(json.dumps(rec, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_lines += len(records)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        items = {}
+        lines = 0
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    op, iid = rec.get('op'), rec.get('id')
+                    if op == 'add':
+                        items[iid] = {k: rec[k] for k in ('id', 'sink', 'created', 'payload')}
+                        items[iid].update(attempts=0, next_at=0, error=None, statement_id=rec.get('statement_id'))
+                    elif op == 'submit' and iid in items:
+                        items[iid]['statement_id'] = rec.get('statement_id')
+                    elif op == 'fail' and iid in items:
+                        items[iid].update(attempts=rec['attempts'], next_at=rec['next_at'], error=rec.get('error'),
+                                          statement_id=rec.get('statement_id'))
+                    elif op in ('ack', 'drop'):
+                        items.pop(iid, None)
+        except Exception as e:
+            print(f"Failed to load outbox: {e}")
+        with self._lock:
+            self._items = items
+            self._journal_lines = lines
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the journal with only the live items (lock held)."""
+        if self._journal_lines <= 2 * len(self._items) + 100:
+            return
+        try:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                for item in self._items.values():
+                    f.write(json.dumps({'op': 'add', 'id': item['id'], 'sink': item['sink'],
+                                        'created': item['created'], 'payload': item['payload'],
+                                        'statement_id': item.get('statement_id')}, default=str) + '\n')
+                    if item['attempts']:
+                        f.write(json.dumps({'op': 'fail', 'id': item['id'], 'attempts': item['attempts'],
+                                            'next_at': item['next_at'], 'error': item['error'],
+                                            'statement_id': item.get('statement_id')}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._journal_lines = len(self._items) + sum(1 for i in self._items.values() if i['attempts'])
+        except Exception as e:
+            print(f"Failed to compact outbox: {e}")
+
+    def _dead_letter(self, item, error):
+        try:
+            with open(self.path + '.dead', 'a') as f:
+                f.write(json.dumps(dict(item, error=error, dropped=time.time()), default=str) + '\n')
+        except Exception as e:
+            print(f"Failed to write outbox dead letter: {e}")
+
+    # -- public API --
+
+    def enqueue(self, sink, payload):
+        """Queue `payload` for `sink`; returns the item id once it is on disk."""
+        if sink not in self.sinks:
+            raise ValueError(f"Unknown outbox sink: {sink}")
+        item = {'id': uuid.uuid4().hex, 'sink': sink, 'created': time.time(), 'payload': payload}
+        with self._lock:
+            self._append([dict(item, op='add')])
+            self._items[item['id']] = dict(item, attempts=0, next_at=0, error=None, statement_id=None)
+        self.start()
+        self._wake.set()
+        return item['id']
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._drain_loop, daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            by_sink = {}
+            for item in self._items.values():
+                s = by_sink.setdefault(item['sink'], {'depth': 0, 'oldest_age_s': 0, 'max_attempts': 0})
+                s['depth'] += 1
+                s['oldest_age_s'] = max(s['oldest_age_s'], round(now - item['created'], 1))
+                s['max_attempts'] = max(s['max_attempts'], item['attempts'])
+            for sink, state in self._sink_state.items():
+                s = by_sink.setdefault(sink, {'depth': 0, 'oldest_age_s': 0, 'max_attempts': 0})
+                s['last_error'] = state.get('last_error')
+                s['last_success'] = state.get('last_success')
+                s['retry_in_s'] = max(0, round(state.get('retry_at', 0) - now, 1))
+            return {
+                'depth': len(self._items),
+                'oldest_age_s': max((s['oldest_age_s'] for s in by_sink.values()), default=0),
+                'delivered': self._delivered,
+                'dropped': self._dropped,
+                'sinks': by_sink,
+            }
+
+    def flush(self, timeout=30):
+        """Wait until the outbox is empty or `timeout` passes; True if empty."""
+        self.start()
+        self._wake.set()
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._items:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._idle.wait(left)
+        return True
+
+    # -- draining --
+
+    def _due_batches(self, config, now):
+        batches = {}
+        for item in sorted(self._items.values(), key=lambda i: i['created']):
+            sink = item['sink']
+            if now - item['created'] > self.max_age:
+                self._drop(item, 'expired')
+                continue
+            if self._sink_state.get(sink, {}).get('retry_at', 0) > now or item['next_at'] > now:
+                continue
+            if sink not in self.sinks:
+                continue
+            size = max(self.sinks[sink][1](config), 1)
+            batch = batches.setdefault(sink, [])
+            if not batch:
+                batch.append(item)
+            elif item.get('statement_id') == batch[0].get('statement_id'):
+                # A submitted batch is resumed whole and alone, whatever the batch size is now
+                if item.get('statement_id') or len(batch) < size:
+                    batch.append(item)
+        return batches
+
+    def _drop(self, item, error):
+        self._append([{'op': 'drop', 'id': item['id'], 'error': error}])
+        self._items.pop(item['id'], None)
+        self._dropped += 1
+        self._dead_letter(item, error)
+
+    def _submitted(self, batch, statement_id):
+        """Journal the remote statement running `batch`, so a restart waits on it instead of resending."""
+        with self._lock:
+            self._append([{'op': 'submit', 'id': i['id'], 'statement_id': statement_id} for i in batch])
+            for i in batch:
+                i['statement_id'] = statement_id
+
+    def _send(self, sink, batch, config):
+        spec = self.sinks[sink]
+        kwargs = {}
+        if len(spec) > 2 and spec[2]:
+            kwargs = {'statement_id': batch[0].get('statement_id'),
+                      'on_submit': lambda statement_id: self._submitted(batch, statement_id)}
+        try:
+            return spec[0]([i['payload'] for i in batch], config, **kwargs)
+        except Exception as e:
+            return {'success': False, 'retry': True, 'error': str(e)}
+
+    def _record(self, sink, batch, result, now):
+        state = self._sink_state.setdefault(sink, {'failures': 0})
+        if result.get('success'):
+            self._append([{'op': 'ack', 'id': i['id']} for i in batch])
+            for i in batch:
+                self._items.pop(i['id'], None)
+            self._delivered += len(batch)
+            state.update(failures=0, retry_at=0, last_success=now, last_error=None)
+            return
+        error = str(result.get('error') or 'delivery failed')
+        state['last_error'] = error
+        if result.get('pending'):
+            # Still running remotely: check the same statement again later, without backing off the sink
+            for i in batch:
+                i['next_at'] = now + PENDING_RECHECK
+                i['error'] = error
+            return
+        if result.get('retry') is False:
+            for i in batch:
+                self._drop(i, error)
+            return
+        state['failures'] += 1
+        state['retry_at'] = now + backoff_delay(state['failures'])
+        records = []
+        for i in batch:
+            i['attempts'] += 1
+            i['next_at'] = state['retry_at']
+            i['error'] = error
+            # The statement failed (or never ran), so the next attempt submits a new one
+            i['statement_id'] = None
+            records.append({'op': 'fail', 'id': i['id'], 'attempts': i['attempts'],
+                            'next_at': i['next_at'], 'error': error, 'statement_id': None})
+        self._append(records)
+
+    def drain_once(self):
+        """Send one batch per sink that is due; returns seconds until the next attempt."""
+        config = self.config_loader() or {}
+        now = time.time()
+        with self._lock:
+            batches = self._due_batches(config, now)
+        futures = {sink: self._pool.submit(self._send, sink, batch, config) for sink, batch in batches.items()}
+        # Collected before taking the lock: a sink journals its submission (_submitted) while it runs
+        results = {sink: fut.result() for sink, fut in futures.items()}
+        now = time.time()
+        with self._lock:
+            for sink, result in results.items():
+                self._record(sink, batches[sink], result, now)
+            self._compact()
+            if not self._items:
+                self._idle.notify_all()
+                return IDLE_WAIT
+            if futures:
+                return 0
+            nxt = min(max(i['next_at'], self._sink_state.get(i['sink'], {}).get('retry_at', 0))
+                      for i in self._items.values())
+            return min(max(nxt - time.time(), 0.1), IDLE_WAIT)
+
+    def _drain_loop(self):
+        while True:
+            try:
+                wait = self.drain_once()
+            except Exception as e:
+                print(f"Outbox drain failed: {e}")
+                wait = IDLE_WAIT
+            if wait > 0:
+                self._wake.wait(wait)
+            self._wake.clear()
@@ -0,0 +1,242 @@
+import os
+import selectors
+import socket
+import struct
+import time
+
+import udp_errors
+
+QUIC_V1 = 0x00000001
+QUIC_V2 = 0x6b3343cf
+# Versions a current HTTP/3 client would use; a server offering neither is
+# reachable over UDP but not usable by them
+STANDARD_VERSIONS = (QUIC_V1, QUIC_V2)
+
+# Servers must drop client Initials in datagrams smaller than this (RFC 9000
+# section 14.1), and only answer unknown versions in datagrams this large
+MIN_DATAGRAM = 1200
+CID_LEN = 8
+
+# Send times of each attempt as fractions of the probe timeout, so a lost
+# first datagram still gets an answer before the deadline
+RETRANSMITS = (0.0, 0.25, 0.5)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def version_name(version):
+    if version == QUIC_V1:
+        return "v1"
+    if version == QUIC_V2:
+        return "v2"
+    if version & 0x0f0f0f0f == 0x0a0a0a0a:
+        return "reserved"
+    if version >> 8 == 0xff0000:
+        return f"draft-{version & 0xff}"
+    raw = version.to_bytes(4, "big")
+    if raw[:1] in (b"Q", b"T") and raw[1:].isdigit():
+        return raw.decode()  # gQUIC / Google T-versions
+    return f"0x{version:08x}"
+
+
+def reserved_version():
+    """A random version from the reserved 0x?a?a?a?a space, which no server implements."""
+    return int.from_bytes(os.urandom(4), "big") & 0xf0f0f0f0 | 0x0a0a0a0a
+
+
+def build_probe(dcid, scid, version):
+    """A 1200-byte long-header Initial carrying `version`.
+
+    With a reserved version every compliant server answers with Version
+    Negotiation after parsing only the version-independent header (RFC
+    8999), so no packet protection is needed to get a definitive reply.
+    """
+    header = struct.pack("!BI", 0xc0, version) + bytes([len(dcid)]) + dcid + bytes([len(scid)]) + scid
+    header += b"\x00"  # token length
+    remaining = MIN_DATAGRAM - len(header) - 2
+    return header + struct.pack("!H", 0x4000 | remaining) + os.urandom(remaining)
+
+
+def version_negotiation(dcid, scid, versions):
+    """Version Negotiation packet as a server sends it (CIDs are the client's, swapped)."""
+    return (struct.pack("!BI", 0x80 | (os.urandom(1)[0] & 0x7f), 0) + bytes([len(dcid)]) + dcid
+            + bytes([len(scid)]) + scid + b"".join(struct.pack("!I", v) for v in versions))
+
+
+def parse_reply(data):
+    """Version-independent view of a server datagram, or None if it is not a long header."""
+    try:
+        if len(data) < 7 or not data[0] & 0x80:
+            return None
+        version = struct.unpack_from("!I", data, 1)[0]
+        pos = 5
+        dcid = data[pos + 1:pos + 1 + data[pos]]
+        pos += 1 + data[pos]
+        scid = data[pos + 1:pos + 1 + data[pos]]
+        pos += 1 + data[pos]
+        if pos > len(data):
+            return None
+    except IndexError:
+        return None
+    if version == 0:
+        rest = data[pos:]
+        versions = [v for (v,) in struct.iter_unpack("!I", rest[:len(rest) - len(rest) % 4])]
+        return {"type": "version_negotiation", "dcid": dcid, "scid": scid, "versions": versions}
+    return {"type": "long_header", "version": version, "dcid": dcid, "scid": scid}
+
+
+def _addr_key(family, ip, port):
+    return socket.inet_pton(family, ip), int(port)
+
+
+def probe_many(addrs, timeout=3, on_outcome=None, timeout_for=None, cancel=None):
+    """Probe every (family, ip, port) in `addrs` concurrently.
+
+    All probes share one non-blocking UDP socket per address family. Each
+    attempt carries its own source connection ID, which the server echoes
+    as the reply's destination ID, so replies map back to the exact
+    datagram they answer and the RTT excludes retransmit waits. ICMP
+    errors are read from the socket's error queue (Linux), so a rejected
+    port fails in one RTT instead of timing out.
+
+    Outcomes (dicts, in input order, also passed to on_outcome(i, outcome)):
+      reply:      "version_negotiation", "long_header" or "other"
+      versions:   versions offered in a Version Negotiation packet
+      rtt_ms:     send of the answered attempt -> reply
+      attempts:   datagrams sent
+      icmp:       error dict from udp_errors (ICMP unreachable etc.)
+      timed_out / cancelled: True
+    """
+    outcomes = [None] * len(addrs)
+    sockets = {}
+    sel = selectors.DefaultSelector()
+    by_cid = {}
+    by_addr = {}
+    pending = {}
+
+    def _timeout(i):
+        return timeout_for(i) if timeout_for else timeout
+
+    def _finish(i, outcome):
+        if i not in pending:
+            return
+        state = pending.pop(i)
+        for cid in state["cids"]:
+            by_cid.pop(cid, None)
+        outcome["attempts"] = len(state["cids"])
+        outcomes[i] = outcome
+        if on_outcome:
+            on_outcome(i, outcome)
+
+    def _socket(family):
+        s = sockets.get(family)
+        if s is None:
+            s = socket.socket(family, socket.SOCK_DGRAM)
+            s.setblocking(False)
+            udp_errors.enable(s)
+            sel.register(s, selectors.EVENT_READ, family)
+            sockets[family] = s
+        return s
+
+    def _send(i):
+        family, ip, port = addrs[i]
+        state = pending[i]
+        scid = os.urandom(CID_LEN)
+        packet = build_probe(state["dcid"], scid, state["version"])
+        try:
+            _socket(family).sendto(packet, (ip, int(port)))
+        except OSError as e:
+            _finish(i, {"icmp": udp_errors.from_exception(e)})
+            return
+        state["cids"].append(scid)
+        state["last_sent"] = time.monotonic()
+        by_cid[scid] = (i, state["last_sent"])
+
+    def _receive(family, s):
+        for dest, err, _ in udp_errors.drain(s):
+            if dest is None:
+                continue
+            for i in by_addr.get(_addr_key(family, *dest), []):
+                _finish(i, {"icmp": err})
+        while True:
+            try:
+                data, src = s.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # A pending error not delivered through the queue (no IP_RECVERR); peer unknown
+                continue
+            now = time.monotonic()
+            reply = parse_reply(data)
+            match = by_cid.get(bytes(reply["dcid"])) if reply else None
+            if match is not None:
+                i, sent = match
+                outcome = {"reply": reply["type"], "rtt_ms": _ms(now - sent)}
+                if reply["type"] == "version_negotiation":
+                    outcome["versions"] = reply["versions"]
+                    # A VN listing the version we sent is invalid (RFC 9000 section 6.2)
+                    outcome["valid"] = (pending[i]["version"] not in reply["versions"]
+                                        and bytes(reply["scid"]) == pending[i]["dcid"])
+                else:
+                    outcome["version"] = reply["version"]
+                _finish(i, outcome)
+                continue
+            # Not an answer to a probe (e.g. a short-header stateless reset): attribute it by peer address
+            for i in list(by_addr.get(_addr_key(family, src[0], src[1]), [])):
+                if i in pending:
+                    _finish(i, {"reply": "other", "rtt_ms": _ms(now - pending[i]["last_sent"]), "bytes": len(data)})
+
+    for i, (family, ip, port) in enumerate(addrs):
+        try:
+            key = _addr_key(family, ip, port)
+        except (OSError, ValueError) as e:
+            outcomes[i] = {"icmp": udp_errors.from_exception(e), "attempts": 0}
+            if on_outcome:
+                on_outcome(i, outcomes[i])
+            continue
+        by_addr.setdefault(key, []).append(i)
+        pending[i] = {"start": time.monotonic(), "dcid": os.urandom(CID_LEN),
+                      "version": reserved_version(), "cids": []}
+
+    try:
+        while pending:
+            if cancel is not None and cancel.cancelled:
+                for i in list(pending):
+                    _finish(i, {"cancelled": True})
+                break
+            now = time.monotonic()
+            wake = now + 1
+            for i in list(pending):
+                state = pending[i]
+                tmo = _timeout(i)
+                sent = len(state["cids"])
+                if sent < len(RETRANSMITS) and now >= state["start"] + RETRANSMITS[sent] * tmo:
+                    _send(i)
+                    if i not in pending:
+                        continue
+                    sent += 1
+                deadline = state["start"] + tmo
+                if now >= deadline:
+                    _finish(i, {"timed_out": True})
+                    continue
+                wake = min(wake, deadline)
+                if sent < len(RETRANSMITS):
+                    wake = min(wake, state["start"] + RETRANSMITS[sent] * tmo)
+            if not pending:
+                break
+            wait = max(wake - time.monotonic(), 0)
+            if cancel is not None:
+                wait = min(wait, 0.25)
+            for key, _ in sel.select(wait):
+                _receive(key.data, key.fileobj)
+    finally:
+        for s in sockets.values():
+            try:
+                s.close()
+            except OSError:
+                pass
+        sel.close()
+    return outcomes
+
@@ -7,6 +7,8 @@ def _notes(r, prefer=None):
     parts = []
     if prefer and r.get(prefer):
         parts.append(str(r.get(prefer)))
+    if r.get('root_cause'):
+        parts.append(f"skipped: {r.get('root_cause')} failed")
     if r.get('failure_mode'):
         parts.append(f"mode={r.get('failure_mode')}")
     if r.get('error'):
@@ -15,6 +17,15 @@ def _notes(r, prefer=None):
         parts.append(str(r.get('hint')))
     return ' | '.join([p for p in parts if p])
 
+def _resolver_summary(r):
+    parts = []
+    for srv in (r.get('servers') or []):
+        avg = srv.get('avg_latency_ms')
+        parts.append(f"{srv.get('server')} {avg if avg is not None else '-'}ms")
+    if r.get('inconsistent'):
+        parts.append(f"{len(r.get('inconsistent'))} inconsistent")
+    return ', '.join(parts) or 'resolvers'
+
 def _safe(s): 
     if not s: return "unknown"
     allowed = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.-_"
@@ -39,10 +50,15 @@ def export_csv(data, outdir, ts):
         if sec:
             w.writerow([f"Security: proxy_configured={sec.get('proxy_configured','-')} tls_inspection_suspected={sec.get('tls_inspection_suspected','-')}"])
         w.writerow([]); w.writerow(["Section","Target","Status","Notes"])
+        gw = data.get("gateway") or {}
+        if gw: w.writerow(["GATEWAY", gw.get("target"), gw.get("status"), _notes(gw, prefer='source_ip')])
         for r in data.get("dns",[]): w.writerow(["DNS", r.get("target"), r.get("status"), _notes(r, prefer='ip')])
+        dr = data.get("dns_resolvers") or {}
+        if dr: w.writerow(["DNS RESOLVERS", _resolver_summary(dr), dr.get("status"), _notes(dr, prefer='note')])
         for r in data.get("tcp",[]): w.writerow(["TCP", r.get("target"), r.get("status"), _notes(r, prefer='label')])
         for r in data.get("https",[]): w.writerow(["HTTPS", r.get("target"), r.get("status"), _notes(r)])
         for r in data.get("quic",[]): w.writerow(["QUIC", r.get("target"), r.get("status"), _notes(r, prefer='protocol')])
+        for r in data.get("udp_range",[]): w.writerow(["UDP RANGE", r.get("target"), r.get("status"), _notes(r, prefer='label')])
         for r in data.get("ping",[]): w.writerow(["PING", r.get("target"), r.get("status"), _notes(r, prefer='output')])
         if data.get("ntp"): n=data["ntp"]; w.writerow(["NTP", n.get("target"), n.get("status"), str(n.get("offset_ms") or n.get("error",""))])
         st = data.get("speedtest") or {}
@@ -69,10 +85,15 @@ def export_pdf(data, outdir, ts):
         pdf.cell(0, 10, f"Security: proxy_configured={sec.get('proxy_configured','-')} tls_inspection_suspected={sec.get('tls_inspection_suspected','-')}", ln=True)
     pdf.ln(2)
     def line(label, target, status, notes=""): pdf.cell(0,8,f"{label:<14} | {target:<42} | {status:<5} | {notes}",ln=True)
+    gw = data.get("gateway") or {}
+    if gw: line("GATEWAY", gw.get("target"), gw.get("status"), _notes(gw, prefer='source_ip'))
     for r in data.get("dns",[]): line("DNS", r.get("target"), r.get("status"), _notes(r, prefer='ip'))
+    dr = data.get("dns_resolvers") or {}
+    if dr: line("DNS RESOLVERS", _resolver_summary(dr), dr.get("status"), _notes(dr, prefer='note'))
     for r in data.get("tcp",[]): line("TCP", r.get("target"), r.get("status"), _notes(r, prefer='label'))
     for r in data.get("https",[]): line("HTTPS", r.get("target"), r.get("status"), _notes(r))
     for r in data.get("quic",[]): line("QUIC", r.get("target"), r.get("status"), _notes(r, prefer='protocol'))
+    for r in data.get("udp_range",[]): line("UDP RANGE", r.get("target"), r.get("status"), _notes(r, prefer='label'))
     for r in data.get("ping",[]): line("PING", r.get("target"), r.get("status"), _notes(r, prefer='output'))
     if data.get("ntp"): n=data["ntp"]; line("NTP", n.get("target"), n.get("status"), str(n.get("offset_ms") or n.get("error","")))
     st = data.get("speedtest") or {}
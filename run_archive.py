@@ -0,0 +1,185 @@
+import gzip
+import json
+import lzma
+import mmap
+import os
+import re
+import struct
+import threading
+
+# One index record per archived run: timestamp, segment number, byte offset
+# and compressed length within the segment.
+INDEX_RECORD = struct.Struct('<qIQI')
+INDEX_FILE = 'index.bin'
+
+# Segments roll over at this size or when the UTC day changes, so retention
+# can drop whole segments at roughly day granularity.
+SEGMENT_BYTES = 4 * 1024 * 1024
+
+CODECS = {
+    'gzip': ('.ndjson.gz', lambda data: gzip.compress(data, compresslevel=6), gzip.decompress),
+    'xz': ('.ndjson.xz', lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+_SEGMENT_NAME = re.compile(r'^seg-(\d+)(\.ndjson\.(?:gz|xz))$')
+
+
+class RunArchive:
+    """Append-only archive of run results in compressed NDJSON segments.
+
+    Each run is one JSON line compressed as its own gzip (or xz) member and
+    appended to the current segment, so a segment is still a valid .gz/.xz
+    file (`zcat seg-000001.ndjson.gz` prints NDJSON), yet any single run can
+    be read back by decompressing just its bytes. The segment data is
+    fsync'd before the fixed-size index record is appended; a torn index
+    record left by a crash is truncated on open. Nothing is ever rewritten
+    in place: retention removes whole segments with prune().
+    """
+
+    def __init__(self, directory, codec='gzip', segment_bytes=SEGMENT_BYTES):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown archive codec: {codec}")
+        self.directory = directory
+        self.codec = codec
+        self.segment_bytes = segment_bytes
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._segments = {}
+        for name in os.listdir(directory):
+            m = _SEGMENT_NAME.match(name)
+            if m:
+                self._segments[int(m.group(1))] = name
+        self._repair_index()
+        self._active = max(self._segments) if self._segments else 0
+        self._active_day = None
+        for ts, segment, _, _ in self._entries():
+            if segment == self._active:
+                self._active_day = ts // 86400
+
+    def _repair_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        size = os.path.getsize(self.index_path)
+        if size % INDEX_RECORD.size:
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(size - size % INDEX_RECORD.size)
+
+    def _entries(self):
+        """Index records (timestamp, segment, offset, length), oldest first."""
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == 0:
+            return []
+        with open(self.index_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return list(INDEX_RECORD.iter_unpack(m[:len(m) - len(m) % INDEX_RECORD.size]))
+
+    def _lookup(self, timestamp):
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == 0:
+            return None
+        with open(self.index_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            # Newest first: recent runs are the ones read most, and a re-used
+            # timestamp (run deleted, then saved again) resolves to the latest
+            for pos in range(len(m) // INDEX_RECORD.size - 1, -1, -1):
+                entry = INDEX_RECORD.unpack_from(m, pos * INDEX_RECORD.size)
+                if entry[0] == timestamp:
+                    return entry
+        return None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, self._segments[segment])
+
+    def _writable_segment(self, timestamp, size):
+        """Segment number to append to, rolling over on size, day or codec change."""
+        suffix = CODECS[self.codec][0]
+        name = self._segments.get(self._active)
+        if name is not None:
+            full = os.path.getsize(self._segment_path(self._active)) + size > self.segment_bytes
+            if not full and name.endswith(suffix) and self._active_day == timestamp // 86400:
+                return self._active
+        self._active += 1
+        self._segments[self._active] = f'seg-{self._active:06d}{suffix}'
+        self._active_day = timestamp // 86400
+        return self._active
+
+    def append(self, timestamp, record):
+        """Archive one run; returns the compressed size in bytes."""
+        line = (json.dumps(record, separators=(',', ':'), default=str) + '\n').encode()
+        data = CODECS[self.codec][1](line)
+        with self._lock:
+            segment = self._writable_segment(int(timestamp), len(data))
+            path = self._segment_path(segment)
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, 'ab') as f:
+                f.write(INDEX_RECORD.pack(int(timestamp), segment, offset, len(data)))
+                f.flush()
+                os.fsync(f.fileno())
+        return len(data)
+
+    def get(self, timestamp):
+        """The archived record for `timestamp`, or None."""
+        with self._lock:
+            entry = self._lookup(int(timestamp))
+            if entry is None or entry[1] not in self._segments:
+                return None
+            _, segment, offset, length = entry
+            name = self._segments[segment]
+            with open(self._segment_path(segment), 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                data = m[offset:offset + length]
+        decompress = next(c[2] for c in CODECS.values() if name.endswith(c[0]))
+        return json.loads(decompress(data))
+
+    def prune(self, before):
+        """Remove segments holding only runs older than `before`; returns segments removed."""
+        with self._lock:
+            newest = {}
+            for ts, segment, _, _ in self._entries():
+                newest[segment] = max(newest.get(segment, ts), ts)
+            doomed = [s for s in self._segments if newest.get(s, before) < before
+                      or (s not in newest and s != self._active)]
+            if not doomed:
+                return 0
+            kept = [e for e in self._entries() if e[1] not in doomed]
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                for entry in kept:
+                    f.write(INDEX_RECORD.pack(*entry))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.index_path)
+            for segment in doomed:
+                try:
+                    os.remove(self._segment_path(segment))
+                except OSError as e:
+                    print(f"Could not remove archive segment: {e}")
+                del self._segments[segment]
+            return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            for segment in list(self._segments):
+                try:
+                    os.remove(self._segment_path(segment))
+                except OSError:
+                    pass
+                del self._segments[segment]
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            self._active_day = None
+
+    def disk_bytes(self):
+        total = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        for segment in list(self._segments):
+            try:
+                total += os.path.getsize(self._segment_path(segment))
+            except OSError:
+                pass
+        return total
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries())
+            segments = len(self._segments)
+        return {'runs': entries, 'segments': segments, 'bytes': self.disk_bytes(), 'codec': self.codec}
@@ -2,6 +2,8 @@ class NetworkTester {
     constructor() {
         this.currentJobId = null;
         this.pollInterval = null;
+        this.eventSource = null;
+        this.results = {};
         this.init();
     }
 
@@ -28,6 +30,14 @@ class NetworkTester {
             this.startTest();
         });
 
+        // Stop test button
+        const stopBtn = document.getElementById('stop-test');
+        if (stopBtn) {
+            stopBtn.addEventListener('click', () => {
+                this.stopTest();
+            });
+        }
+
         // Details buttons
         document.querySelectorAll('.details-btn').forEach(btn => {
             btn.addEventListener('click', (e) => {
@@ -83,13 +93,81 @@ class NetworkTester {
             const response = await fetch('/api/start', { method: 'POST' });
             const data = await response.json();
             this.currentJobId = data.job_id;
-            this.startPolling();
+            const stopBtn = document.getElementById('stop-test');
+            if (stopBtn) {
+                stopBtn.disabled = false;
+                stopBtn.style.display = 'inline-block';
+            }
+            this.startEvents();
         } catch (error) {
             console.error('Failed to start test:', error);
             this.testComplete();
         }
     }
 
+    async stopTest() {
+        if (!this.currentJobId) return;
+        const stopBtn = document.getElementById('stop-test');
+        if (stopBtn) stopBtn.disabled = true;
+        try {
+            await fetch(`/api/jobs/${this.currentJobId}/cancel`, { method: 'POST' });
+        } catch (error) {
+            console.error('Failed to cancel test:', error);
+        }
+    }
+
+    startEvents() {
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+        this.results = {};
+        this.eventSource = new EventSource(`/api/jobs/${this.currentJobId}/events`);
+        this.eventSource.addEventListener('result', (e) => {
+            this.handleResult(JSON.parse(e.data));
+        });
+        this.eventSource.addEventListener('progress', (e) => {
+            this.updateProgress(JSON.parse(e.data).progress);
+        });
+        this.eventSource.addEventListener('done', (e) => {
+            this.updateProgress(JSON.parse(e.data).progress);
+            this.testComplete();
+        });
+        this.eventSource.onerror = () => {
+            // The browser reconnects on its own and resumes from Last-Event-ID;
+            // only fall back to polling once it has given up.
+            if (this.eventSource && this.eventSource.readyState === EventSource.CLOSED) {
+                this.closeEvents();
+                this.startPolling();
+            }
+        };
+    }
+
+    closeEvents() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+
+    handleResult({ category, result }) {
+        document.querySelectorAll('.details-btn').forEach(btn => {
+            btn.style.display = 'flex';
+        });
+
+        // Only the card the result belongs to is re-rendered
+        if (['dns', 'tcp', 'quic', 'udp_range', 'https', 'ping'].includes(category)) {
+            this.results[category] = this.results[category] || [];
+            this.results[category].push(result);
+            this.updateTestCard(category, this.results[category]);
+        } else if (category === 'ntp') {
+            this.updateTestCard('ntp', [result]);
+        } else if (category === 'speedtest') {
+            this.updateTestCard('speedtest', [result]);
+            this.updateSpeedResults(result);
+        }
+    }
+
     startPolling() {
         this.pollInterval = setInterval(() => {
             this.checkStatus();
@@ -101,6 +179,10 @@ class NetworkTester {
 
         try {
             const response = await fetch(`/api/status/${this.currentJobId}`);
+            if (!response.ok) {
+                this.testComplete();
+                return;
+            }
             const data = await response.json();
             
             this.updateProgress(data.progress);
@@ -143,6 +225,9 @@ class NetworkTester {
         if (results.quic && results.quic.length > 0) {
             this.updateTestCard('quic', results.quic);
         }
+        if (results.udp_range && results.udp_range.length > 0) {
+            this.updateTestCard('udp_range', results.udp_range);
+        }
         if (results.https && results.https.length > 0) {
             this.updateTestCard('https', results.https);
         }
@@ -235,6 +320,18 @@ class NetworkTester {
                 if (result.protocol) {
                     html += `<div class="detail-value">Protocol: ${result.protocol}</div>`;
                 }
+                if (result.versions && result.versions.length) {
+                    html += `<div class="detail-value">Versions: ${result.versions.join(', ')}</div>`;
+                }
+                if (result.attempts > 1) {
+                    html += `<div class="detail-value">Attempts: ${result.attempts}</div>`;
+                }
+            } else if (testType === 'udp_range' && result.ports_tested !== undefined) {
+                html += `<div class="detail-value">Open: ${result.open} / Blocked: ${result.blocked} / Silent: ${result.silent} of ${result.ports_tested} sampled</div>`;
+                html += `<div class="detail-value">Coverage: ${result.coverage_pct}% of ${result.range_size} ports</div>`;
+                if (result.latency_ms) {
+                    html += `<div class="detail-value">Median RTT: ${result.latency_ms}ms</div>`;
+                }
             } else if (testType === 'https') {
                 if (result.latency_ms) {
                     html += `<div class="detail-value">Latency: ${result.latency_ms}ms</div>`;
@@ -245,10 +342,37 @@ class NetworkTester {
                 if (result.tls_verified !== undefined) {
                     html += `<div class="detail-value">TLS Verified: ${result.tls_verified ? 'Yes' : 'No'}</div>`;
                 }
+                if (result.timing && result.timing.ttfb_ms !== undefined) {
+                    const t = result.timing;
+                    const fmt = v => (v === undefined || v === null) ? '-' : Math.round(v);
+                    const tunnel = t.proxy_ms !== undefined ? ` / Proxy ${fmt(t.proxy_ms)}` : '';
+                    html += `<div class="detail-value">DNS ${fmt(t.dns_ms)} / TCP ${fmt(t.connect_ms)}${tunnel} / TLS ${fmt(t.tls_ms)} / TTFB ${fmt(t.ttfb_ms)} ms</div>`;
+                    if (result.proxy) {
+                        html += `<div class="detail-value">Via proxy: ${result.proxy}</div>`;
+                    }
+                    if (result.warm && result.warm.total_ms !== undefined) {
+                        html += `<div class="detail-value">Warm: ${fmt(result.warm.total_ms)}ms` +
+                            (result.resumed && result.resumed.total_ms !== undefined
+                                ? `, TLS ${result.resumed.tls_resumed ? 'resumed' : 'new session'}: ${fmt(result.resumed.total_ms)}ms` : '') +
+                            `</div>`;
+                    }
+                } else if (result.phase) {
+                    html += `<div class="detail-value">Failed during: ${result.phase}</div>`;
+                }
+            } else if (testType === 'ping' && result.rtt) {
+                html += `<div class="detail-value">RTT min/avg/max/stddev: ${result.rtt.min}/${result.rtt.avg}/${result.rtt.max}/${result.rtt.stddev}ms</div>`;
+                html += `<div class="detail-value">Received: ${result.received}/${result.sent} (${result.loss_pct}% loss)</div>`;
             } else if (testType === 'ping' && result.output) {
                 html += `<div class="detail-value">${result.output}</div>`;
             } else if (testType === 'ntp' && result.offset_ms !== undefined) {
                 html += `<div class="detail-value">Offset: ${result.offset_ms}ms</div>`;
+                if (result.delay_ms !== undefined) {
+                    html += `<div class="detail-value">Delay: ${result.delay_ms}ms, Jitter: ${result.jitter_ms}ms, Stratum: ${result.stratum}</div>`;
+                }
+                if (result.servers && result.servers.length > 1) {
+                    const reachable = result.servers.filter(s => s.reachable).length;
+                    html += `<div class="detail-value">Source: ${result.source} (${reachable}/${result.servers.length} servers reachable)</div>`;
+                }
             } else if (testType === 'speedtest') {
                 if (result.download_mbps) {
                     html += `<div class="detail-value">Download: ${result.download_mbps} Mbps</div>`;
@@ -295,6 +419,7 @@ class NetworkTester {
             'tcp': 'TCP Connectivity',
             'https': 'HTTPS Validation',
             'quic': 'QUIC Protocol',
+            'udp_range': 'UDP Port Ranges',
             'ping': 'Ping Tests',
             'ntp': 'Time Sync',
             'speedtest': 'Speed Test'
@@ -312,6 +437,8 @@ class NetworkTester {
                 return result.label || result.target || `HTTPS Test ${index + 1}`;
             case 'quic':
                 return result.label || result.target || `QUIC Test ${index + 1}`;
+            case 'udp_range':
+                return result.label || result.target || `UDP Range ${index + 1}`;
             case 'ping':
                 return result.target || `Ping Test ${index + 1}`;
             case 'ntp':
@@ -338,6 +465,7 @@ class NetworkTester {
     }
 
     testComplete() {
+        this.closeEvents();
         clearInterval(this.pollInterval);
         this.pollInterval = null;
 
@@ -347,6 +475,8 @@ class NetworkTester {
 
         startBtn.disabled = false;
         startBtn.innerHTML = '<i class="fas fa-play"></i> Start Network Test';
+        const stopBtn = document.getElementById('stop-test');
+        if (stopBtn) stopBtn.style.display = 'none';
         exportPanel.style.display = 'block';
         progressContainer.style.display = 'none';
 
@@ -1,12 +1,19 @@
 // Test History Management
-let historyData = [];
+const PAGE_SIZE = 50;
+const DETAILS_CACHE_SIZE = 20;
+let nextCursor = null;
+let loadingPage = false;
+let historyGeneration = 0;
+let pageObserver = null;
+let detailsCache = new Map();
 let currentTestDetails = null;
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', () => {
     loadDeviceInfo();
+    setupFilters();
+    loadSites();
     loadHistory();
-    setupSearchFilter();
 });
 
 // Load device information
@@ -21,65 +28,171 @@ async function loadDeviceInfo() {
     }
 }
 
-// Load test history
+// Current filters as query-string parameters
+function historyQuery(extra = {}) {
+    const params = new URLSearchParams();
+    const filters = {
+        q: document.getElementById('search-input').value.trim(),
+        status: document.getElementById('filter-status').value,
+        from: document.getElementById('filter-from').value,
+        to: document.getElementById('filter-to').value,
+        target: document.getElementById('filter-target').value.trim(),
+        site: document.getElementById('filter-site').value,
+        ...extra
+    };
+    Object.entries(filters).forEach(([key, value]) => {
+        if (value !== '' && value !== null && value !== undefined) params.set(key, value);
+    });
+    return params.toString();
+}
+
+// Load test history: first page plus stats; later pages load on scroll
 async function loadHistory() {
+    const generation = ++historyGeneration;
+    nextCursor = null;
+    loadingPage = false;
+    
+    const historyList = document.getElementById('history-list');
+    historyList.innerHTML = `
+        <div class="loading-message">
+            <i class="fas fa-spinner fa-spin"></i> Loading test history...
+        </div>
+    `;
+    
+    const page = await fetchPage(null, generation);
+    if (!page) return;
+    
+    historyList.innerHTML = '';
+    updateStats(page.stats);
+    if (page.runs.length === 0) {
+        renderEmpty();
+        return;
+    }
+    appendRuns(page.runs);
+    nextCursor = page.next_cursor;
+    observeSentinel();
+}
+
+// Fetch one page; returns null if it failed or the filters changed meanwhile
+async function fetchPage(cursor, generation) {
     try {
-        const response = await fetch('/api/history');
-        historyData = await response.json();
+        const query = historyQuery({ limit: PAGE_SIZE, cursor: cursor });
+        const response = await fetch(`/api/history?${query}`);
+        const page = await response.json();
+        if (generation !== historyGeneration) return null;
         
-        if (historyData.error) {
-            showError('Failed to load history: ' + historyData.error);
-            return;
+        if (page.error) {
+            showError('Failed to load history: ' + page.error);
+            return null;
         }
-        
-        updateStats();
-        renderHistory();
+        return page;
     } catch (error) {
         console.error('Failed to load history:', error);
-        showError('Failed to load test history');
+        if (generation === historyGeneration) showError('Failed to load test history');
+        return null;
     }
 }
 
-// Update statistics
-function updateStats() {
-    let totalTests = 0;
-    let totalPassed = 0;
-    let totalWarnings = 0;
-    let totalFailed = 0;
+// Load the next page when the sentinel at the bottom of the list scrolls into view
+async function loadNextPage() {
+    if (loadingPage || nextCursor === null) return;
+    loadingPage = true;
+    const generation = historyGeneration;
+    const page = await fetchPage(nextCursor, generation);
+    if (generation !== historyGeneration) return;
+    loadingPage = false;
+    if (!page) return;
     
-    historyData.forEach(entry => {
-        if (entry.summary) {
-            totalTests += entry.summary.total_tests || 0;
-            totalPassed += entry.summary.passed || 0;
-            totalWarnings += entry.summary.warnings || 0;
-            totalFailed += entry.summary.failed || 0;
-        }
-    });
-    
-    document.getElementById('total-tests').textContent = totalTests;
-    document.getElementById('total-passed').textContent = totalPassed;
-    document.getElementById('total-warnings').textContent = totalWarnings;
-    document.getElementById('total-failed').textContent = totalFailed;
+    appendRuns(page.runs);
+    nextCursor = page.next_cursor;
+    observeSentinel();
 }
 
-// Render history list
-function renderHistory(filteredData = null) {
+function observeSentinel() {
     const historyList = document.getElementById('history-list');
-    const data = filteredData || historyData;
+    let sentinel = document.getElementById('history-sentinel');
+    if (!sentinel) {
+        sentinel = document.createElement('div');
+        sentinel.id = 'history-sentinel';
+        sentinel.className = 'history-sentinel';
+    }
+    historyList.appendChild(sentinel);
     
-    if (data.length === 0) {
-        historyList.innerHTML = `
-            <div class="empty-message">
-                <i class="fas fa-inbox"></i>
-                <p>No test history available</p>
-                <p style="font-size: 0.9rem; margin-top: 0.5rem;">Run a network test to see results here</p>
-            </div>
-        `;
+    if (nextCursor === null) {
+        sentinel.textContent = 'End of history';
+        if (pageObserver) pageObserver.disconnect();
         return;
     }
-    
-    historyList.innerHTML = data.map(entry => `
-        <div class="history-item" onclick="viewTestDetails(${entry.timestamp})">
+    sentinel.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Loading more...';
+    if (!pageObserver) {
+        pageObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+        }, { rootMargin: '600px' });
+    }
+    pageObserver.disconnect();
+    pageObserver.observe(sentinel);
+}
+
+// Update statistics (computed server-side over the filtered history)
+function updateStats(stats) {
+    stats = stats || {};
+    document.getElementById('total-tests').textContent = stats.total_tests || 0;
+    document.getElementById('total-passed').textContent = stats.passed || 0;
+    document.getElementById('total-warnings').textContent = stats.warnings || 0;
+    document.getElementById('total-failed').textContent = stats.failed || 0;
+}
+
+async function refreshStats() {
+    try {
+        const response = await fetch(`/api/history/stats?${historyQuery()}`);
+        const stats = await response.json();
+        if (!stats.error) updateStats(stats);
+    } catch (error) {
+        console.error('Failed to load history stats:', error);
+    }
+}
+
+// Fill the site filter with the labels seen in history
+async function loadSites() {
+    try {
+        const response = await fetch('/api/history/stats');
+        const stats = await response.json();
+        const select = document.getElementById('filter-site');
+        (stats.sites || []).forEach(site => {
+            const option = document.createElement('option');
+            option.value = site;
+            option.textContent = site;
+            select.appendChild(option);
+        });
+    } catch (error) {
+        console.error('Failed to load sites:', error);
+    }
+}
+
+function renderEmpty() {
+    const filtered = historyQuery() !== '';
+    document.getElementById('history-list').innerHTML = `
+        <div class="empty-message">
+            <i class="fas fa-inbox"></i>
+            <p>${filtered ? 'No tests match these filters' : 'No test history available'}</p>
+            <p style="font-size: 0.9rem; margin-top: 0.5rem;">${filtered ? 'Try widening the filters' : 'Run a network test to see results here'}</p>
+        </div>
+    `;
+}
+
+// Append a page of runs to the list
+function appendRuns(runs) {
+    const historyList = document.getElementById('history-list');
+    const sentinel = document.getElementById('history-sentinel');
+    const template = document.createElement('template');
+    template.innerHTML = runs.map(renderEntry).join('');
+    historyList.insertBefore(template.content, sentinel);
+}
+
+// Render one history row
+function renderEntry(entry) {
+    return `
+        <div class="history-item" id="history-${entry.timestamp}" onclick="viewTestDetails(${entry.timestamp})">
             <div class="history-item-header">
                 <div class="history-item-info">
                     <div class="history-item-title">
@@ -88,6 +201,7 @@ function renderHistory(filteredData = null) {
                     <div class="history-item-meta">
                         <span><img class="device-info-icon" src="/static/images/skydio-mark.png" alt="Skydio"> ${entry.private_ip || entry.device_name}</span>
                         <span><i class="fas fa-globe"></i> ${entry.public_ip}</span>
+                        ${entry.site_label ? `<span><i class="fas fa-map-marker-alt"></i> ${entry.site_label}</span>` : ''}
                         <span><i class="fas fa-clock"></i> ${formatRelativeTime(entry.timestamp)}</span>
                     </div>
                 </div>
@@ -123,7 +237,7 @@ function renderHistory(filteredData = null) {
                 ` : ''}
             </div>
         </div>
-    `).join('');
+    `;
 }
 
 // Format relative time
@@ -138,11 +252,29 @@ function formatRelativeTime(timestamp) {
     return `${Math.floor(diff / 604800)} weeks ago`;
 }
 
+// Fetch full results for a run, keeping the last few in memory
+async function getTestDetails(timestamp) {
+    if (detailsCache.has(timestamp)) {
+        const data = detailsCache.get(timestamp);
+        detailsCache.delete(timestamp);
+        detailsCache.set(timestamp, data);
+        return data;
+    }
+    const response = await fetch(`/api/history/${timestamp}`);
+    const data = await response.json();
+    if (!data.error) {
+        detailsCache.set(timestamp, data);
+        if (detailsCache.size > DETAILS_CACHE_SIZE) {
+            detailsCache.delete(detailsCache.keys().next().value);
+        }
+    }
+    return data;
+}
+
 // View test details
 async function viewTestDetails(timestamp) {
     try {
-        const response = await fetch(`/api/history/${timestamp}`);
-        const data = await response.json();
+        const data = await getTestDetails(timestamp);
         
         if (data.error) {
             showError('Failed to load test details: ' + data.error);
@@ -327,8 +459,7 @@ function exportCurrentTest() {
 async function exportTest(timestamp) {
     // For now, just download the JSON
     try {
-        const response = await fetch(`/api/history/${timestamp}`);
-        const data = await response.json();
+        const data = await getTestDetails(timestamp);
         
         const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
         const url = URL.createObjectURL(blob);
@@ -366,7 +497,13 @@ async function deleteTest(timestamp) {
         }
         
         showSuccess('Test deleted successfully');
-        loadHistory();
+        detailsCache.delete(timestamp);
+        const item = document.getElementById(`history-${timestamp}`);
+        if (item) item.remove();
+        if (!document.querySelector('.history-item') && nextCursor === null) {
+            renderEmpty();
+        }
+        refreshStats();
     } catch (error) {
         console.error('Failed to delete test:', error);
         showError('Failed to delete test');
@@ -392,6 +529,7 @@ async function clearAllHistory() {
         }
         
         showSuccess('History cleared successfully');
+        detailsCache.clear();
         loadHistory();
     } catch (error) {
         console.error('Failed to clear history:', error);
@@ -405,25 +543,17 @@ function refreshHistory() {
     showSuccess('History refreshed');
 }
 
-// Setup search filter
-function setupSearchFilter() {
-    const searchInput = document.getElementById('search-input');
-    searchInput.addEventListener('input', (e) => {
-        const query = e.target.value.toLowerCase();
-        
-        if (!query) {
-            renderHistory();
-            return;
-        }
-        
-        const filtered = historyData.filter(entry => {
-            return entry.device_name.toLowerCase().includes(query) ||
-                   (entry.private_ip && entry.private_ip.toLowerCase().includes(query)) ||
-                   entry.public_ip.toLowerCase().includes(query) ||
-                   entry.datetime.toLowerCase().includes(query);
-        });
-        
-        renderHistory(filtered);
+// Setup search box and filters; every change reloads from the first page
+function setupFilters() {
+    let debounce = null;
+    const reload = () => {
+        clearTimeout(debounce);
+        debounce = setTimeout(loadHistory, 300);
+    };
+    document.getElementById('search-input').addEventListener('input', reload);
+    document.getElementById('filter-target').addEventListener('input', reload);
+    ['filter-status', 'filter-from', 'filter-to', 'filter-site'].forEach(id => {
+        document.getElementById(id).addEventListener('change', loadHistory);
     });
 }
 
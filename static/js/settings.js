@@ -328,6 +328,26 @@ class SettingsManager {
                 databricksTable.value = settings.databricks.table || 'test_results';
             }
             
+            const databricksBatchSize = document.getElementById('databricks-batch-size');
+            if (databricksBatchSize) {
+                databricksBatchSize.value = settings.databricks.batch_size || 20;
+            }
+
+            const databricksProbeTable = document.getElementById('databricks-probe-table');
+            if (databricksProbeTable) {
+                databricksProbeTable.value = settings.databricks.probe_table || '';
+            }
+
+            const databricksVolumePath = document.getElementById('databricks-volume-path');
+            if (databricksVolumePath) {
+                databricksVolumePath.value = settings.databricks.volume_path || '/Volumes/main/network_tests/staging';
+            }
+
+            const databricksProbeBatchSize = document.getElementById('databricks-probe-batch-size');
+            if (databricksProbeBatchSize) {
+                databricksProbeBatchSize.value = settings.databricks.probe_batch_size || 50;
+            }
+
             const databricksAutoPush = document.getElementById('databricks-auto-push');
             if (databricksAutoPush) {
                 databricksAutoPush.checked = settings.databricks.auto_push || false;
@@ -682,6 +702,10 @@ class SettingsManager {
             warehouse_id: document.getElementById('databricks-warehouse-id').value.trim(),
             database: document.getElementById('databricks-database').value.trim() || 'network_tests',
             table: document.getElementById('databricks-table').value.trim() || 'test_results',
+            batch_size: parseInt(document.getElementById('databricks-batch-size').value, 10) || 20,
+            probe_table: document.getElementById('databricks-probe-table').value.trim(),
+            volume_path: document.getElementById('databricks-volume-path').value.trim(),
+            probe_batch_size: parseInt(document.getElementById('databricks-probe-batch-size').value, 10) || 50,
             auto_push: document.getElementById('databricks-auto-push').checked
         };
 
@@ -743,7 +767,10 @@ class SettingsManager {
 
             const data = await response.json();
 
-            if (data.success) {
+            if (data.success && data.pending) {
+                this.showNotification('Push submitted to Databricks...', 'info');
+                this.watchDatabricksPush(data.status_url, 2000);
+            } else if (data.success) {
                 this.showNotification(`Results pushed successfully! Test ID: ${data.test_id}`, 'success');
             } else {
                 this.showNotification('Push failed: ' + data.error, 'error');
@@ -753,6 +780,26 @@ class SettingsManager {
         }
     }
 
+    watchDatabricksPush(statusUrl, delay) {
+        setTimeout(async () => {
+            try {
+                const response = await fetch(statusUrl);
+                const data = await response.json();
+                if (!response.ok) {
+                    this.showNotification('Push failed: ' + data.error, 'error');
+                } else if (!data.done) {
+                    this.watchDatabricksPush(statusUrl, Math.min(delay * 1.5, 10000));
+                } else if (data.success) {
+                    this.showNotification(`Results pushed successfully! Test ID: ${data.test_id}`, 'success');
+                } else {
+                    this.showNotification('Push failed: ' + data.error, 'error');
+                }
+            } catch (error) {
+                this.showNotification('Push status check failed: ' + error.message, 'error');
+            }
+        }, delay);
+    }
+
     async updateHostname() {
         const hostname = document.getElementById('hostname').value.trim();
         if (!hostname) return;
@@ -0,0 +1,499 @@
+"""In-process stand-in servers used by the tests to exercise the probes without a network."""
+import gzip
+import io
+import json
+import re
+import select
+import socket
+import struct
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List
+from urllib.parse import urlparse, unquote, parse_qs
+
+from databricks_probes import pq
+from dns_client import _encode_name, _read_name
+from ntp_probe import _PACKET, to_ntp
+from quic_probe import MIN_DATAGRAM, QUIC_V1, QUIC_V2, parse_reply, version_negotiation
+
+
+class StubDNSServer:
+    """Minimal local UDP DNS server for exercising the client without a network.
+
+    `records` maps a name to {"A": [...], "AAAA": [...], "CNAME": "target",
+    "ttl": 60, "rcode": 3, "delay": 0.05}. Unknown names get NXDOMAIN.
+    Usage: `with StubDNSServer(records) as srv: dns_client.query_many([(srv.address, ...)])`.
+    """
+
+    def __init__(self, records=None, host="127.0.0.1", port=0):
+        self.records = {k.lower().rstrip("."): v for k, v in (records or {}).items()}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.sock.getsockname()
+        return f"{host}:{port}"
+
+    def _answer(self, data):
+        txid, _, _, _, _, _ = struct.unpack("!HHHHHH", data[:12])
+        qname, offset = _read_name(data, 12)
+        qtype, qclass = struct.unpack("!HH", data[offset:offset + 4])
+        question = data[12:offset + 4]
+        rec = self.records.get(qname.lower().rstrip("."))
+        rcode = 3 if rec is None else int(rec.get("rcode", 0))
+        rrs = b""
+        count = 0
+        if rec and rcode == 0:
+            ttl = int(rec.get("ttl", 60))
+            owner = b"\xc0\x0c"
+            if rec.get("CNAME"):
+                target = _encode_name(rec["CNAME"])
+                rrs += owner + struct.pack("!HHIH", 5, 1, ttl, len(target)) + target
+                count += 1
+            fam, key, code = (socket.AF_INET6, "AAAA", 28) if qtype == 28 else (socket.AF_INET, "A", 1)
+            for addr in rec.get(key, []):
+                raw = socket.inet_pton(fam, addr)
+                rrs += owner + struct.pack("!HHIH", code, 1, ttl, len(raw)) + raw
+                count += 1
+        header = struct.pack("!HHHHHH", txid, 0x8180 | rcode, 1, count, 0, 0)
+        return header + question + rrs, (rec or {}).get("delay", 0)
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                data, src = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                reply, delay = self._answer(data)
+            except Exception:
+                continue
+            if delay:
+                threading.Timer(delay, self.sock.sendto, args=(reply, src)).start()
+            else:
+                self.sock.sendto(reply, src)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(1)
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LocalDatabricksServer:
+    """In-process stand-in for the Databricks SQL statements and Files APIs.
+
+    Understands just enough to exercise the sinks offline: CREATE TABLE,
+    INSERT (recorded only), and COPY INTO from staged NDJSON (gzip) or Parquet
+    files, which it loads into `tables[name]` as row dicts, skipping files it
+    has already loaded. Every statement is kept in `statements`.
+    Usage: `with LocalDatabricksServer() as srv: DatabricksIntegration(srv.url, 'token', 'wh')`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.statements: List[str] = []
+        self.files: Dict[str, bytes] = {}
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._loaded: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, code, body=None):
+                out = b'' if code == 204 else json.dumps(body or {}).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def _file_path(self):
+                return unquote(urlparse(self.path).path[len('/api/2.0/fs/files'):])
+
+            def do_POST(self):
+                if urlparse(self.path).path.rstrip('/') != '/api/2.0/sql/statements':
+                    return self._reply(404, {'error_code': 'NOT_FOUND'})
+                statement = json.loads(self._body() or b'{}').get('statement', '')
+                self._reply(200, server._run(statement))
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path.startswith('/api/2.0/sql/statements/'):
+                    sid = path.rsplit('/', 1)[1]
+                    return self._reply(200, {'statement_id': sid, 'status': {'state': 'SUCCEEDED'}})
+                if path.startswith('/api/2.0/clusters/list'):
+                    return self._reply(200, {'clusters': []})
+                if path.startswith('/api/2.0/fs/files'):
+                    data = server.files.get(self._file_path())
+                    if data is None:
+                        return self._reply(404, {'error_code': 'NOT_FOUND'})
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    return self.wfile.write(data)
+                self._reply(404, {'error_code': 'NOT_FOUND'})
+
+            def do_PUT(self):
+                if not self.path.startswith('/api/2.0/fs/files'):
+                    return self._reply(404, {'error_code': 'NOT_FOUND'})
+                path = self._file_path()
+                overwrite = parse_qs(urlparse(self.path).query).get('overwrite', ['false'])[0] == 'true'
+                data = self._body()
+                with server._lock:
+                    if path in server.files and not overwrite:
+                        return self._reply(409, {'error_code': 'ALREADY_EXISTS'})
+                    server.files[path] = data
+                self._reply(204)
+
+            def do_DELETE(self):
+                with server._lock:
+                    found = server.files.pop(self._file_path(), None) is not None
+                self._reply(204 if found else 404)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _rows_from(self, name, data):
+        if name.endswith('.parquet'):
+            return pq.read_table(io.BytesIO(data)).to_pylist()
+        if name.endswith('.gz'):
+            data = gzip.decompress(data)
+        return [json.loads(line) for line in data.decode('utf-8').splitlines() if line.strip()]
+
+    def _run(self, statement):
+        sid = uuid.uuid4().hex
+        with self._lock:
+            self.statements.append(statement)
+            sql = ' '.join(statement.split())
+            m = re.match(r'CREATE TABLE IF NOT EXISTS (\S+)', sql, re.I)
+            if m:
+                self.tables.setdefault(m.group(1), [])
+            m = re.match(r"COPY INTO (\S+) FROM .*?'([^']+)'\s*\)?.*?FILES = \(([^)]*)\)", sql, re.I)
+            if m:
+                table, directory = m.group(1), m.group(2).rstrip('/')
+                if table not in self.tables:
+                    return {'statement_id': sid, 'status': {
+                        'state': 'FAILED', 'error': {'message': f'[TABLE_OR_VIEW_NOT_FOUND] {table}'}}}
+                loaded = self._loaded.setdefault(table, set())
+                count = 0
+                for name in re.findall(r"'([^']+)'", m.group(3)):
+                    path = f"{directory}/{name}"
+                    if path in loaded or path not in self.files:
+                        continue
+                    rows = self._rows_from(name, self.files[path])
+                    self.tables[table].extend(rows)
+                    loaded.add(path)
+                    count += len(rows)
+                return {'statement_id': sid, 'status': {'state': 'SUCCEEDED'},
+                        'result': {'data_array': [[count]]}}
+        return {'statement_id': sid, 'status': {'state': 'SUCCEEDED'}, 'result': {}}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class ConnectProxy:
+    """Local HTTP proxy that answers CONNECT by tunnelling to `upstream`.
+
+    Every tunnel goes to `upstream` (host, port) whatever was asked for, so
+    tests can name hosts that do not resolve. Each request's header block is
+    kept in `requests`; `refuse` (e.g. "407 Proxy Authentication Required")
+    makes the proxy answer with that status instead.
+    """
+
+    def __init__(self, upstream, host="127.0.0.1", port=0, refuse=None):
+        self.upstream = upstream
+        self.refuse = refuse
+        self.requests: List[str] = []
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(8)
+        self.listener.settimeout(0.2)
+        self.port = self.listener.getsockname()[1]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _pipe(self, src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _handle(self, client):
+        head = b""
+        while b"\r\n\r\n" not in head:
+            data = client.recv(4096)
+            if not data:
+                client.close()
+                return
+            head += data
+        self.requests.append(head.split(b"\r\n\r\n", 1)[0].decode("latin-1"))
+        if self.refuse:
+            client.sendall(f"HTTP/1.1 {self.refuse}\r\nContent-Length: 0\r\n\r\n".encode())
+            client.close()
+            return
+        upstream = socket.create_connection(self.upstream, 2)
+        upstream.settimeout(None)
+        client.sendall(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        threading.Thread(target=self._pipe, args=(upstream, client), daemon=True).start()
+        self._pipe(client, upstream)
+        client.close()
+        upstream.close()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                client, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            client.settimeout(None)
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.listener.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LocalQuicResponder:
+    """In-process stand-in for the version-independent part of a QUIC server.
+
+    Answers long-header datagrams of at least MIN_DATAGRAM bytes that carry
+    a version outside `versions` with a Version Negotiation packet listing
+    `versions`, as a real server does. `silent=True` drops everything (a
+    firewall eating UDP), `drop_first` drops that many datagrams first (to
+    exercise retransmits) and `delay` adds latency. Every datagram received
+    is kept in `received`.
+    Usage: `with LocalQuicResponder() as srv: probe_many([(socket.AF_INET, '127.0.0.1', srv.port)])`.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, versions=(QUIC_V1, QUIC_V2), silent=False,
+                 drop_first=0, delay=0.0):
+        self.versions = list(versions)
+        self.silent = silent
+        self.drop_first = drop_first
+        self.delay = delay
+        self.received = []
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def _serve(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.sock], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except OSError:
+                continue
+            self.received.append(data)
+            if self.silent or len(self.received) <= self.drop_first or len(data) < MIN_DATAGRAM:
+                continue
+            packet = parse_reply(data)
+            if packet is None or packet["type"] != "long_header" or packet["version"] in self.versions:
+                continue
+            if self.delay:
+                time.sleep(self.delay)
+            self.sock.sendto(version_negotiation(bytes(packet["scid"]), bytes(packet["dcid"]), self.versions), addr)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubNTPServer:
+    """Local SNTP server answering as a synchronized stratum 2 server.
+
+    `drop_first` ignores that many requests first and `offset` (seconds)
+    skews the reported time. The arrival time (time.monotonic()) of every
+    request is kept in `arrivals`. Point ntp_probe at it by patching
+    ntp_probe.NTP_PORT to `port`.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, drop_first=0, offset=0.0):
+        self.drop_first = drop_first
+        self.offset = offset
+        self.arrivals = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def _serve(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.sock], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except OSError:
+                continue
+            self.arrivals.append(time.monotonic())
+            if len(self.arrivals) <= self.drop_first or len(data) < _PACKET.size:
+                continue
+            origin = _PACKET.unpack_from(data)[10]
+            now = to_ntp(time.time() + self.offset)
+            reply = _PACKET.pack(0x24, 2, 6, -20, 0x100, 0x80, socket.inet_aton("192.0.2.123"),
+                                 now, origin, now, now)
+            self.sock.sendto(reply, addr)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StunResponder:
+    """Local UDP port that answers every datagram, as a media server answers a STUN Binding request.
+
+    `silent=True` keeps the port bound but answers nothing. Every datagram
+    received is kept in `received`.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, silent=False):
+        self.silent = silent
+        self.received = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def _serve(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.sock], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except OSError:
+                continue
+            self.received.append(data)
+            if not self.silent:
+                # Binding success response with the request's transaction ID
+                self.sock.sendto(struct.pack("!HH", 0x0101, 0) + data[4:20], addr)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
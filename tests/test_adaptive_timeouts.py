@@ -0,0 +1,51 @@
+import socket
+import time
+
+import dns_cache
+import network_tests
+from adaptive_timeouts import AdaptiveTimeoutPolicy
+
+
+def test_dns_timeout_keeps_room_for_a_cold_lookup():
+    policy = AdaptiveTimeoutPolicy()
+    for _ in range(10):
+        policy.observe("dns", "lan.example", 3)
+    assert policy.timeout_for("dns", "slow.example") >= 2
+
+
+def test_slow_but_working_resolver_does_not_skip_downstream_probes(monkeypatch):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+    port = listener.getsockname()[1]
+
+    def lookup(name):
+        # Cached names come back instantly; the one cold name takes a recursive lookup's time
+        if name == "cold.example":
+            time.sleep(0.8)
+        return ["127.0.0.1"]
+
+    monkeypatch.setattr(dns_cache, "_system_lookup", lookup)
+    monkeypatch.setattr(dns_cache, "_default_cache", dns_cache.DNSCache())
+    monkeypatch.setattr(network_tests, "speedtest", lambda cancel=None: {"status": "SKIPPED"})
+
+    policy = AdaptiveTimeoutPolicy()
+    for _ in range(10):
+        policy.observe("dns", "warm.example", 3)
+    targets = {
+        "gateway": None,
+        "dns": ["warm.example", "cold.example"],
+        "tcp": [{"host": "cold.example", "port": port, "label": "Cold host"}],
+        "https": [],
+        "ping": [],
+        "ntp": "127.0.0.1",
+    }
+    try:
+        results = list(network_tests.StepRunner(targets, timeout_policy=policy).run())
+    finally:
+        listener.close()
+
+    dns = {r["target"]: r for c, r in results if c == "dns"}
+    tcp = [r for c, r in results if c == "tcp"]
+    assert dns["cold.example"]["status"] == "PASS"
+    assert [r["status"] for r in tcp] == ["PASS"]
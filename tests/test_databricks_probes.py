@@ -0,0 +1,64 @@
+from databricks_integration import DatabricksIntegration
+from databricks_probes import ProbeTableSink
+from tests.servers import LocalDatabricksServer
+
+
+def _run(run_id, ts):
+    return {
+        "_meta": {"run_id": run_id, "timestamp": ts, "device_name": "pi-1", "public_ip": "198.51.100.7"},
+        "dns": [{"target": "skydio.com", "status": "PASS", "ip": "192.0.2.1", "latency_ms": 12}],
+        "tcp": [{"target": "skydio.com:443", "status": "FAIL", "error": "timed out", "failure_mode": "timeout",
+                 "label": "Skydio Main HTTPS"}],
+        "ntp": {"target": "time.skydio.com", "status": "PASS", "offset_ms": 3.5},
+    }
+
+
+def _sink(srv):
+    client = DatabricksIntegration(srv.url, "token", "warehouse")
+    return ProbeTableSink(client, "network_tests", "probe_results", "/Volumes/main/network_tests/staging")
+
+
+def test_write_runs_loads_one_row_per_probe():
+    with LocalDatabricksServer() as srv:
+        result = _sink(srv).write_runs([_run("run-1", 1760000000), _run("run-2", 1760000300)], site_label="hq")
+        rows = srv.tables["network_tests.probe_results"]
+        files = dict(srv.files)
+
+    assert result["success"] and result["rows"] == 6 and result["runs"] == 2
+    assert sorted((r["run_id"], r["category"]) for r in rows) == [
+        ("run-1", "dns"), ("run-1", "ntp"), ("run-1", "tcp"),
+        ("run-2", "dns"), ("run-2", "ntp"), ("run-2", "tcp"),
+    ]
+    tcp = next(r for r in rows if r["category"] == "tcp")
+    assert (tcp["site"], tcp["status"], tcp["failure_mode"], tcp["label"]) == ("hq", "FAIL", "timeout", "Skydio Main HTTPS")
+    assert files == {}  # staged file removed once loaded
+
+
+def test_retried_batch_does_not_duplicate_rows():
+    with LocalDatabricksServer() as srv:
+        sink = _sink(srv)
+        runs = [_run("run-1", 1760000000)]
+        first = sink.write_runs(runs)
+        # The same batch again, as the outbox resends it when the acknowledgement was lost
+        again = sink.write_runs(runs)
+        rows = srv.tables["network_tests.probe_results"]
+        copies = [s for s in srv.statements if s.lstrip().startswith("COPY INTO")]
+
+    assert again["success"] and again["file"] == first["file"]
+    assert len(copies) == 2
+    assert len(rows) == 3
+
+
+def test_dropped_table_is_recreated_on_the_next_write():
+    with LocalDatabricksServer() as srv:
+        sink = _sink(srv)
+        assert sink.write_runs([_run("run-1", 1760000000)])["success"]
+        srv.tables.clear()  # dropped behind the client's back
+
+        failed = sink.write_runs([_run("run-2", 1760000300)])
+        retried = sink.write_runs([_run("run-2", 1760000300)])
+        rows = srv.tables["network_tests.probe_results"]
+
+    assert not failed["success"] and "TABLE_OR_VIEW_NOT_FOUND" in failed["error"]
+    assert retried["success"]
+    assert {r["run_id"] for r in rows} == {"run-2"}
@@ -0,0 +1,102 @@
+import socket
+
+import dns_cache
+import dns_client
+import network_tests
+from tests.servers import StubDNSServer
+
+RECORDS = {
+    "app.example": {"A": ["192.0.2.10", "192.0.2.11"], "AAAA": ["2001:db8::10"], "ttl": 120},
+    "www.example": {"CNAME": "app.example", "A": ["192.0.2.10"], "ttl": 30},
+    "broken.example": {"rcode": 2},
+}
+
+
+def test_query_many_answers_records_in_input_order():
+    with StubDNSServer(RECORDS) as srv:
+        results = dns_client.query_many([
+            (srv.address, "app.example", "A"),
+            (srv.address, "app.example", "AAAA"),
+            (srv.address, "www.example", "A"),
+        ], timeout=2)
+
+    assert [r["target"] for r in results] == ["app.example", "app.example", "www.example"]
+    assert results[0]["status"] == "PASS"
+    assert results[0]["addresses"] == ["192.0.2.10", "192.0.2.11"]
+    assert results[0]["ttl"] == 120
+    assert results[1]["addresses"] == ["2001:db8::10"]
+    assert results[2]["cnames"] == ["app.example"]
+    assert results[2]["ttl"] == 30
+
+
+def test_query_many_reports_rcodes_and_timeouts():
+    silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    silent.bind(("127.0.0.1", 0))
+    try:
+        with StubDNSServer(RECORDS) as srv:
+            missing, broken, lost = dns_client.query_many([
+                (srv.address, "missing.example", "A"),
+                (srv.address, "broken.example", "A"),
+                ("127.0.0.1:%d" % silent.getsockname()[1], "app.example", "A"),
+            ], timeout=0.5)
+    finally:
+        silent.close()
+
+    assert (missing["status"], missing["rcode"]) == ("FAIL", "NXDOMAIN")
+    assert (broken["status"], broken["rcode"]) == ("FAIL", "SERVFAIL")
+    assert (lost["status"], lost["failure_mode"]) == ("FAIL", "timeout")
+
+
+def test_compare_resolvers_agreeing_servers_fill_the_cache():
+    cache = dns_cache.DNSCache()
+    with StubDNSServer(RECORDS) as a, StubDNSServer(RECORDS) as b:
+        r = dns_client.compare_resolvers(["app.example", "www.example"], [a.address, b.address],
+                                         timeout=2, cache=cache)
+
+    assert r["status"] == "PASS"
+    assert r["inconsistent"] == []
+    assert [s["answered"] for s in r["servers"]] == [2, 2]
+    assert cache.get("app.example")["addrs"] == ["192.0.2.10", "192.0.2.11"]
+    assert cache.get("app.example")["source"] == "wire"
+
+
+def test_compare_resolvers_flags_a_filtering_resolver():
+    filtered = dict(RECORDS)
+    del filtered["www.example"]
+    with StubDNSServer(RECORDS) as a, StubDNSServer(filtered) as b:
+        servers = [a.address, b.address]
+        r = dns_client.compare_resolvers(["app.example", "www.example"], servers, timeout=2)
+
+    assert r["status"] == "WARN"
+    assert r["inconsistent"] == [{"name": "www.example",
+                                  "outcomes": {servers[0]: "NOERROR", servers[1]: "NXDOMAIN"}}]
+
+
+SPLIT_HORIZON = {"app.example": {"A": ["10.0.0.5"], "ttl": 60}}
+
+
+def test_compare_resolvers_fills_the_cache_from_the_system_resolver():
+    cache = dns_cache.DNSCache()
+    with StubDNSServer(RECORDS) as public, StubDNSServer(SPLIT_HORIZON) as site:
+        dns_client.compare_resolvers(["app.example"], [public.address, site.address], timeout=2,
+                                     cache=cache, cache_from=site.address)
+
+    assert cache.get("app.example")["addrs"] == ["10.0.0.5"]
+
+
+def test_public_resolvers_do_not_replace_split_horizon_answers(monkeypatch):
+    cache = dns_cache.DNSCache()
+    stored = []
+    put = cache.put
+    monkeypatch.setattr(cache, "put", lambda name, addrs, **kw: (stored.append((name, addrs)), put(name, addrs, **kw)))
+    monkeypatch.setattr(dns_cache, "_default_cache", cache)
+    monkeypatch.setattr(dns_cache, "_system_lookup", lambda name: ["10.0.0.5"])
+    monkeypatch.setattr(network_tests, "speedtest", lambda cancel=None: {"status": "SKIPPED"})
+    with StubDNSServer(RECORDS) as public:
+        # No system resolver known (empty network snapshot): only public ones are compared
+        targets = {"gateway": None, "dns": ["app.example"], "dns_resolvers": [public.address],
+                   "tcp": [], "https": [], "ping": [], "ntp": "127.0.0.1"}
+        results = list(network_tests.StepRunner(targets, timeout_policy=False).run())
+
+    assert [r["status"] for c, r in results if c == "dns_resolvers"] == ["PASS"]
+    assert stored == [("app.example", ["10.0.0.5"])]
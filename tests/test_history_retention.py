@@ -0,0 +1,82 @@
+import json
+import os
+
+from history_retention import DAY, HistoryRetention
+from history_store import HistoryStore
+
+NOW = 1760000000
+
+
+def _summarize(results):
+    return {"total_tests": 1, "passed": 1, "failed": 0, "warnings": 0}
+
+
+def _legacy(history_dir, ts, padding=0):
+    results = {"tcp": [{"target": "skydio.com:443", "status": "PASS", "latency_ms": 12}],
+               "_padding": "x" * padding}
+    path = os.path.join(history_dir, f"test_{ts}.json")
+    with open(path, "w") as f:
+        json.dump({"timestamp": ts, "results": results}, f)
+    return path
+
+
+def _retention(tmp_path, ages_days, padding=0, migrate=True, **settings):
+    history_dir = str(tmp_path / "test_history")
+    os.makedirs(history_dir)
+    for age in ages_days:
+        _legacy(history_dir, NOW - int(age * DAY), padding)
+    store = HistoryStore(str(tmp_path / "history.db"))
+    if migrate:
+        store.migrate_json(history_dir, _summarize)
+    config = {"history_retention": dict(settings)}
+    return store, history_dir, HistoryRetention(store, history_dir, lambda: config)
+
+
+def test_tiers_prune_runs_then_hourly_rollups(tmp_path):
+    store, history_dir, retention = _retention(tmp_path, [100, 10, 1])
+    assert store.counts()["hour_rollups"] == 2  # the newest hour is still pending
+
+    report = retention.run_once(now=NOW)
+
+    assert (report["runs"], report["legacy_files"], report["hourly_rollups"]) == (2, 2, 1)
+    assert report["quota"] == {"runs": 0, "hourly_rollups": 0, "daily_rollups": 0, "legacy_files": 0}
+    assert os.listdir(history_dir) == [f"test_{NOW - DAY}.json"]
+    counts = store.counts()
+    assert (counts["runs"], counts["hour_rollups"], counts["day_rollups"]) == (1, 1, 2)
+    # Pruned runs still show up in the daily trend
+    (series,) = store.trends(target="skydio.com:443", bucket="day")
+    assert len(series["points"]) == 3
+
+
+def test_unmigrated_json_files_are_never_removed(tmp_path):
+    store, history_dir, retention = _retention(tmp_path, [10], migrate=False, max_disk_mb=0.001)
+
+    report = retention.run_once(now=NOW)
+
+    assert report["legacy_files"] == 0 and report["quota"]["legacy_files"] == 0
+    assert os.listdir(history_dir) == [f"test_{NOW - 10 * DAY}.json"]
+
+
+def test_quota_drops_redundant_json_before_any_runs(tmp_path):
+    store, history_dir, retention = _retention(tmp_path, [3, 2], padding=200 * 1024)
+    usage = retention.usage()
+    # Room for the database and one of the two legacy files
+    quota_mb = (usage["used_bytes"] + usage["legacy_bytes"] * 0.75) / (1024 * 1024)
+    retention.config_loader = lambda: {"history_retention": {"full_days": None, "max_disk_mb": quota_mb}}
+
+    report = retention.run_once(now=NOW)
+
+    assert report["quota"]["legacy_files"] == 1 and report["quota"]["runs"] == 0
+    assert os.listdir(history_dir) == [f"test_{NOW - 2 * DAY}.json"]
+    assert store.counts()["runs"] == 2
+
+
+def test_quota_falls_back_to_runs_then_rollups(tmp_path):
+    store, history_dir, retention = _retention(tmp_path, [3, 2, 1], max_disk_mb=0.001)
+
+    report = retention.run_once(now=NOW)
+
+    assert report["quota"]["legacy_files"] == 3 and report["quota"]["runs"] == 3
+    assert report["quota"]["hourly_rollups"] >= 1 and report["quota"]["daily_rollups"] >= 1
+    counts = store.counts()
+    assert (counts["runs"], counts["hour_rollups"], counts["day_rollups"]) == (0, 0, 0)
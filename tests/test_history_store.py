@@ -0,0 +1,99 @@
+from history_store import HistoryStore
+
+T0 = 1760000000
+
+
+def _run(*targets, status="PASS"):
+    return {"_meta": {"device_name": "pi-1", "site_label": "hq"},
+            "tcp": [{"target": t, "label": label, "status": status, "latency_ms": 12} for t, label in targets]}
+
+
+def _save(store, ts, *targets, status="PASS"):
+    failed = 1 if status == "FAIL" else 0
+    return store.save_run(_run(*targets, status=status),
+                          {"total_tests": len(targets), "passed": len(targets) - failed, "failed": failed,
+                           "warnings": 0}, timestamp=ts)
+
+
+def _timestamps(entries):
+    return [e["timestamp"] for e in entries]
+
+
+def test_target_filter_matches_names_and_labels(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    _save(store, T0, ("skydio.com:443", "Skydio Main HTTPS"))
+    _save(store, T0 + 3600, ("media.example.net:443", None))
+    store.flush_rollups()
+    # Saved after the flush: its rollups are still buffered in memory
+    _save(store, T0 + 7200, ("api.skydio.com:443", "Cloud API"))
+
+    def matching(text):
+        return _timestamps(store.query_runs(target=text)[0])
+
+    assert matching("skydio") == [T0 + 7200, T0]
+    assert matching("MAIN https") == [T0]
+    assert matching("cloud") == [T0 + 7200]
+    assert matching("nowhere") == []
+    assert store.stats(target="media")["runs"] == 1
+
+
+def test_keyset_paging_is_stable_across_a_new_insert(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    for i in range(5):
+        _save(store, T0 + i * 60, ("skydio.com:443", None), status="FAIL" if i % 2 else "PASS")
+
+    page, cursor = store.query_runs(limit=2)
+    assert _timestamps(page) == [T0 + 240, T0 + 180]
+
+    _save(store, T0 + 600, ("skydio.com:443", None))  # a run lands between page requests
+    seen = _timestamps(page)
+    while cursor is not None:
+        page, cursor = store.query_runs(limit=2, cursor=cursor)
+        seen += _timestamps(page)
+
+    assert seen == [T0 + 240, T0 + 180, T0 + 120, T0 + 60, T0]
+    assert _timestamps(store.query_runs(status="FAIL")[0]) == [T0 + 180, T0 + 60]
+    assert store.query_runs(limit=10)[0][0]["timestamp"] == T0 + 600
+
+
+def test_same_second_runs_get_the_next_free_second(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    first = _save(store, T0, ("skydio.com:443", None))
+    second = _save(store, T0, ("skydio.com:443", None))
+
+    assert (first["timestamp"], second["timestamp"]) == (T0, T0 + 1)
+
+
+def test_rollups_survive_a_restart_before_they_are_flushed(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = HistoryStore(path)
+    _save(store, T0, ("skydio.com:443", "Main"))
+    _save(store, T0 + 3600, ("skydio.com:443", "Main"), status="FAIL")  # next hour: the first is flushed
+    _save(store, T0 + 3660, ("skydio.com:443", "Main"))
+
+    def hourly(s):
+        (series,) = s.trends(target="Main", bucket="hour")
+        return [(p["count"], p["passed"], p["failed"]) for p in series["points"]]
+
+    assert hourly(store) == [(1, 1, 0), (2, 1, 1)]
+    # The second hour exists only in memory until a later hour flushes it
+    assert hourly(HistoryStore(path)) == [(1, 1, 0), (2, 1, 1)]
+
+
+def test_json_history_is_migrated_once(tmp_path):
+    legacy = tmp_path / "test_history"
+    legacy.mkdir()
+    for ts in (T0, T0 + 60):
+        (legacy / f"test_{ts}.json").write_text(
+            '{"timestamp": %d, "results": {"tcp": [{"target": "skydio.com:443", "status": "PASS"}]}}' % ts)
+    (legacy / "test_broken.json").write_text("{not json")
+    store = HistoryStore(str(tmp_path / "history.db"))
+
+    def summarize(results):
+        return {"total_tests": 1, "passed": 1, "failed": 0, "warnings": 0}
+
+    assert store.migrate_json(str(legacy), summarize) == 2
+    assert store.migrate_json(str(legacy), summarize) == 0
+    assert store.json_migrated
+    assert store.get_run(T0 + 60)["results"]["tcp"][0]["target"] == "skydio.com:443"
+    assert store.counts()["probes"] == 2
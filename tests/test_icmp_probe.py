@@ -0,0 +1,33 @@
+import socket
+
+import pytest
+
+import icmp_probe
+import network_tests
+
+
+def _require_icmp():
+    try:
+        icmp_probe.open_socket(socket.AF_INET)[0].close()
+    except OSError as e:
+        pytest.skip(f"no ICMP socket: {e}")
+
+
+def test_ping_many_measures_loopback():
+    _require_icmp()
+    r = network_tests.ping_many(["127.0.0.1"], count=3, interval=0.05, timeout=1)[0]
+
+    assert (r["status"], r["sent"], r["received"]) == ("PASS", 3, 3)
+    assert len(r["samples"]) == 3 and r["rtt"]["min"] >= 0
+    assert "partial" not in r
+
+
+def test_deadline_keeps_the_echoes_already_answered():
+    _require_icmp()
+    cancel = network_tests.CancelToken(deadline=0.5)
+    r = network_tests.ping_many(["127.0.0.1"], count=20, interval=0.2, timeout=1, cancel=cancel)[0]
+
+    assert r["partial"] and r["cancelled"] == "deadline"
+    assert 1 <= r["received"] == r["sent"] < 20
+    assert r["status"] == "PASS" and r["loss_pct"] == 0
+    assert r["note"] == "Stopped early: job deadline reached"
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from job_manager import JobManager
+
+
+def _wait_done(jobs, jid, timeout=5):
+    """Wait for `jid` to finish without reading it (get() counts as a read for eviction)."""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        _, finished = jobs.events_since(jid, last_id=10 ** 6, timeout=0.2)
+        if finished:
+            return
+    raise AssertionError(f"{jid} did not finish")
+
+
+def _run(jobs):
+    jid, _ = jobs.start()
+    _wait_done(jobs, jid)
+    return jid
+
+
+def test_concurrent_starts_coalesce_into_one_run():
+    release = threading.Event()
+    ran = []
+
+    def runner(jid):
+        ran.append(jid)
+        release.wait(5)
+
+    jobs = JobManager(runner)
+    barrier = threading.Barrier(2)
+    admitted = []
+
+    def start():
+        barrier.wait()
+        admitted.append(jobs.start())
+
+    threads = [threading.Thread(target=start) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    release.set()
+
+    (first, _), (second, _) = admitted
+    assert first == second
+    assert sorted(attached for _, attached in admitted) == [False, True]
+    _wait_done(jobs, first)
+    assert jobs.get(first)["attached"] == 1
+    assert ran == [first]
+
+
+def test_start_without_coalescing_queues_behind_the_running_job():
+    release = threading.Event()
+    ran = []
+
+    def runner(jid):
+        ran.append(jid)
+        release.wait(5)
+
+    jobs = JobManager(runner)
+    first, _ = jobs.start()
+    second, attached = jobs.start(coalesce=False)
+    assert not attached and second != first
+    assert jobs.get(second)["state"] == "queued"
+
+    release.set()
+    _wait_done(jobs, second)
+    assert ran == [first, second]
+
+
+def test_finished_jobs_are_evicted_least_recently_read_first():
+    jobs = JobManager(lambda jid: None, max_finished=2)
+    first, second, third = _run(jobs), _run(jobs), _run(jobs)
+    assert jobs.get(first) is None  # three finished, room for two
+
+    assert jobs.get(second) is not None  # reading a job keeps it around
+    fourth = _run(jobs)
+
+    assert jobs.get(third) is None
+    assert jobs.get(second) is not None and jobs.get(fourth) is not None
+
+
+def test_finished_jobs_expire_after_max_age():
+    jobs = JobManager(lambda jid: None, max_age=60)
+    old = _run(jobs)
+    jobs.update(old, finished=time.time() - 61)
+
+    new = _run(jobs)
+    assert jobs.get(old) is None
+    assert jobs.get(new)["state"] == "done"
+
+
+def test_deadline_counts_from_when_the_job_starts_running():
+    release = threading.Event()
+    seen = {}
+
+    def runner(jid):
+        if not seen:
+            seen["first"] = jid
+            release.wait(5)
+            return
+        cancel = jobs.get(jid)["cancel"]
+        seen["at_start"] = cancel.cancelled
+        cancel.wait(2)
+        seen["reason"] = cancel.reason
+
+    jobs = JobManager(runner)
+    jobs.start()
+    queued, _ = jobs.start(coalesce=False, deadline_seconds=0.3)
+    time.sleep(0.5)  # longer than the deadline, spent waiting in the queue
+    release.set()
+    _wait_done(jobs, queued)
+
+    assert seen["at_start"] is False
+    assert seen["reason"] == "deadline"
@@ -0,0 +1,66 @@
+import socket
+import time
+
+import network_tests
+import ntp_probe
+from tests.servers import StubNTPServer
+
+
+def _gaps(arrivals):
+    return [b - a for a, b in zip(arrivals, arrivals[1:])]
+
+
+def test_short_timeout_keeps_the_request_spacing(monkeypatch):
+    with StubNTPServer(offset=0.25) as srv:
+        monkeypatch.setattr(ntp_probe, "NTP_PORT", srv.port)
+        outcome = ntp_probe.query_many([(socket.AF_INET, "127.0.0.1")], timeout=0.5)[0]
+        arrivals = list(srv.arrivals)
+
+    assert outcome["received"] == outcome["sent"] == ntp_probe.DEFAULT_SAMPLES
+    assert abs(outcome["offset_ms"] - 250) < 50
+    assert min(_gaps(arrivals)) >= ntp_probe.DEFAULT_SPACING - 0.05
+
+
+def test_lost_request_expires_after_the_timeout(monkeypatch):
+    with StubNTPServer(drop_first=1) as srv:
+        monkeypatch.setattr(ntp_probe, "NTP_PORT", srv.port)
+        start = time.monotonic()
+        outcome = ntp_probe.query_many([(socket.AF_INET, "127.0.0.1")], timeout=0.3)[0]
+        elapsed = time.monotonic() - start
+
+    assert outcome["samples"][0] is None
+    assert (outcome["sent"], outcome["received"]) == (4, 3)
+    # Done once the last request is answered, not when a timeout-long window would close
+    assert elapsed < ntp_probe.DEFAULT_WINDOW
+
+
+def test_ntp_check_sampling_window_ignores_the_probe_timeout(monkeypatch):
+    with StubNTPServer() as srv:
+        monkeypatch.setattr(ntp_probe, "NTP_PORT", srv.port)
+        r = network_tests.ntp_check("127.0.0.1", timeout=0.5)
+        arrivals = list(srv.arrivals)
+
+    assert r["status"] == "PASS"
+    assert r["servers"][0]["received"] == ntp_probe.DEFAULT_SAMPLES
+    assert min(_gaps(arrivals)) >= ntp_probe.DEFAULT_SPACING - 0.05
+
+
+def test_deadline_keeps_the_samples_already_collected(monkeypatch):
+    with StubNTPServer() as srv:
+        monkeypatch.setattr(ntp_probe, "NTP_PORT", srv.port)
+        r = network_tests.ntp_check("127.0.0.1", timeout=1, cancel=network_tests.CancelToken(deadline=0.8))
+
+    assert r["partial"] and r["cancelled"] == "deadline"
+    assert r["status"] == "PASS" and "offset_ms" in r
+    assert 1 <= r["servers"][0]["received"] == r["servers"][0]["sent"] < ntp_probe.DEFAULT_SAMPLES
+    assert r["note"] == "Stopped early: job deadline reached"
+
+
+def test_probe_stopped_before_sending_is_not_run(monkeypatch):
+    cancel = network_tests.CancelToken()
+    cancel.cancel()
+    with StubNTPServer() as srv:
+        monkeypatch.setattr(ntp_probe, "NTP_PORT", srv.port)
+        r = network_tests.ntp_check("127.0.0.1", cancel=cancel)
+
+    assert r["status"] == "SKIPPED" and r["note"] == "Not run: job was cancelled"
@@ -0,0 +1,120 @@
+from concurrent.futures import Future
+
+import outbox
+
+
+class FakeWarehouse:
+    """Databricks client stand-in: INSERTs run until finish() is called."""
+
+    def __init__(self):
+        self.submitted = []
+        self.tracked = []
+        self.outcomes = {}
+
+    def __call__(self, config):
+        return self
+
+    def create_table_if_not_exists(self, database, table):
+        return {'success': True, 'cached': True}
+
+    def _future(self, statement_id):
+        future = Future()
+        future.statement_id = statement_id
+        if statement_id in self.outcomes:
+            future.set_result(self.outcomes[statement_id])
+        return future
+
+    def submit_test_results_batch(self, database, table, results_list):
+        statement_id = f"stmt-{len(self.submitted) + 1}"
+        self.submitted.append((statement_id, list(results_list)))
+        return self._future(statement_id)
+
+    def track_statement(self, statement_id):
+        self.tracked.append(statement_id)
+        return self._future(statement_id)
+
+    def await_statement(self, future, timeout=None):
+        if future.done():
+            return future.result()
+        return {'success': False, 'pending': True, 'statement_id': future.statement_id,
+                'error': 'Statement still running'}
+
+    def finish(self, statement_id, state):
+        self.outcomes[statement_id] = {'success': state == 'SUCCEEDED', 'statement_id': statement_id,
+                                       'state': state, 'error': None if state == 'SUCCEEDED' else state}
+
+    def forget_table(self, database, table):
+        pass
+
+
+def _outbox(path, warehouse, monkeypatch):
+    monkeypatch.setattr(outbox, 'create_databricks_client', warehouse)
+    monkeypatch.setattr(outbox.Outbox, 'start', lambda self: None)  # drained by hand
+    return outbox.Outbox(str(path), sinks={'databricks': outbox.DEFAULT_SINKS['databricks']},
+                         config_loader=lambda: {'databricks': {'batch_size': 10}})
+
+
+def _make_due(box):
+    for item in box._items.values():
+        item['next_at'] = 0
+    box._sink_state.clear()
+
+
+def test_running_insert_is_waited_on_not_resubmitted(tmp_path, monkeypatch):
+    warehouse = FakeWarehouse()
+    box = _outbox(tmp_path / 'outbox.jsonl', warehouse, monkeypatch)
+    box.enqueue('databricks', {'run': 1})
+    box.enqueue('databricks', {'run': 2})
+
+    box.drain_once()
+    assert [sid for sid, _ in warehouse.submitted] == ['stmt-1']
+    assert box.stats()['depth'] == 2
+
+    _make_due(box)
+    box.drain_once()
+    assert len(warehouse.submitted) == 1
+    assert warehouse.tracked == ['stmt-1']
+
+    warehouse.finish('stmt-1', 'SUCCEEDED')
+    _make_due(box)
+    box.drain_once()
+    assert len(warehouse.submitted) == 1
+    assert box.stats()['depth'] == 0
+    assert box.stats()['delivered'] == 2
+
+
+def test_restart_resumes_the_submitted_statement(tmp_path, monkeypatch):
+    path = tmp_path / 'outbox.jsonl'
+    warehouse = FakeWarehouse()
+    box = _outbox(path, warehouse, monkeypatch)
+    box.enqueue('databricks', {'run': 1})
+    box.drain_once()
+    box.enqueue('databricks', {'run': 2})
+
+    # A new process reads the journal while stmt-1 is still running
+    restarted = _outbox(path, warehouse, monkeypatch)
+    _make_due(restarted)
+    warehouse.finish('stmt-1', 'SUCCEEDED')
+    restarted.drain_once()
+    assert [sid for sid, _ in warehouse.submitted] == ['stmt-1']
+    assert restarted.stats()['depth'] == 1
+
+    # The run queued after the submission goes out in a statement of its own
+    restarted.drain_once()
+    assert [rows for _, rows in warehouse.submitted] == [[{'run': 1}], [{'run': 2}]]
+
+
+def test_failed_insert_is_submitted_again(tmp_path, monkeypatch):
+    warehouse = FakeWarehouse()
+    box = _outbox(tmp_path / 'outbox.jsonl', warehouse, monkeypatch)
+    box.enqueue('databricks', {'run': 1})
+    box.drain_once()
+    warehouse.finish('stmt-1', 'FAILED')
+
+    _make_due(box)
+    box.drain_once()
+    assert box._items and next(iter(box._items.values()))['statement_id'] is None
+
+    _make_due(box)
+    box.drain_once()
+    assert [sid for sid, _ in warehouse.submitted] == ['stmt-1', 'stmt-2']
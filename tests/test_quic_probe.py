@@ -0,0 +1,66 @@
+import socket
+
+import network_tests
+import quic_probe
+import udp_errors
+from tests.servers import LocalQuicResponder
+
+
+def _addr(port):
+    return (socket.AF_INET, "127.0.0.1", port)
+
+
+def _closed_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def test_probe_many_reads_version_negotiation():
+    with LocalQuicResponder(versions=(quic_probe.QUIC_V1,)) as v1, LocalQuicResponder() as both:
+        seen = []
+        outcomes = quic_probe.probe_many([_addr(v1.port), _addr(both.port)], timeout=2,
+                                         on_outcome=lambda i, o: seen.append(i))
+        received = list(v1.received)
+
+    assert sorted(seen) == [0, 1]
+    assert [o["reply"] for o in outcomes] == ["version_negotiation", "version_negotiation"]
+    assert outcomes[0]["versions"] == [quic_probe.QUIC_V1]
+    assert outcomes[1]["versions"] == [quic_probe.QUIC_V1, quic_probe.QUIC_V2]
+    assert all(o["valid"] and o["attempts"] == 1 for o in outcomes)
+    assert [len(d) for d in received] == [quic_probe.MIN_DATAGRAM]
+
+
+def test_lost_datagram_is_retransmitted_and_rtt_excludes_the_wait():
+    with LocalQuicResponder(drop_first=1) as srv:
+        outcome = quic_probe.probe_many([_addr(srv.port)], timeout=2)[0]
+
+    assert outcome["reply"] == "version_negotiation"
+    assert outcome["attempts"] == 2
+    # The retransmit goes out 0.5s in; the RTT is that of the answered datagram only
+    assert outcome["rtt_ms"] < 250
+
+
+def test_silent_and_refused_ports():
+    with LocalQuicResponder(silent=True) as silent:
+        timed_out, refused = quic_probe.probe_many([_addr(silent.port), _addr(_closed_port())], timeout=0.6)
+        received = len(silent.received)
+
+    assert timed_out["timed_out"] and timed_out["attempts"] == received == len(quic_probe.RETRANSMITS)
+    assert "icmp" in refused and refused["attempts"] == 1
+    assert udp_errors.classify(refused["icmp"])[0] == "refused"
+
+
+def test_quic_check_many_reports_versions_and_failures():
+    with LocalQuicResponder() as ok, LocalQuicResponder(versions=(0xff00001d,)) as draft:
+        results = network_tests.quic_check_many([
+            {"host": "127.0.0.1", "port": ok.port, "label": "HTTP/3"},
+            {"host": "127.0.0.1", "port": draft.port},
+            {"host": "127.0.0.1", "port": _closed_port()},
+        ], timeout=1)
+
+    assert (results[0]["status"], results[0]["versions"], results[0]["label"]) == ("PASS", ["v1", "v2"], "HTTP/3")
+    assert (results[1]["status"], results[1]["versions"]) == ("WARN", ["draft-29"])
+    assert (results[2]["status"], results[2]["failure_mode"]) == ("FAIL", "refused")
@@ -0,0 +1,64 @@
+import os
+
+from history_store import HistoryStore
+from run_archive import INDEX_FILE, RunArchive
+
+DAY = 86400
+T0 = 1760000000 - 1760000000 % DAY  # start of a UTC day
+
+
+def _record(ts):
+    return {"_meta": {"timestamp": ts}, "tcp": [{"target": "skydio.com:443", "status": "PASS"}]}
+
+
+def test_runs_read_back_after_reopening(tmp_path):
+    archive = RunArchive(str(tmp_path), codec="xz")
+    for i in range(3):
+        archive.append(T0 + i * 60, _record(T0 + i * 60))
+    archive = RunArchive(str(tmp_path), codec="gzip")  # codec change rolls a new segment
+    archive.append(T0 + 180, _record(T0 + 180))
+
+    assert [archive.get(T0 + i * 60)["_meta"]["timestamp"] for i in range(4)] == [T0, T0 + 60, T0 + 120, T0 + 180]
+    assert archive.get(T0 + 1) is None
+    assert sorted(os.listdir(tmp_path)) == [INDEX_FILE, "seg-000001.ndjson.xz", "seg-000002.ndjson.gz"]
+
+
+def test_torn_index_record_is_dropped_on_open(tmp_path):
+    archive = RunArchive(str(tmp_path))
+    archive.append(T0, _record(T0))
+    with open(os.path.join(str(tmp_path), INDEX_FILE), "ab") as f:
+        f.write(b"\x01\x02\x03")  # crash mid-append
+
+    archive = RunArchive(str(tmp_path))
+    archive.append(T0 + 60, _record(T0 + 60))
+    assert archive.get(T0)["_meta"]["timestamp"] == T0
+    assert archive.get(T0 + 60)["_meta"]["timestamp"] == T0 + 60
+    assert archive.stats()["runs"] == 2
+
+
+def test_prune_drops_only_whole_segments(tmp_path):
+    archive = RunArchive(str(tmp_path))
+    for day in range(3):
+        archive.append(T0 + day * DAY, _record(T0 + day * DAY))
+        archive.append(T0 + day * DAY + 60, _record(T0 + day * DAY + 60))
+
+    # Day 1's segment still holds a run newer than the cutoff
+    assert archive.prune(T0 + DAY + 30) == 1
+    assert archive.get(T0) is None
+    assert archive.get(T0 + DAY)["_meta"]["timestamp"] == T0 + DAY
+    assert archive.stats()["segments"] == 2
+    assert archive.prune(T0 + DAY + 30) == 0
+
+
+def test_history_store_prunes_the_archive_with_its_runs(tmp_path):
+    archive = RunArchive(str(tmp_path / "archive"))
+    store = HistoryStore(str(tmp_path / "history.db"), archive=archive)
+    summary = {"total_tests": 1, "passed": 1, "failed": 0, "warnings": 0}
+    for day in range(2):
+        store.save_run(_record(T0 + day * DAY), summary, timestamp=T0 + day * DAY)
+
+    assert store.get_run(T0)["results"]["tcp"][0]["target"] == "skydio.com:443"
+    assert store.prune_runs(oldest=1) == 1
+    assert archive.stats()["segments"] == 1
+    assert archive.get(T0) is None
+    assert store.get_run(T0 + DAY)["results"]["_meta"]["timestamp"] == T0 + DAY
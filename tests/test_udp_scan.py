@@ -0,0 +1,78 @@
+import random
+import socket
+
+import pytest
+
+import network_tests
+import udp_scan
+from network_tests import CancelToken
+from tests.servers import StunResponder
+
+
+def _closed_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _scan(ports, **kwargs):
+    jobs = [(socket.AF_INET, "127.0.0.1", p, p, 1) for p in ports]
+    kwargs.setdefault("budget", 1.5)
+    kwargs.setdefault("probe_timeout", 0.5)
+    return udp_scan.scan_many(jobs, **kwargs)
+
+
+def test_sample_ports_spread_across_the_range():
+    ports = list(udp_scan.sample_ports(40000, 40999, 10, rng=random.Random(7)))
+
+    assert len(set(ports)) == 10
+    # One port from each tenth of the range
+    assert sorted((p - 40000) // 100 for p in ports) == list(range(10))
+    assert sorted(udp_scan.sample_ports(5, 7, 64)) == [5, 6, 7]
+
+
+def test_reply_refused_and_silent_ports_are_told_apart():
+    with StunResponder() as open_srv, StunResponder(silent=True) as silent_srv:
+        ports = open_srv.port, _closed_port(), silent_srv.port
+        reply, refused, silent = _scan(ports)
+
+    assert reply["ports"] == {ports[0]: "reply"} and ports[0] in reply["rtts"]
+    assert silent["ports"] == {ports[2]: "silent"} and silent["rtts"] == {}
+    if not refused["recverr"]:
+        pytest.skip("ICMP errors cannot be observed on this platform")
+    assert refused["ports"] == {ports[1]: "refused"}
+    assert refused["errors"][ports[1]]
+
+
+def test_jobs_probing_the_same_port_share_one_datagram():
+    with StunResponder() as srv:
+        port = srv.port
+        # Fast enough that the second probe is due before the first is answered
+        outcomes = _scan([port, port], rate=1000000)
+
+    assert len(srv.received) == 1
+    assert [o["ports"] for o in outcomes] == [{port: "reply"}, {port: "reply"}]
+
+
+def test_cancelled_scan_reports_every_job():
+    cancel = CancelToken()
+    cancel.cancel()
+    seen = []
+    with StunResponder(silent=True) as srv:
+        outcomes = _scan([srv.port, srv.port + 1], cancel=cancel, on_outcome=lambda i, o: seen.append(i))
+
+    assert outcomes == [{"cancelled": True}, {"cancelled": True}]
+    assert sorted(seen) == [0, 1]
+    assert srv.received == []
+
+
+def test_range_check_passes_when_a_sampled_port_answers():
+    with StunResponder() as srv:
+        port = srv.port
+        result = network_tests.udp_range_check_many(
+            [{"host": "127.0.0.1", "port_start": port, "port_end": port, "label": "Media"}], budget=1.5)[0]
+
+    assert (result["status"], result["replied"], result["label"]) == ("PASS", 1, "Media")
+    assert result["target"] == f"127.0.0.1:{port}-{port}"
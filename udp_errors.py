@@ -0,0 +1,122 @@
+import errno
+import os
+import socket
+import struct
+
+# Linux <linux/in.h>, <linux/in6.h>, <linux/errqueue.h>; not every Python exports them
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11)
+IPV6_RECVERR = getattr(socket, "IPV6_RECVERR", 25)
+MSG_ERRQUEUE = getattr(socket, "MSG_ERRQUEUE", 0x2000)
+
+# struct sock_extended_err: ee_errno, ee_origin, ee_type, ee_code, ee_pad, ee_info, ee_data,
+# followed by the sockaddr of the node that sent the ICMP error
+_EXTENDED_ERR = struct.Struct("=IBBBBII")
+_ORIGINS = {1: "local", 2: "icmp", 3: "icmp6"}
+
+HINTS = {
+    "refused": "ICMP port unreachable: the host is reachable but nothing is listening on that UDP port.",
+    "filtered": "ICMP administratively prohibited: a firewall or ACL is actively rejecting this UDP traffic.",
+    "unreachable": "No route / host unreachable for this UDP traffic. Check default gateway, VLAN routing, or upstream ACLs.",
+    "local": "The local network stack refused to send the datagram (local firewall, interface down or MTU).",
+}
+
+
+def enable(sock):
+    """Have the kernel queue ICMP errors for an unconnected UDP socket.
+
+    Without this, Linux only reports ICMP errors on connected sockets, so
+    one socket talking to many peers would see every rejection as a
+    timeout. Returns False where unsupported (non-Linux).
+    """
+    try:
+        if sock.family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, IPV6_RECVERR, 1)
+        else:
+            sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _offender(raw):
+    try:
+        family = struct.unpack_from("=H", raw)[0]
+        if family == socket.AF_INET:
+            return socket.inet_ntop(socket.AF_INET, raw[4:8])
+        if family == socket.AF_INET6:
+            return socket.inet_ntop(socket.AF_INET6, raw[8:24])
+    except (struct.error, ValueError, OSError):
+        pass
+    return None
+
+
+def drain(sock):
+    """Pop every queued error from a non-blocking socket.
+
+    Returns [(destination (ip, port), error dict, payload)] where the
+    destination and (leading bytes of the) payload are those of the
+    datagram that triggered the error. Reading the queue also
+    clears the socket's pending error, so the next recvfrom() does not
+    raise it a second time.
+    """
+    errors = []
+    if not hasattr(sock, "recvmsg"):
+        return errors
+    while True:
+        try:
+            payload, ancdata, _, addr = sock.recvmsg(64, 512, MSG_ERRQUEUE)
+        except (BlockingIOError, InterruptedError):
+            break
+        except OSError:
+            break
+        for level, kind, data in ancdata:
+            if (level, kind) not in ((socket.IPPROTO_IP, IP_RECVERR), (socket.IPPROTO_IPV6, IPV6_RECVERR)):
+                continue
+            if len(data) < _EXTENDED_ERR.size:
+                continue
+            ee_errno, origin, icmp_type, icmp_code, _, _, _ = _EXTENDED_ERR.unpack_from(data)
+            err = {
+                "errno": ee_errno,
+                "error": os.strerror(ee_errno),
+                "origin": _ORIGINS.get(origin, str(origin)),
+                "offender": _offender(data[_EXTENDED_ERR.size:]),
+            }
+            if origin in (2, 3):
+                err["icmp_type"] = icmp_type
+                err["icmp_code"] = icmp_code
+            errors.append(((addr[0], addr[1]) if addr else None, err, payload))
+    return errors
+
+
+def from_exception(e):
+    """Error dict (as from drain()) for an OSError raised by sendto()/recvfrom()."""
+    return {"errno": getattr(e, "errno", None), "error": str(e), "origin": "socket", "offender": None}
+
+
+def classify(err):
+    """(failure_mode, hint) for an error dict from drain() or from_exception()."""
+    origin = err.get("origin")
+    icmp_type, icmp_code = err.get("icmp_type"), err.get("icmp_code")
+    if origin == "icmp" and icmp_type == 3:
+        if icmp_code == 3:
+            mode = "refused"
+        elif icmp_code in (9, 10, 13):
+            mode = "filtered"
+        else:
+            mode = "unreachable"
+    elif origin == "icmp6" and icmp_type == 1:
+        if icmp_code == 4:
+            mode = "refused"
+        elif icmp_code in (1, 5, 6):
+            mode = "filtered"
+        else:
+            mode = "unreachable"
+    elif origin == "local":
+        mode = "local"
+    elif err.get("errno") == errno.ECONNREFUSED:
+        mode = "refused"
+    elif err.get("errno") in (errno.EACCES, errno.EPERM):
+        mode = "filtered"
+    else:
+        mode = "unreachable"
+    return mode, HINTS[mode]
@@ -0,0 +1,203 @@
+import os
+import random
+import selectors
+import socket
+import struct
+import time
+
+import udp_errors
+
+DEFAULT_BUDGET = 3.0
+DEFAULT_RATE = 100
+DEFAULT_PROBE_TIMEOUT = 1.0
+DEFAULT_MAX_PORTS = 64
+
+STUN_MAGIC_COOKIE = 0x2112a442
+
+# Per-port states. "refused" (ICMP port unreachable) means the datagram got
+# through to the host; "filtered"/"unreachable" mean something on the path
+# rejected it; "silent" ports gave no answer either way.
+OPEN_STATES = ("reply", "refused")
+BLOCKED_STATES = ("filtered", "unreachable", "local")
+
+
+def stun_binding_request():
+    """STUN Binding request (RFC 8489): what an ICE agent sends first on a media port."""
+    return struct.pack("!HHI", 0x0001, 0, STUN_MAGIC_COOKIE) + os.urandom(12)
+
+
+def sample_ports(start, end, count, rng=random):
+    """Lazily yield up to `count` distinct ports from start..end.
+
+    The range is cut into `count` equal strata and one random port is
+    taken from each, in random order, so however many are consumed they
+    spread across the whole range. Nothing proportional to the range
+    size is ever built.
+    """
+    size = end - start + 1
+    count = min(count, size)
+    strata = list(range(count))
+    rng.shuffle(strata)
+    for s in strata:
+        yield rng.randint(start + s * size // count, start + (s + 1) * size // count - 1)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def scan_many(jobs, budget=DEFAULT_BUDGET, rate=DEFAULT_RATE, probe_timeout=DEFAULT_PROBE_TIMEOUT,
+              on_outcome=None, cancel=None):
+    """Probe sampled ports of every (family, ip, port_start, port_end, max_ports) job.
+
+    All probes leave from one unconnected UDP socket per address family,
+    paced at `rate` datagrams per second round-robin across jobs, and no
+    probe is sent later than `probe_timeout` before the `budget` runs out,
+    so the whole scan finishes within `budget` seconds. With IP_RECVERR
+    (Linux) the kernel queues the ICMP error for each probe on the socket,
+    keyed by the probe's destination port, which tells refused ports apart
+    from rejected and silently dropped ones.
+
+    Outcomes (dicts, in input order, also passed to on_outcome(i, outcome)):
+      ports:     {port: state} for every probed port (see OPEN_STATES/BLOCKED_STATES)
+      rtts:      ms to the reply or ICMP error, for ports that answered
+      errors:    {port: error dict} for ICMP/local errors
+      recverr:   whether ICMP errors could be observed at all
+      cancelled: True
+    """
+    outcomes = [None] * len(jobs)
+    sockets = {}
+    recverr = {}
+    sel = selectors.DefaultSelector()
+    in_flight = {}
+    state = {}
+    start = time.monotonic()
+    send_until = start + max(budget - probe_timeout, 0)
+    interval = 1.0 / max(rate, 1)
+
+    def _socket(family):
+        s = sockets.get(family)
+        if s is None:
+            s = socket.socket(family, socket.SOCK_DGRAM)
+            s.setblocking(False)
+            recverr[family] = udp_errors.enable(s)
+            sel.register(s, selectors.EVENT_READ, family)
+            sockets[family] = s
+        return s
+
+    def _resolve(key, port_state, now, err=None):
+        for i in in_flight.pop(key, []):
+            st = state.get(i)
+            if st is None or st["ports"].get(key[2]) != "pending":
+                continue
+            st["ports"][key[2]] = port_state
+            st["rtts"][key[2]] = _ms(now - st["sent_at"][key[2]])
+            if err is not None:
+                st["errors"][key[2]] = err
+
+    def _finish(i):
+        st = state.pop(i)
+        outcome = {"ports": st["ports"], "rtts": st["rtts"], "errors": st["errors"],
+                   "recverr": recverr.get(jobs[i][0], False)}
+        outcomes[i] = outcome
+        if on_outcome:
+            on_outcome(i, outcome)
+
+    def _send(i):
+        family, ip = jobs[i][:2]
+        st = state[i]
+        port = next(st["ports_iter"], None)
+        if port is None:
+            st["exhausted"] = True
+            return
+        key = (family, st["ip_key"], port)
+        now = time.monotonic()
+        st["ports"][port] = "pending"
+        st["sent_at"][port] = now
+        if key in in_flight:
+            # Another job already has this exact probe on the wire; share its answer
+            in_flight[key].append(i)
+            return
+        try:
+            _socket(family).sendto(stun_binding_request(), (ip, port))
+        except OSError as e:
+            st["ports"][port] = "local"
+            st["errors"][port] = udp_errors.from_exception(e)
+            return
+        in_flight[key] = [i]
+
+    def _receive(family, s):
+        now = time.monotonic()
+        for dest, err, _ in udp_errors.drain(s):
+            if dest:
+                mode, _ = udp_errors.classify(err)
+                if mode == "refused" and err.get("offender") not in (None, dest[0]):
+                    # A firewall on the path rejecting with port-unreachable (e.g. iptables REJECT)
+                    mode = "filtered"
+                _resolve((family, socket.inet_pton(family, dest[0]), dest[1]), mode, now, err)
+        while True:
+            try:
+                _, src = s.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            _resolve((family, socket.inet_pton(family, src[0]), src[1]), "reply", now)
+
+    for i, (family, ip, port_start, port_end, max_ports) in enumerate(jobs):
+        state[i] = {"ip_key": socket.inet_pton(family, ip),
+                    "ports_iter": sample_ports(int(port_start), int(port_end), int(max_ports)),
+                    "ports": {}, "rtts": {}, "errors": {}, "sent_at": {}, "exhausted": False}
+
+    next_send = start
+    turn = 0
+    try:
+        while state:
+            if cancel is not None and cancel.cancelled:
+                for i in list(state):
+                    state.pop(i)
+                    outcomes[i] = {"cancelled": True}
+                    if on_outcome:
+                        on_outcome(i, outcomes[i])
+                break
+            now = time.monotonic()
+            if now >= send_until:
+                for st in state.values():
+                    st["exhausted"] = True
+            senders = [i for i in sorted(state) if not state[i]["exhausted"]]
+            # Pace from now after a stall instead of bursting to catch up
+            next_send = max(next_send, now - interval)
+            while senders and now >= next_send:
+                _send(senders[turn % len(senders)])
+                turn += 1
+                next_send += interval
+                senders = [i for i in sorted(state) if not state[i]["exhausted"]]
+            for i in list(state):
+                st = state[i]
+                for port, sent_at in st["sent_at"].items():
+                    if st["ports"][port] == "pending" and now >= sent_at + probe_timeout:
+                        st["ports"][port] = "silent"
+                if st["exhausted"] and "pending" not in st["ports"].values():
+                    _finish(i)
+            if not state:
+                break
+            wake = now + probe_timeout
+            if senders:
+                wake = min(wake, next_send)
+            for st in state.values():
+                for port, sent_at in st["sent_at"].items():
+                    if st["ports"][port] == "pending":
+                        wake = min(wake, sent_at + probe_timeout)
+            wait = max(wake - time.monotonic(), 0)
+            if cancel is not None:
+                wait = min(wait, 0.25)
+            for key, _ in sel.select(wait):
+                _receive(key.data, key.fileobj)
+    finally:
+        for s in sockets.values():
+            try:
+                s.close()
+            except OSError:
+                pass
+        sel.close()
+    return outcomes